@@ -3,23 +3,24 @@ Module Points → Géométrie (Polygone / Polyligne / Points)
 - Coller des coordonnées depuis n'importe quelle source
 - Choix du séparateur (espace, ;, tab, virgule, etc.)
 - Choix du système de coordonnées
-- Prévisualisation et export
+- Prévisualisation, contrôle qualité et export
 """
 
 import os
 import re
+import mmap
 import datetime
 from qgis.PyQt.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QGroupBox, QLabel,
     QComboBox, QCheckBox, QSpinBox, QLineEdit, QPushButton,
     QFileDialog, QMessageBox, QFormLayout, QFrame, QTextEdit,
-    QRadioButton, QButtonGroup, QTableWidget, QTableWidgetItem,
-    QHeaderView, QSplitter, QWidget
+    QRadioButton, QButtonGroup, QTableView, QDoubleSpinBox,
+    QHeaderView, QSplitter, QWidget, QProgressBar
 )
 from qgis.PyQt.QtGui import QFont, QColor
-from qgis.PyQt.QtCore import Qt
+from qgis.PyQt.QtCore import Qt, QAbstractTableModel, QModelIndex, pyqtSignal
 from qgis.core import (
-    QgsProject, QgsVectorLayer, QgsFeature, QgsGeometry,
+    QgsApplication, QgsTask, QgsProject, QgsVectorLayer, QgsFeature, QgsGeometry,
     QgsPointXY, QgsField, QgsFields, QgsCoordinateReferenceSystem,
     QgsCoordinateTransform, QgsWkbTypes, QgsVectorFileWriter,
     QgsMarkerSymbol, QgsLineSymbol, QgsFillSymbol
@@ -27,6 +28,102 @@ from qgis.core import (
 from qgis.PyQt.QtCore import QVariant
 
 from ..base_module import BaseModule
+from ..utils import crs_registry
+from ..utils.point_parser import (
+    PointParser, GsiParser, ParseResult, GROUP_BLANK, GROUP_COLUMN
+)
+from ..utils.point_table import PointTable
+from ..utils.incremental import IncrementalParser
+from ..utils.qa import check_points, Canceled as QaCanceled
+from ..utils.feature_builder import FeatureBuilder, Canceled, FILE_FORMATS
+
+
+class PointTableModel(QAbstractTableModel):
+    """Modèle d'aperçu : lit la PointTable à la demande (lignes visibles)."""
+
+    HEADERS = ["N°", "X", "Y", "Z"]
+    GROUP_HEADER = "Groupe"
+
+    ISSUE_COLOR = QColor("#fdecea")
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._points = PointTable()
+        self._issues = {}  # index de point -> anomalies (contrôle qualité)
+
+    def set_points(self, points):
+        """Remplace la table affichée (aucune copie des colonnes)."""
+        self.beginResetModel()
+        self._points = points
+        self._issues = {}
+        self.endResetModel()
+
+    def set_issues(self, issues):
+        """Signale les points en anomalie (fond coloré + infobulle)."""
+        self._issues = issues
+        if len(self._points):
+            self.dataChanged.emit(
+                self.index(0, 0),
+                self.index(len(self._points) - 1, self.columnCount() - 1))
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._points)
+
+    def _headers(self):
+        if self._points.groups is not None:
+            return self.HEADERS + [self.GROUP_HEADER]
+        return self.HEADERS
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._headers())
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        row, col = index.row(), index.column()
+        if role == Qt.BackgroundRole:
+            return self.ISSUE_COLOR if row in self._issues else None
+        if role == Qt.ToolTipRole:
+            return self._issues.get(row)
+        if role != Qt.DisplayRole:
+            return None
+        pts = self._points
+        if col == 0:
+            return pts.num(row)
+        if col == 4:
+            return pts.group(row)
+        column = (pts.x, pts.y, pts.z)[col - 1]
+        return f"{column[row]:.3f}"
+
+    def splice(self, row, removed, added, apply):
+        """
+        Applique une modification locale de la table (apply) en notifiant
+        les vues : seules les lignes touchées sont redessinées.
+        """
+        parent = QModelIndex()
+        if added > removed:
+            self.beginInsertRows(parent, row + removed, row + added - 1)
+            apply()
+            self.endInsertRows()
+        elif removed > added:
+            self.beginRemoveRows(parent, row + added, row + removed - 1)
+            apply()
+            self.endRemoveRows()
+        else:
+            apply()
+
+        last = row + min(removed, added) - 1
+        if added != removed and self._points.auto_numbered:
+            # Numérotation automatique : les N° suivants sont décalés
+            last = len(self._points) - 1
+        if last >= row:
+            self.dataChanged.emit(
+                self.index(row, 0), self.index(last, self.columnCount() - 1))
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self._headers()[section]
+        return super().headerData(section, orientation, role)
 
 
 class PointsToGeometryDialog(QDialog):
@@ -41,22 +138,18 @@ class PointsToGeometryDialog(QDialog):
         "Personnalisé": None,
     }
 
-    COMMON_CRS = [
-        ("WGS 84 (GPS) - EPSG:4326", "EPSG:4326"),
-        ("WGS 84 / UTM zone 28N - EPSG:32628", "EPSG:32628"),
-        ("WGS 84 / UTM zone 29N - EPSG:32629", "EPSG:32629"),
-        ("WGS 84 / UTM zone 30N - EPSG:32630", "EPSG:32630"),
-        ("Merchich / Nord Maroc - EPSG:26191", "EPSG:26191"),
-        ("Merchich / Sud Maroc - EPSG:26192", "EPSG:26192"),
-        ("Merchich / Sahara Nord - EPSG:26194", "EPSG:26194"),
-        ("Merchich / Sahara Sud - EPSG:26195", "EPSG:26195"),
-        ("Autre (sélection manuelle)...", None),
-    ]
+    COMMON_CRS = crs_registry.COMMON_CRS
 
     def __init__(self, iface, parent=None):
         super().__init__(parent)
         self.iface = iface
-        self.parsed_points = []
+        self.parsed_points = PointTable()
+        self.task = None
+        # Correspondance lignes du texte → points, tenue à jour à la saisie
+        self.line_index = None
+        self._parse_revision = None
+        # Révision du texte contrôlée (None : points indépendants du texte)
+        self._qa_revision = None
         self.setWindowTitle("📐 Points → Géométrie")
         self.setMinimumSize(700, 600)
         self._setup_ui()
@@ -97,8 +190,14 @@ class PointsToGeometryDialog(QDialog):
             "234568.12 345679.45"
         )
         self.txt_points.setFont(QFont("Consolas", 10))
+        self.txt_points.document().contentsChange.connect(self._on_text_changed)
         inp_layout.addWidget(self.txt_points)
 
+        # Import direct d'un fichier (sans passer par la zone de texte)
+        btn_open = QPushButton("📂 Importer un fichier (CSV, TXT, XYZ, GSI)...")
+        btn_open.clicked.connect(self._import_file)
+        inp_layout.addWidget(btn_open)
+
         grp_input.setLayout(inp_layout)
         left_layout.addWidget(grp_input)
 
@@ -110,11 +209,13 @@ class PointsToGeometryDialog(QDialog):
         self.cmb_separator = QComboBox()
         self.cmb_separator.addItems(self.SEPARATORS.keys())
         self.cmb_separator.currentTextChanged.connect(self._on_separator_changed)
+        self.cmb_separator.currentTextChanged.connect(self._drop_line_index)
         opt_layout.addRow("Séparateur :", self.cmb_separator)
 
         self.txt_custom_sep = QLineEdit()
         self.txt_custom_sep.setPlaceholderText("Séparateur personnalisé")
         self.txt_custom_sep.setEnabled(False)
+        self.txt_custom_sep.textChanged.connect(self._drop_line_index)
         opt_layout.addRow("Personnalisé :", self.txt_custom_sep)
 
         # Ordre des colonnes
@@ -125,8 +226,17 @@ class PointsToGeometryDialog(QDialog):
             "N° Y X [Z]",
             "Y X [Z]",
         ])
+        self.cmb_col_order.currentIndexChanged.connect(self._drop_line_index)
         opt_layout.addRow("Ordre colonnes :", self.cmb_col_order)
 
+        # Regroupement : une géométrie par parcelle / lot
+        self.cmb_group = QComboBox()
+        self.cmb_group.addItem("Aucun (une seule géométrie)", None)
+        self.cmb_group.addItem("Ligne vide ou « # nom » entre groupes", GROUP_BLANK)
+        self.cmb_group.addItem("1re colonne = groupe", GROUP_COLUMN)
+        self.cmb_group.currentIndexChanged.connect(self._drop_line_index)
+        opt_layout.addRow("Regroupement :", self.cmb_group)
+
         # CRS
         self.cmb_crs = QComboBox()
         for label, code in self.COMMON_CRS:
@@ -145,11 +255,29 @@ class PointsToGeometryDialog(QDialog):
         h_geom.addWidget(self.rb_points)
         opt_layout.addRow("Géométrie :", h_geom)
 
+        # Contrôle qualité : distance sous laquelle deux points sont confondus
+        self.spn_tolerance = QDoubleSpinBox()
+        self.spn_tolerance.setDecimals(3)
+        self.spn_tolerance.setRange(0.0, 10.0)
+        self.spn_tolerance.setSingleStep(0.005)
+        self.spn_tolerance.setValue(0.01)
+        self.spn_tolerance.setSuffix(" m")
+        opt_layout.addRow("Tolérance doublons :", self.spn_tolerance)
+
         # Fermer le polygone automatiquement
         self.chk_close = QCheckBox("Fermer automatiquement le polygone")
         self.chk_close.setChecked(True)
         opt_layout.addRow("", self.chk_close)
 
+        # Reprojection unique à la création (évite la reprojection à la volée
+        # de chaque sommet à chaque rafraîchissement du canevas)
+        self.chk_reproject = QCheckBox("Reprojeter dans le SCR du projet")
+        self.chk_reproject.setToolTip(
+            "Les coordonnées sont converties une fois à la création ; "
+            "les attributs x / y / z gardent les valeurs saisies."
+        )
+        opt_layout.addRow("", self.chk_reproject)
+
         # Numérotation des sommets
         self.chk_labels = QCheckBox("Afficher les numéros de sommets")
         self.chk_labels.setChecked(True)
@@ -167,6 +295,18 @@ class PointsToGeometryDialog(QDialog):
         btn_parse.clicked.connect(self._parse_points)
         left_layout.addWidget(btn_parse)
 
+        # Progression du traitement en cours (tâche de fond)
+        h_progress = QHBoxLayout()
+        self.progress = QProgressBar()
+        self.progress.setRange(0, 100)
+        self.progress.setVisible(False)
+        h_progress.addWidget(self.progress, 1)
+        self.btn_cancel = QPushButton("Annuler")
+        self.btn_cancel.setVisible(False)
+        self.btn_cancel.clicked.connect(self._cancel_task)
+        h_progress.addWidget(self.btn_cancel)
+        left_layout.addLayout(h_progress)
+
         splitter.addWidget(left)
 
         # === PANNEAU DROIT : Aperçu ===
@@ -180,13 +320,27 @@ class PointsToGeometryDialog(QDialog):
         self.lbl_count.setStyleSheet("font-weight: bold; color: #2c3e50;")
         prev_layout.addWidget(self.lbl_count)
 
-        self.table_points = QTableWidget()
-        self.table_points.setColumnCount(4)
-        self.table_points.setHorizontalHeaderLabels(["N°", "X", "Y", "Z"])
+        self.points_model = PointTableModel(self)
+        self.table_points = QTableView()
+        self.table_points.setModel(self.points_model)
         self.table_points.horizontalHeader().setSectionResizeMode(QHeaderView.Stretch)
+        # Hauteur de ligne fixe : pas de mesure ligne par ligne sur 1M de points
+        v_header = self.table_points.verticalHeader()
+        v_header.setSectionResizeMode(QHeaderView.Fixed)
+        v_header.setDefaultSectionSize(self.fontMetrics().height() + 6)
         self.table_points.setAlternatingRowColors(True)
         prev_layout.addWidget(self.table_points)
 
+        # Contrôle qualité (doublons, intersections, sens de parcours)
+        h_qa = QHBoxLayout()
+        self.lbl_qa = QLabel("Contrôle qualité : —")
+        self.lbl_qa.setWordWrap(True)
+        h_qa.addWidget(self.lbl_qa, 1)
+        btn_check = QPushButton("🔍 Contrôler")
+        btn_check.clicked.connect(self._check_points)
+        h_qa.addWidget(btn_check)
+        prev_layout.addLayout(h_qa)
+
         grp_preview.setLayout(prev_layout)
         right_layout.addWidget(grp_preview)
 
@@ -210,8 +364,8 @@ class PointsToGeometryDialog(QDialog):
         btn_add_layer.clicked.connect(self._add_to_project)
         h_buttons.addWidget(btn_add_layer)
 
-        btn_save = QPushButton("💾 Enregistrer Shapefile")
-        btn_save.clicked.connect(self._save_shapefile)
+        btn_save = QPushButton("💾 Enregistrer (SHP, GPKG, FGB)")
+        btn_save.clicked.connect(self._save_file)
         h_buttons.addWidget(btn_save)
 
         btn_close = QPushButton("Fermer")
@@ -220,6 +374,9 @@ class PointsToGeometryDialog(QDialog):
 
         layout.addLayout(h_buttons)
 
+        # Boutons désactivés pendant une tâche de fond
+        self.action_buttons = [btn_parse, btn_open, btn_check, btn_add_layer, btn_save]
+
     def _on_separator_changed(self, text):
         self.txt_custom_sep.setEnabled(text == "Personnalisé")
 
@@ -229,6 +386,7 @@ class PointsToGeometryDialog(QDialog):
             dlg = QgsProjectionSelectionDialog(self)
             if dlg.exec_():
                 crs = dlg.crs()
+                crs_registry.register(crs)
                 # Remplacer le dernier item
                 self.cmb_crs.setItemText(index, f"{crs.description()} - {crs.authid()}")
                 self.cmb_crs.setItemData(index, crs.authid())
@@ -242,227 +400,462 @@ class PointsToGeometryDialog(QDialog):
         return self.SEPARATORS[text]
 
     def _parse_points(self):
-        """Analyse le texte et extrait les points."""
-        raw = self.txt_points.toPlainText().strip()
-        if not raw:
+        """Lance l'analyse du texte en tâche de fond."""
+        raw = self.txt_points.toPlainText()
+        if not raw or raw.isspace():
             QMessageBox.warning(self, "Attention", "Aucun texte à analyser.")
             return
 
+        parser = self._make_parser()
+        if IncrementalParser.supports(parser):
+            parser = IncrementalParser(parser)
+        self.line_index = None
+        self._parse_revision = self.txt_points.document().revision()
+        self._start_task(PointsParseTask(parser, text=raw),
+                         lambda result: self._on_text_parsed(result, parser))
+
+    def _make_parser(self):
+        """Parseur configuré selon le séparateur et l'ordre des colonnes."""
         sep = self._get_separator_pattern()
         col_order = self.cmb_col_order.currentText()
         has_num = "N°" in col_order
         is_yx = "Y X" in col_order
+        return PointParser(sep, has_num=has_num, is_yx=is_yx,
+                           group_mode=self.cmb_group.currentData())
+
+    def _import_file(self):
+        """Analyse un fichier de coordonnées lu directement (mmap)."""
+        file_path, _ = QFileDialog.getOpenFileName(
+            self, "Importer des coordonnées",
+            os.path.expanduser("~"),
+            "Coordonnées (*.csv *.txt *.xyz *.gsi);;Tous (*.*)"
+        )
+        if not file_path:
+            return
 
-        self.parsed_points = []
-        errors = []
+        self.line_index = None
+        if file_path.lower().endswith(".gsi"):
+            parser = GsiParser()
+        else:
+            parser = self._make_parser()
+        self._start_task(PointsParseTask(parser, path=file_path), self._on_points_parsed)
 
-        for i, line in enumerate(raw.splitlines(), 1):
-            line = line.strip()
-            if not line or line.startswith("#"):
-                continue
+    def _on_text_parsed(self, result, parser):
+        """Analyse de la zone de saisie : active le suivi des modifications."""
+        if isinstance(parser, IncrementalParser) \
+                and self.txt_points.document().revision() == self._parse_revision:
+            self.line_index = parser
+        self._on_points_parsed(result)
 
-            parts = re.split(sep, line)
-
-            try:
-                if has_num:
-                    num = parts[0]
-                    x_str, y_str = parts[1], parts[2]
-                    z_str = parts[3] if len(parts) > 3 else "0"
-                else:
-                    num = str(len(self.parsed_points) + 1)
-                    x_str, y_str = parts[0], parts[1]
-                    z_str = parts[2] if len(parts) > 2 else "0"
-
-                x = float(x_str.replace(",", "."))
-                y = float(y_str.replace(",", "."))
-                z = float(z_str.replace(",", "."))
-
-                if is_yx:
-                    x, y = y, x
-
-                self.parsed_points.append({
-                    "num": num, "x": x, "y": y, "z": z
-                })
-            except (IndexError, ValueError) as e:
-                errors.append(f"Ligne {i}: {line} → {str(e)}")
-
-        # Mise à jour du tableau
-        self.table_points.setRowCount(len(self.parsed_points))
-        for row, pt in enumerate(self.parsed_points):
-            self.table_points.setItem(row, 0, QTableWidgetItem(pt["num"]))
-            self.table_points.setItem(row, 1, QTableWidgetItem(f"{pt['x']:.3f}"))
-            self.table_points.setItem(row, 2, QTableWidgetItem(f"{pt['y']:.3f}"))
-            self.table_points.setItem(row, 3, QTableWidgetItem(f"{pt['z']:.3f}"))
+    def _on_points_parsed(self, result):
+        """Reçoit le résultat du parsing (thread principal)."""
+        self.parsed_points = result.points
+        errors = result.errors
 
-        msg = f"{len(self.parsed_points)} points analysés"
-        if errors:
-            msg += f" ({len(errors)} erreurs)"
-        self.lbl_count.setText(msg)
+        # Mise à jour de l'aperçu (formatage à l'affichage des lignes)
+        self.points_model.set_points(self.parsed_points)
+        self._update_count(result)
 
         if errors:
             QMessageBox.warning(
                 self, "Erreurs de parsing",
                 "Lignes ignorées :\n" + "\n".join(errors[:10])
             )
+        self._check_points()
+
+    def _update_count(self, result):
+        msg = f"{len(self.parsed_points)} points analysés"
+        if self.parsed_points.groups is not None:
+            groups = result.group_count
+            if groups is None:
+                groups = len(self.parsed_points.group_indices())
+            msg += f" en {groups} groupes"
+        if result.source:
+            msg += f" — {os.path.basename(result.source)}"
+        if result.error_count:
+            msg += f" ({result.error_count} erreurs)"
+        self.lbl_count.setText(msg)
+
+    # ----------------------------------------------------------------
+    # Re-parsing incrémental
+    # ----------------------------------------------------------------
+
+    def _on_text_changed(self, position, removed, added):
+        """
+        Modification du texte après une analyse : seules les lignes
+        touchées sont re-parsées, la table et l'aperçu corrigés sur place.
+        """
+        engine = self.line_index
+        if engine is None:
+            return
+        doc = self.txt_points.document()
+        block = doc.findBlock(position)
+        end = min(position + added, doc.characterCount() - 1)
+        first = block.blockNumber()
+        last = doc.findBlock(end).blockNumber()
+        # Lignes d'origine remplacées par les lignes first..last
+        count = (last - first + 1) - (doc.blockCount() - len(engine))
+        if first < 0 or count < 0 or first + count > len(engine):
+            self._drop_line_index()
+            return
 
-    def _create_layer(self):
-        """Crée la couche vecteur à partir des points parsés."""
+        lines = []
+        for _ in range(last - first + 1):
+            lines.append(block.text())
+            block = block.next()
+        self.points_model.set_issues({})
+        self.lbl_qa.setStyleSheet("")
+        self.lbl_qa.setText("Contrôle qualité : texte modifié, relancer le contrôle")
+        engine.update(first, count, lines, self.points_model.splice)
+        self._update_count(engine.result())
+
+    def _drop_line_index(self, *args):
+        """Options modifiées : la prochaine analyse repart du texte complet."""
+        if self.line_index is not None:
+            self.line_index = None
+            self.lbl_count.setText(self.lbl_count.text() + " — à ré-analyser")
+
+    # ----------------------------------------------------------------
+    # Contrôle qualité
+    # ----------------------------------------------------------------
+
+    def _check_points(self):
+        """Contrôle les points analysés en tâche de fond."""
         if not self.parsed_points:
-            QMessageBox.warning(self, "Attention", "Analysez d'abord les points.")
-            return None
+            self.lbl_qa.setText("Contrôle qualité : —")
+            return
+        task = PointsCheckTask(
+            self.parsed_points[:], self.spn_tolerance.value(),
+            closed=self.rb_polygon.isChecked()
+        )
+        # Avec le suivi des modifications, une saisie pendant le contrôle
+        # décale les lignes : le résultat ne s'applique plus
+        self._qa_revision = (self.txt_points.document().revision()
+                             if self.line_index is not None else None)
+        self._start_task(task, self._on_points_checked, self._on_check_canceled)
+
+    def _on_points_checked(self, checked):
+        if self._qa_revision is not None \
+                and self.txt_points.document().revision() != self._qa_revision:
+            self.lbl_qa.setStyleSheet("")
+            self.lbl_qa.setText("Contrôle qualité : texte modifié, relancer le contrôle")
+            return
+        report, issues = checked
+        self.points_model.set_issues(issues)
+        color = "#27ae60" if report.ok else "#c0392b"
+        self.lbl_qa.setStyleSheet(f"color: {color};")
+        self.lbl_qa.setText("\n".join(report.summary()))
+
+    def _on_check_canceled(self):
+        self.lbl_qa.setStyleSheet("")
+        self.lbl_qa.setText("Contrôle qualité : annulé")
+
+    # ----------------------------------------------------------------
+    # Tâches de fond
+    # ----------------------------------------------------------------
+
+    def _start_task(self, task, on_success, on_cancel=None):
+        """
+        Exécute une tâche QgsTask en gardant le dialogue réactif.
+        on_cancel : appelé si la tâche est annulée (par défaut, signalé
+        dans le compteur de points).
+        """
+        if self.task is not None:
+            QMessageBox.warning(self, "Attention", "Un traitement est déjà en cours.")
+            return
+        self.task = task
+        task.progressChanged.connect(lambda p: self.progress.setValue(int(p)))
+        task.resultReady.connect(
+            lambda result: self._on_task_done(result, on_success, on_cancel))
+
+        self.progress.setValue(0)
+        self.progress.setVisible(True)
+        self.btn_cancel.setVisible(True)
+        for btn in self.action_buttons:
+            btn.setEnabled(False)
+
+        QgsApplication.taskManager().addTask(task)
+
+    def _on_task_done(self, result, on_success, on_cancel):
+        task, self.task = self.task, None
+        self.progress.setVisible(False)
+        self.btn_cancel.setVisible(False)
+        for btn in self.action_buttons:
+            btn.setEnabled(True)
+
+        if result is not None:
+            on_success(result)
+        elif task.exception is not None:
+            QMessageBox.warning(
+                self, "Erreur",
+                f"Erreur pendant le traitement :\n{str(task.exception)}"
+            )
+        elif on_cancel is not None:
+            on_cancel()
+        else:
+            self.lbl_count.setText(f"{task.description()} : annulé")
 
-        crs_code = self.cmb_crs.currentData()
-        if not crs_code:
-            crs_code = "EPSG:4326"
-        crs = QgsCoordinateReferenceSystem(crs_code)
+    def _cancel_task(self):
+        if self.task is not None:
+            self.task.cancel()
 
-        points = [QgsPointXY(p["x"], p["y"]) for p in self.parsed_points]
+    def done(self, result):
+        """Annule le traitement en cours à la fermeture du dialogue."""
+        self._cancel_task()
+        super().done(result)
 
+    # ----------------------------------------------------------------
+    # Création des couches
+    # ----------------------------------------------------------------
+
+    def _layer_options(self):
+        """Lit les options de couche dans l'interface (thread principal)."""
         if self.rb_polygon.isChecked():
             geom_type = "Polygon"
-            layer = QgsVectorLayer(f"{geom_type}?crs={crs_code}", "Points_Polygone", "memory")
-            pr = layer.dataProvider()
-            pr.addAttributes([
-                QgsField("id", QVariant.Int),
-                QgsField("surface_m2", QVariant.Double),
-                QgsField("perimetre_m", QVariant.Double),
-            ])
-            layer.updateFields()
-
-            feat = QgsFeature()
-            geom = QgsGeometry.fromPolygonXY([points])
-            feat.setGeometry(geom)
-            feat.setAttributes([
-                1,
-                round(geom.area(), 2),
-                round(geom.length(), 2),
-            ])
-            pr.addFeatures([feat])
-            layer.updateExtents()
-
-            # Style
-            symbol = QgsFillSymbol.createSimple({
-                'color': '52,152,219,60',
-                'outline_color': '#e74c3c',
-                'outline_width': '0.8'
-            })
-            layer.renderer().setSymbol(symbol)
-
         elif self.rb_polyline.isChecked():
             geom_type = "LineString"
-            layer = QgsVectorLayer(f"{geom_type}?crs={crs_code}", "Points_Polyligne", "memory")
-            pr = layer.dataProvider()
-            pr.addAttributes([
-                QgsField("id", QVariant.Int),
-                QgsField("longueur_m", QVariant.Double),
-            ])
-            layer.updateFields()
-
-            feat = QgsFeature()
-            geom = QgsGeometry.fromPolylineXY(points)
-            feat.setGeometry(geom)
-            feat.setAttributes([1, round(geom.length(), 2)])
-            pr.addFeatures([feat])
-            layer.updateExtents()
-
-            symbol = QgsLineSymbol.createSimple({
-                'color': '#e74c3c',
-                'width': '0.8'
-            })
-            layer.renderer().setSymbol(symbol)
-
-        else:  # Points
+        else:
             geom_type = "Point"
-            layer = QgsVectorLayer(f"{geom_type}?crs={crs_code}", "Points_Import", "memory")
-            pr = layer.dataProvider()
-            pr.addAttributes([
-                QgsField("num", QVariant.String),
-                QgsField("x", QVariant.Double),
-                QgsField("y", QVariant.Double),
-                QgsField("z", QVariant.Double),
-            ])
-            layer.updateFields()
-
-            features = []
-            for p in self.parsed_points:
-                feat = QgsFeature()
-                feat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(p["x"], p["y"])))
-                feat.setAttributes([p["num"], p["x"], p["y"], p["z"]])
-                features.append(feat)
-            pr.addFeatures(features)
-            layer.updateExtents()
-
-        # Ajouter les sommets comme couche séparée si polygon/polyline
-        if geom_type != "Point" and self.chk_labels.isChecked():
-            pts_layer = QgsVectorLayer(f"Point?crs={crs_code}", "Sommets", "memory")
-            pr2 = pts_layer.dataProvider()
-            pr2.addAttributes([
-                QgsField("num", QVariant.String),
-                QgsField("x", QVariant.Double),
-                QgsField("y", QVariant.Double),
-                QgsField("z", QVariant.Double),
-            ])
-            pts_layer.updateFields()
-
-            features = []
-            for p in self.parsed_points:
-                feat = QgsFeature()
-                feat.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(p["x"], p["y"])))
-                feat.setAttributes([p["num"], p["x"], p["y"], p["z"]])
-                features.append(feat)
-            pr2.addFeatures(features)
-            pts_layer.updateExtents()
-
-            # Labels
-            from qgis.core import QgsPalLayerSettings, QgsVectorLayerSimpleLabeling
-            label_settings = QgsPalLayerSettings()
-            label_settings.fieldName = "num"
-            label_settings.isExpression = False
-            labeling = QgsVectorLayerSimpleLabeling(label_settings)
-            pts_layer.setLabeling(labeling)
-            pts_layer.setLabelsEnabled(True)
-
-            QgsProject.instance().addMapLayer(pts_layer)
-
-        return layer
+        target_crs = None
+        if self.chk_reproject.isChecked():
+            project_crs = QgsProject.instance().crs()
+            if project_crs.isValid():
+                target_crs = project_crs.authid()
+        return {
+            "geom_type": geom_type,
+            "crs": self.cmb_crs.currentData() or "EPSG:4326",
+            "target_crs": target_crs,
+            "vertices": geom_type != "Point" and self.chk_labels.isChecked(),
+        }
+
+    def _create_layer(self, on_created):
+        """
+        Construit les couches en tâche de fond (entités ajoutées par lots).
+        on_created(layer) est appelé sur le thread principal.
+        """
+        if not self.parsed_points:
+            QMessageBox.warning(self, "Attention", "Analysez d'abord les points.")
+            return
+
+        # Copie des colonnes : le texte peut être modifié pendant la tâche
+        task = PointsLayerTask(self.parsed_points[:], self._layer_options())
+        self._start_task(task, lambda built: self._on_layers_built(built, on_created))
+
+    def _on_layers_built(self, built, on_created):
+        layer, vertices = built
+        if vertices is not None:
+            QgsProject.instance().addMapLayer(vertices)
+        on_created(layer)
 
     def _add_to_project(self):
         """Ajoute la couche au projet QGIS."""
-        layer = self._create_layer()
-        if layer:
-            QgsProject.instance().addMapLayer(layer)
-            self.iface.mapCanvas().setExtent(layer.extent())
-            self.iface.mapCanvas().refresh()
-            QMessageBox.information(self, "Succès", "Couche ajoutée au projet.")
-
-    def _save_shapefile(self):
-        """Sauvegarde en shapefile."""
-        layer = self._create_layer()
-        if not layer:
+        self._create_layer(self._on_layer_created)
+
+    def _on_layer_created(self, layer):
+        QgsProject.instance().addMapLayer(layer)
+        self.iface.mapCanvas().setExtent(layer.extent())
+        self.iface.mapCanvas().refresh()
+        QMessageBox.information(self, "Succès", "Couche ajoutée au projet.")
+
+    def _save_file(self):
+        """Enregistre directement dans un fichier (Shapefile, GPKG, FlatGeobuf)."""
+        if not self.parsed_points:
+            QMessageBox.warning(self, "Attention", "Analysez d'abord les points.")
             return
 
-        file_path, _ = QFileDialog.getSaveFileName(
-            self, "Enregistrer le Shapefile",
+        filters = {
+            f"{label} (*{ext})": (driver, ext)
+            for driver, (label, ext) in FILE_FORMATS.items()
+        }
+        file_path, selected = QFileDialog.getSaveFileName(
+            self, "Enregistrer la géométrie",
             os.path.expanduser("~/points_geometry.shp"),
-            "Shapefile (*.shp)"
+            ";;".join(filters)
         )
         if not file_path:
             return
 
-        crs_code = self.cmb_crs.currentData() or "EPSG:4326"
-        crs = QgsCoordinateReferenceSystem(crs_code)
+        driver, ext = filters.get(selected, ("ESRI Shapefile", ".shp"))
+        for other, (_, other_ext) in FILE_FORMATS.items():
+            if file_path.lower().endswith(other_ext):
+                driver, ext = other, other_ext
+                break
+        else:
+            file_path += ext
 
-        error = QgsVectorFileWriter.writeAsVectorFormat(
-            layer, file_path, "UTF-8", crs, "ESRI Shapefile"
-        )
+        task = PointsExportTask(self.parsed_points[:], self._layer_options(), file_path, driver)
+        self._start_task(task, self._on_file_written)
 
-        if error[0] == QgsVectorFileWriter.NoError:
-            # Charger le shapefile sauvegardé
-            saved_layer = QgsVectorLayer(file_path, os.path.basename(file_path), "ogr")
-            QgsProject.instance().addMapLayer(saved_layer)
-            QMessageBox.information(self, "Succès", f"Shapefile enregistré :\n{file_path}")
+    def _on_file_written(self, file_path):
+        # Charger le fichier enregistré
+        saved_layer = QgsVectorLayer(file_path, os.path.basename(file_path), "ogr")
+        QgsProject.instance().addMapLayer(saved_layer)
+        QMessageBox.information(self, "Succès", f"Fichier enregistré :\n{file_path}")
+
+
+class PointsParseTask(QgsTask):
+    """Tâche de fond : parsing et validation du texte collé ou d'un fichier."""
+
+    resultReady = pyqtSignal(object)
+
+    def __init__(self, parser, text=None, path=None):
+        super().__init__("Analyse des points", QgsTask.CanCancel)
+        self.parser = parser
+        self.text = text
+        self.path = path
+        self.result = None
+        self.exception = None
+
+    def run(self):
+        try:
+            if self.path:
+                self.result = self._parse_file()
+            else:
+                self.result = self.parser.parse(
+                    self.text, progress=self.setProgress, is_canceled=self.isCanceled
+                )
+        except Exception as e:
+            self.exception = e
+            return False
+        return not self.result.canceled
+
+    def _parse_file(self):
+        """Fichier mappé en mémoire : seul le bloc en cours est décodé."""
+        if os.path.getsize(self.path) == 0:
+            result = ParseResult()
         else:
-            QMessageBox.warning(self, "Erreur", f"Erreur d'écriture : {error[1]}")
+            with open(self.path, "rb") as f, \
+                    mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buf:
+                result = self.parser.parse_buffer(
+                    buf, progress=self.setProgress, is_canceled=self.isCanceled
+                )
+        result.source = self.path
+        return result
+
+    def finished(self, ok):
+        # Libérer le texte source dès que possible
+        self.text = None
+        self.resultReady.emit(self.result if ok else None)
+
+
+class PointsCheckTask(QgsTask):
+    """Tâche de fond : contrôle qualité géométrique des points."""
+
+    resultReady = pyqtSignal(object)
+
+    def __init__(self, points, tolerance, closed=True):
+        super().__init__("Contrôle qualité", QgsTask.CanCancel)
+        self.points = points
+        self.tolerance = tolerance
+        self.closed = closed
+        self.result = None
+        self.exception = None
+
+    def run(self):
+        try:
+            report = check_points(
+                self.points, self.tolerance, self.closed, is_canceled=self.isCanceled
+            )
+            self.result = (report, report.row_issues(self.points))
+        except QaCanceled:
+            return False
+        except Exception as e:
+            self.exception = e
+            return False
+        return True
+
+    def finished(self, ok):
+        self.resultReady.emit(self.result if ok else None)
+
+
+class PointsExportTask(QgsTask):
+    """Tâche de fond : écriture directe des entités dans un fichier."""
+
+    resultReady = pyqtSignal(object)
+
+    def __init__(self, points, options, path, driver):
+        super().__init__("Enregistrement du fichier", QgsTask.CanCancel)
+        self.points = points
+        self.options = options
+        self.path = path
+        self.driver = driver
+        self.result = None
+        self.exception = None
+
+    def run(self):
+        geom_type = self.options["geom_type"]
+        try:
+            PointsLayerTask.validate(self.points, geom_type)
+            builder = FeatureBuilder(
+                self.points, self.options["crs"],
+                progress=self.setProgress, is_canceled=self.isCanceled,
+                target_crs=self.options["target_crs"]
+            )
+            self.result = builder.write_file(self.path, geom_type, self.driver)
+        except Canceled:
+            return False
+        except Exception as e:
+            self.exception = e
+            return False
+        return True
+
+    def finished(self, ok):
+        self.resultReady.emit(self.result if ok else None)
+
+
+class PointsLayerTask(QgsTask):
+    """Tâche de fond : construction des couches mémoire (entités par lots)."""
+
+    resultReady = pyqtSignal(object)
+
+    def __init__(self, points, options):
+        super().__init__("Construction des entités", QgsTask.CanCancel)
+        self.points = points
+        self.options = options
+        self.result = None
+        self.exception = None
+
+    def run(self):
+        geom_type = self.options["geom_type"]
+        try:
+            # Validation avant construction (chaque groupe séparément)
+            self.validate(self.points, geom_type)
+
+            builder = FeatureBuilder(
+                self.points, self.options["crs"],
+                progress=self.setProgress, is_canceled=self.isCanceled,
+                target_crs=self.options["target_crs"]
+            )
+            layers = builder.build(geom_type, self.options["vertices"])
+        except Canceled:
+            return False
+        except Exception as e:
+            self.exception = e
+            return False
+
+        # Couches créées dans le thread de la tâche : les rendre au thread GUI
+        main_thread = QgsApplication.instance().thread()
+        for layer in layers:
+            if layer is not None:
+                layer.moveToThread(main_thread)
+        self.result = layers
+        return True
+
+    @staticmethod
+    def validate(points, geom_type):
+        """Nombre minimal de points par géométrie (lève ValueError)."""
+        minimum = {"Polygon": 3, "LineString": 2}.get(geom_type)
+        if minimum is None:
+            return
+        for key, rows in points.group_indices().items():
+            if len(rows) >= minimum:
+                continue
+            what = "Un polygone" if geom_type == "Polygon" else "Une polyligne"
+            where = f" (groupe « {key} »)" if key is not None else ""
+            raise ValueError(f"{what} nécessite au moins {minimum} points{where}.")
+
+    def finished(self, ok):
+        self.resultReady.emit(self.result if ok else None)
 
 
 class PointsToGeometryModule(BaseModule):
@@ -2,25 +2,152 @@
 Module QR Code Localisation
 - Cliquer sur la carte pour obtenir les coordonnées
 - Génération automatique d'un QR code avec lien Google Maps
-- Taille paramétrable du QR code
+  (encodeur local, fonctionne hors connexion)
+- Taille paramétrable du QR code, rendu en tâche de fond : seule la
+  dernière taille demandée est générée
+- Cache mémoire + disque : une position déjà vue s'affiche immédiatement
 - Export en image PNG
+- Mode par lots : QR codes de toutes les entités d'une couche de points
+  (reprojection WGS84 en une passe, génération en tâche de fond, PNG
+  écrits sur un pool de threads), en fichiers PNG, planche PNG ou PDF
+- Capture multiple : clics successifs marqués sur la carte, puis
+  génération groupée par le même traitement par lots
 """
 
 import os
+from array import array
 from qgis.PyQt.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QGroupBox, QLabel,
     QPushButton, QSpinBox, QMessageBox, QFormLayout,
-    QFileDialog, QSizePolicy
+    QFileDialog, QSizePolicy, QAction, QComboBox, QCheckBox,
+    QLineEdit, QProgressBar
 )
-from qgis.PyQt.QtGui import QFont, QPixmap, QImage
-from qgis.PyQt.QtCore import Qt, QSize
+from qgis.PyQt.QtGui import QFont, QPixmap, QIcon, QColor
+from qgis.PyQt.QtCore import Qt, QTimer, pyqtSignal
 from qgis.core import (
-    QgsProject, QgsCoordinateReferenceSystem,
-    QgsCoordinateTransform, QgsPointXY
+    QgsApplication, QgsTask, QgsProject, QgsVectorLayer, QgsWkbTypes,
+    QgsFeatureRequest, QgsVectorLayerFeatureSource, NULL
 )
-from qgis.gui import QgsMapToolEmitPoint
+from qgis.gui import QgsMapToolEmitPoint, QgsVertexMarker
 
 from ..base_module import BaseModule
+from ..utils import qr_batch, qr_images, transforms
+
+
+class QrRenderTask(QgsTask):
+    """Tâche de fond : encodage et rendu d'un QR code (via le cache)."""
+
+    resultReady = pyqtSignal(object)
+
+    def __init__(self, lat, lon, size):
+        super().__init__("Génération du QR code", QgsTask.CanCancel)
+        self.lat = lat
+        self.lon = lon
+        self.size = size
+        self.result = None
+        self.exception = None
+
+    def run(self):
+        try:
+            self.result = qr_images.CACHE.image(self.lat, self.lon, self.size)
+        except Exception as e:
+            self.exception = e
+            return False
+        return True
+
+    def finished(self, ok):
+        self.resultReady.emit(self.result if ok else None)
+
+
+def layer_points(source, request, label_field=None):
+    """
+    (légende, x, y) des entités d'une source ponctuelle, parcourue dans
+    le thread appelant. Multi-points : un QR code par partie.
+    """
+    for feature in source.getFeatures(request):
+        geom = feature.geometry()
+        if geom.isNull() or geom.isEmpty():
+            continue
+        label = feature[label_field] if label_field else None
+        if label is None or label == NULL:
+            label = feature.id()
+        parts = geom.asMultiPoint() if geom.isMultipart() else [geom.asPoint()]
+        for k, pt in enumerate(parts):
+            yield (label if len(parts) == 1 else f"{label}_{k + 1}", pt.x(), pt.y())
+
+
+class QrBatchTask(QgsTask):
+    """Tâche de fond : QR codes d'une série de points, écrits sur disque."""
+
+    resultReady = pyqtSignal(object)
+
+    def __init__(self, points, crs, options):
+        super().__init__("Génération des QR codes", QgsTask.CanCancel)
+        self.points = points      # itérable de (légende, x, y) dans le SCR crs
+        self.crs = crs
+        self.options = options
+        self.result = None
+        self.exception = None
+
+    def run(self):
+        try:
+            self.result = self._generate()
+        except qr_batch.Canceled:
+            return False
+        except Exception as e:
+            self.exception = e
+            return False
+        return self.result is not None
+
+    def _generate(self):
+        labels, xs, ys = [], array("d"), array("d")
+        for k, (label, x, y) in enumerate(self.points):
+            if k % 1000 == 0 and self.isCanceled():
+                raise qr_batch.Canceled()
+            labels.append(label)
+            xs.append(x)
+            ys.append(y)
+        if not labels:
+            raise ValueError("Aucun point à traiter.")
+
+        # Reprojection WGS84 de toutes les coordonnées en une passe
+        wgs84 = transforms.transform_arrays(
+            xs, ys, self.crs, "EPSG:4326", is_canceled=self.isCanceled
+        )
+        if wgs84 is None:
+            return None
+        texts = [
+            qr_images.gmaps_url(round(lat, 7), round(lon, 7))
+            for lon, lat in zip(*wgs84)
+        ]
+        self.setProgress(10)
+
+        output = self.options["output"]
+        size = self.options["size"]
+        path = self.options["path"]
+        progress = lambda p: self.setProgress(10 + 0.8 * p)
+
+        if output == qr_batch.OUTPUT_PNG:
+            os.makedirs(path, exist_ok=True)
+            names = qr_batch.file_names(labels)
+            # Encodage ici (Python pur), rendu + PNG sur le pool de threads
+            matrices = (qr_images.CACHE.matrix(text) for text in texts)
+            files = qr_batch.write_pngs(path, matrices, names, size, progress, self.isCanceled)
+        else:
+            matrices = qr_batch.map_items(
+                qr_images.CACHE.matrix, texts, progress, self.isCanceled
+            )
+            columns = self.options["columns"]
+            if output == qr_batch.OUTPUT_SHEET:
+                files = qr_batch.write_sheets(path, matrices, labels, size, columns)
+            else:
+                files = qr_batch.write_pdf(path, matrices, labels, columns,
+                                           title="QR codes de localisation")
+        self.setProgress(100)
+        return {"count": len(texts), "files": files}
+
+    def finished(self, ok):
+        self.resultReady.emit(self.result if ok else None)
 
 
 class QRLocationDialog(QDialog):
@@ -31,6 +158,14 @@ class QRLocationDialog(QDialog):
         self.lat = lat
         self.lon = lon
         self.qr_image = None
+        self.qr_task = None      # rendu en cours (un seul à la fois)
+
+        # Regroupe les changements de taille rapprochés (molette, flèches)
+        self.size_timer = QTimer(self)
+        self.size_timer.setSingleShot(True)
+        self.size_timer.setInterval(150)
+        self.size_timer.timeout.connect(self._generate_qr)
+
         self.setWindowTitle("QR Code - Localisation Google Maps")
         self.setMinimumWidth(400)
         self._setup_ui()
@@ -65,7 +200,7 @@ class QRLocationDialog(QDialog):
         )
         self.lbl_link.setOpenExternalLinks(True)
         self.lbl_link.setStyleSheet("color: #3498db;")
-        gmaps_url = f"https://www.google.com/maps?q={self.lat},{self.lon}"
+        gmaps_url = qr_images.gmaps_url(self.lat, self.lon)
         self.lbl_link.setText(f'<a href="{gmaps_url}">Ouvrir dans Google Maps</a>')
         coords_layout.addRow("Lien :", self.lbl_link)
 
@@ -80,7 +215,7 @@ class QRLocationDialog(QDialog):
         self.spn_size.setRange(100, 1000)
         self.spn_size.setValue(300)
         self.spn_size.setSuffix(" px")
-        self.spn_size.valueChanged.connect(self._generate_qr)
+        self.spn_size.valueChanged.connect(self.size_timer.start)
         opt_layout.addRow("Taille :", self.spn_size)
 
         grp_options.setLayout(opt_layout)
@@ -133,80 +268,62 @@ class QRLocationDialog(QDialog):
         layout.addWidget(lbl_copyright)
 
     def _generate_qr(self):
-        """Génère le QR code avec le lien Google Maps via APIs en ligne (avec fallback)."""
-        from qgis.PyQt.QtNetwork import QNetworkAccessManager, QNetworkRequest
-        from qgis.PyQt.QtCore import QUrl, QEventLoop
-        from urllib.parse import quote
-
-        gmaps_url = f"https://www.google.com/maps?q={self.lat},{self.lon}"
+        """
+        Génère le QR code à la taille courante, localement (aucun accès
+        réseau). Une image en cache s'affiche tout de suite ; sinon le rendu
+        part en tâche de fond. Pendant un rendu, les demandes suivantes sont
+        fusionnées : seule la dernière taille est traitée à la fin.
+        """
         size = self.spn_size.value()
-        encoded_url = quote(gmaps_url, safe='')
-
-        # Liste d'APIs de secours (fallback) - si une échoue, essaie la suivante
-        api_urls = [
-            # API 1: QRServer.com (très fiable)
-            f"https://api.qrserver.com/v1/create-qr-code/?size={size}x{size}&data={gmaps_url}",
-            # API 2: goQR.me (backup)
-            f"https://api.qrserver.com/v1/create-qr-code/?size={size}x{size}&format=png&data={encoded_url}",
-            # API 3: QuickChart.io (backup)
-            f"https://quickchart.io/qr?size={size}&text={encoded_url}",
-        ]
+        image = qr_images.CACHE.cached(self.lat, self.lon, size)
+        if image is not None:
+            self._show_qr(image)
+            return
+        if self.qr_task is not None:
+            return  # relancé par _on_qr_rendered avec la taille la plus récente
+
+        self.qr_task = QrRenderTask(self.lat, self.lon, size)
+        self.qr_task.resultReady.connect(self._on_qr_rendered)
+        if self.qr_image is None:
+            self.lbl_qr.setText("⏳ Génération du QR code...")
+        QgsApplication.taskManager().addTask(self.qr_task)
+
+    def _on_qr_rendered(self, image):
+        task, self.qr_task = self.qr_task, None
+        if image is None:
+            self.qr_image = None
+            self.lbl_qr.setText(f"❌ Erreur de génération\n\n{task.exception or 'Annulée'}")
+            self.lbl_qr.setStyleSheet(
+                "QLabel { color: #e74c3c; background-color: #fdecea; "
+                "border: 2px solid #e74c3c; border-radius: 8px; padding: 20px; }"
+            )
+            return
+        if task.size != self.spn_size.value():
+            self._generate_qr()  # la taille a changé entre-temps
+            return
+        self._show_qr(image)
 
-        # Afficher un message de chargement
-        self.lbl_qr.setText("⏳ Génération du QR code...")
+    def _show_qr(self, image):
+        self.qr_image = image
+        self.lbl_qr.setPixmap(QPixmap.fromImage(image))
         self.lbl_qr.setStyleSheet(
-            "QLabel { color: #3498db; background-color: #ebf5fb; "
-            "border: 2px solid #3498db; border-radius: 8px; padding: 20px; }"
+            "QLabel { background-color: white; border: 2px solid #27ae60; "
+            "border-radius: 8px; padding: 10px; }"
         )
 
-        # Essayer chaque API jusqu'à ce qu'une fonctionne
-        manager = QNetworkAccessManager()
-
-        for i, api_url in enumerate(api_urls):
-            request = QNetworkRequest(QUrl(api_url))
-            request.setRawHeader(b"User-Agent", b"QGIS-TopoTools/1.0")
-
-            # Créer une boucle d'événements pour attendre la réponse
-            loop = QEventLoop()
-            reply = manager.get(request)
-            reply.finished.connect(loop.quit)
-            loop.exec_()
-
-            # Si pas d'erreur, essayer de charger l'image
-            if not reply.error():
-                image_data = reply.readAll()
-                qimage = QImage()
-                qimage.loadFromData(image_data)
-
-                if not qimage.isNull():
-                    # Succès! Afficher l'image
-                    pixmap = QPixmap.fromImage(qimage)
-                    self.qr_image = qimage
-                    self.lbl_qr.setPixmap(pixmap)
-                    self.lbl_qr.setStyleSheet(
-                        "QLabel { background-color: white; border: 2px solid #27ae60; "
-                        "border-radius: 8px; padding: 10px; }"
-                    )
-                    return  # Terminé avec succès!
-
-        # Si toutes les APIs ont échoué
-        self.lbl_qr.setText(
-            "❌ Erreur de génération\n\n"
-            "Impossible de générer le QR code.\n"
-            "Vérifiez votre connexion internet.\n\n"
-            "Vous pouvez toujours copier le lien\n"
-            "et utiliser un générateur en ligne."
-        )
-        self.lbl_qr.setStyleSheet(
-            "QLabel { color: #e74c3c; background-color: #fdecea; "
-            "border: 2px solid #e74c3c; border-radius: 8px; padding: 20px; }"
-        )
+    def done(self, result):
+        """Abandonne le rendu en cours à la fermeture du dialogue."""
+        self.size_timer.stop()
+        if self.qr_task is not None:
+            self.qr_task.resultReady.disconnect(self._on_qr_rendered)
+            self.qr_task.cancel()
+            self.qr_task = None
+        super().done(result)
 
     def _copy_link(self):
         """Copie le lien Google Maps dans le presse-papier."""
         from qgis.PyQt.QtWidgets import QApplication
-        gmaps_url = f"https://www.google.com/maps?q={self.lat},{self.lon}"
-        QApplication.clipboard().setText(gmaps_url)
+        QApplication.clipboard().setText(qr_images.gmaps_url(self.lat, self.lon))
         QMessageBox.information(
             self, "Copié",
             "Lien Google Maps copié dans le presse-papier."
@@ -230,13 +347,9 @@ class QRLocationDialog(QDialog):
         )
 
         if file_path:
-            # Redimensionner l'image à la taille souhaitée
+            # Image à la taille demandée (modules nets), depuis le cache
             size = self.spn_size.value()
-            scaled_img = self.qr_image.scaled(
-                size, size,
-                Qt.KeepAspectRatio,
-                Qt.SmoothTransformation
-            )
+            scaled_img = qr_images.CACHE.image(self.lat, self.lon, size)
             if scaled_img.save(file_path, "PNG"):
                 QMessageBox.information(
                     self, "Succès",
@@ -249,32 +362,289 @@ class QRLocationDialog(QDialog):
                 )
 
 
-class QRLocationMapTool(QgsMapToolEmitPoint):
-    """Outil de carte pour capturer les clics."""
+class QRBatchDialog(QDialog):
+    """
+    Dialogue de génération de QR codes par lots : entités d'une couche de
+    points, ou points capturés sur la carte (points + crs fournis).
+    """
+
+    OUTPUTS = [
+        ("Images PNG (une par point)", qr_batch.OUTPUT_PNG),
+        ("Planche PNG (grille)", qr_batch.OUTPUT_SHEET),
+        ("Document PDF (A4)", qr_batch.OUTPUT_PDF),
+    ]
+
+    def __init__(self, iface, parent=None, points=None, crs=None):
+        super().__init__(parent)
+        self.iface = iface
+        self.points = points    # [(légende, x, y)] capturés, ou None (couche)
+        self.crs = crs
+        self.task = None
+        self.setWindowTitle("QR Codes par lots")
+        self.setMinimumWidth(460)
+        self._setup_ui()
+        if self.points is None:
+            self._populate_layers()
+
+    def _setup_ui(self):
+        layout = QVBoxLayout(self)
+
+        title = QLabel("QR Codes - Traitement par lots")
+        title.setFont(QFont("Segoe UI", 13, QFont.Bold))
+        title.setAlignment(Qt.AlignCenter)
+        title.setStyleSheet("color: #2c3e50; padding: 6px;")
+        layout.addWidget(title)
+
+        # === SOURCE ===
+        grp_source = QGroupBox("Points")
+        source_layout = QFormLayout()
+
+        if self.points is not None:
+            source_layout.addRow(
+                "Capture :", QLabel(f"{len(self.points)} point(s) cliqué(s) sur la carte")
+            )
+        else:
+            self.cmb_layer = QComboBox()
+            self.cmb_layer.currentIndexChanged.connect(self._on_layer_changed)
+            source_layout.addRow("Couche :", self.cmb_layer)
+
+            self.chk_selected = QCheckBox("Entités sélectionnées uniquement")
+            source_layout.addRow("", self.chk_selected)
+
+            self.cmb_label = QComboBox()
+            source_layout.addRow("Légende :", self.cmb_label)
+
+        grp_source.setLayout(source_layout)
+        layout.addWidget(grp_source)
+
+        # === SORTIE ===
+        grp_output = QGroupBox("Sortie")
+        out_layout = QFormLayout()
+
+        self.cmb_output = QComboBox()
+        for label, code in self.OUTPUTS:
+            self.cmb_output.addItem(label, code)
+        self.cmb_output.currentIndexChanged.connect(self._on_output_changed)
+        out_layout.addRow("Format :", self.cmb_output)
+
+        self.spn_size = QSpinBox()
+        self.spn_size.setRange(100, 1000)
+        self.spn_size.setValue(300)
+        self.spn_size.setSuffix(" px")
+        out_layout.addRow("Taille :", self.spn_size)
+
+        self.spn_columns = QSpinBox()
+        self.spn_columns.setRange(1, 20)
+        self.spn_columns.setValue(4)
+        out_layout.addRow("Colonnes :", self.spn_columns)
+
+        h_path = QHBoxLayout()
+        self.txt_path = QLineEdit()
+        h_path.addWidget(self.txt_path, 1)
+        btn_browse = QPushButton("...")
+        btn_browse.clicked.connect(self._browse)
+        h_path.addWidget(btn_browse)
+        out_layout.addRow("Destination :", h_path)
+
+        grp_output.setLayout(out_layout)
+        layout.addWidget(grp_output)
+
+        # Progression (tâche de fond)
+        h_progress = QHBoxLayout()
+        self.progress = QProgressBar()
+        self.progress.setRange(0, 100)
+        self.progress.setVisible(False)
+        h_progress.addWidget(self.progress, 1)
+        self.btn_cancel = QPushButton("Annuler")
+        self.btn_cancel.setVisible(False)
+        self.btn_cancel.clicked.connect(self._cancel_task)
+        h_progress.addWidget(self.btn_cancel)
+        layout.addLayout(h_progress)
+
+        # === BOUTONS ===
+        h_buttons = QHBoxLayout()
+        h_buttons.addStretch()
 
-    def __init__(self, canvas, iface):
+        self.btn_generate = QPushButton("Générer les QR codes")
+        self.btn_generate.setStyleSheet(
+            "QPushButton { background-color: #27ae60; color: white; "
+            "font-weight: bold; padding: 8px 20px; border-radius: 4px; }"
+            "QPushButton:hover { background-color: #2ecc71; }"
+        )
+        self.btn_generate.clicked.connect(self._generate)
+        h_buttons.addWidget(self.btn_generate)
+
+        btn_close = QPushButton("Fermer")
+        btn_close.clicked.connect(self.reject)
+        h_buttons.addWidget(btn_close)
+
+        layout.addLayout(h_buttons)
+
+        lbl_copyright = QLabel("© ELFADILY GEOCONSEIL — Tous droits réservés")
+        lbl_copyright.setAlignment(Qt.AlignCenter)
+        lbl_copyright.setStyleSheet("color: #aaa; font-size: 10px; padding-top: 2px;")
+        layout.addWidget(lbl_copyright)
+
+        self._on_output_changed()
+
+    def _populate_layers(self):
+        self.cmb_layer.clear()
+        for layer in QgsProject.instance().mapLayers().values():
+            if (isinstance(layer, QgsVectorLayer)
+                    and layer.geometryType() == QgsWkbTypes.PointGeometry):
+                self.cmb_layer.addItem(
+                    f"{layer.name()} ({layer.featureCount()} points)", layer.id()
+                )
+        active = self.iface.activeLayer()
+        if active is not None:
+            index = self.cmb_layer.findData(active.id())
+            if index >= 0:
+                self.cmb_layer.setCurrentIndex(index)
+
+    def _layer(self):
+        layer_id = self.cmb_layer.currentData()
+        return QgsProject.instance().mapLayer(layer_id) if layer_id else None
+
+    def _on_layer_changed(self):
+        self.cmb_label.clear()
+        self.cmb_label.addItem("(identifiant d'entité)", None)
+        layer = self._layer()
+        if layer is None:
+            return
+        for field in layer.fields():
+            self.cmb_label.addItem(field.name(), field.name())
+        self.chk_selected.setChecked(layer.selectedFeatureCount() > 0)
+
+    def _on_output_changed(self):
+        output = self.cmb_output.currentData()
+        self.spn_columns.setEnabled(output != qr_batch.OUTPUT_PNG)
+        self.spn_size.setEnabled(output != qr_batch.OUTPUT_PDF)  # PDF : taille selon la page
+        self.txt_path.clear()
+
+    def _browse(self):
+        output = self.cmb_output.currentData()
+        if output == qr_batch.OUTPUT_PNG:
+            path = QFileDialog.getExistingDirectory(
+                self, "Dossier des QR codes", os.path.expanduser("~")
+            )
+        elif output == qr_batch.OUTPUT_SHEET:
+            path, _ = QFileDialog.getSaveFileName(
+                self, "Enregistrer la planche",
+                os.path.expanduser("~/qr_codes.png"), "PNG (*.png)"
+            )
+        else:
+            path, _ = QFileDialog.getSaveFileName(
+                self, "Enregistrer le PDF",
+                os.path.expanduser("~/qr_codes.pdf"), "PDF (*.pdf)"
+            )
+        if path:
+            self.txt_path.setText(path)
+
+    def _generate(self):
+        path = self.txt_path.text().strip()
+        if not path:
+            QMessageBox.warning(self, "Attention", "Choisissez une destination.")
+            return
+        options = {
+            "output": self.cmb_output.currentData(),
+            "size": self.spn_size.value(),
+            "columns": self.spn_columns.value(),
+            "path": path,
+        }
+        if self.points is not None:
+            self._start_task(QrBatchTask(self.points, self.crs, options))
+            return
+
+        layer = self._layer()
+        if layer is None:
+            QMessageBox.warning(self, "Attention", "Choisissez une couche de points.")
+            return
+
+        request = QgsFeatureRequest()
+        if self.chk_selected.isChecked():
+            request.setFilterFids(layer.selectedFeatureIds())
+        label_field = self.cmb_label.currentData()
+        if label_field:
+            request.setSubsetOfAttributes([label_field], layer.fields())
+        else:
+            request.setNoAttributes()
+
+        # Source copiée dans le thread GUI, parcourue par la tâche
+        points = layer_points(QgsVectorLayerFeatureSource(layer), request, label_field)
+        self._start_task(QrBatchTask(points, layer.crs(), options))
+
+    def _start_task(self, task):
+        self.task = task
+        task.progressChanged.connect(lambda p: self.progress.setValue(int(p)))
+        task.resultReady.connect(self._on_task_done)
+        self.progress.setValue(0)
+        self.progress.setVisible(True)
+        self.btn_cancel.setVisible(True)
+        self.btn_generate.setEnabled(False)
+        QgsApplication.taskManager().addTask(task)
+
+    def _on_task_done(self, result):
+        task, self.task = self.task, None
+        self.progress.setVisible(False)
+        self.btn_cancel.setVisible(False)
+        self.btn_generate.setEnabled(True)
+
+        if result is not None:
+            files = result["files"]
+            where = files[0] if len(files) == 1 else os.path.dirname(files[0])
+            QMessageBox.information(
+                self, "Succès",
+                f"{result['count']} QR code(s) générés.\n"
+                f"{len(files)} fichier(s) écrit(s) :\n{where}"
+            )
+        elif task.exception is not None:
+            QMessageBox.warning(
+                self, "Erreur",
+                f"Erreur pendant la génération :\n{str(task.exception)}"
+            )
+
+    def _cancel_task(self):
+        if self.task is not None:
+            self.task.cancel()
+
+    def done(self, result):
+        """Annule le traitement en cours à la fermeture du dialogue."""
+        self._cancel_task()
+        super().done(result)
+
+
+class QRLocationMapTool(QgsMapToolEmitPoint):
+    """
+    Outil de carte pour capturer les clics.
+    - Mode simple : un clic -> dialogue du QR code, puis l'outil se désactive
+    - Mode multiple : chaque clic ajoute un point marqué sur la carte ;
+      clic droit ou Entrée -> génération groupée, Retour arrière -> retire
+      le dernier point, Échap -> abandon
+    """
+
+    def __init__(self, canvas, iface, multi=False):
         super().__init__(canvas)
         self.canvas = canvas
         self.iface = iface
+        self.multi = multi
+        self.captured = []   # points dans le SCR du canevas
+        self.markers = []
 
     def canvasReleaseEvent(self, event):
         """Appelé quand l'utilisateur clique sur la carte."""
+        if self.multi:
+            if event.button() == Qt.RightButton:
+                self._finish()
+            else:
+                self._add_point(self.toMapCoordinates(event.pos()))
+            return
+
         # Obtenir le point cliqué dans le CRS du canevas
         point = self.toMapCoordinates(event.pos())
 
         # Transformer en WGS84 (EPSG:4326) pour Google Maps
         canvas_crs = self.canvas.mapSettings().destinationCrs()
-        wgs84_crs = QgsCoordinateReferenceSystem("EPSG:4326")
-
-        if canvas_crs != wgs84_crs:
-            transform = QgsCoordinateTransform(
-                canvas_crs,
-                wgs84_crs,
-                QgsProject.instance()
-            )
-            point_wgs84 = transform.transform(point)
-        else:
-            point_wgs84 = point
+        point_wgs84 = transforms.transform_point(point, canvas_crs, "EPSG:4326")
 
         lat = point_wgs84.y()
         lon = point_wgs84.x()
@@ -286,6 +656,62 @@ class QRLocationMapTool(QgsMapToolEmitPoint):
         # Désactiver l'outil après utilisation
         self.canvas.unsetMapTool(self)
 
+    def keyPressEvent(self, event):
+        if not self.multi:
+            return super().keyPressEvent(event)
+        key = event.key()
+        if key in (Qt.Key_Return, Qt.Key_Enter):
+            self._finish()
+        elif key in (Qt.Key_Backspace, Qt.Key_Delete) and self.captured:
+            self.captured.pop()
+            self.canvas.scene().removeItem(self.markers.pop())
+            self.show_status()
+        elif key == Qt.Key_Escape:
+            self.canvas.unsetMapTool(self)
+        else:
+            return super().keyPressEvent(event)
+        event.accept()
+
+    def _add_point(self, point):
+        self.captured.append(point)
+        marker = QgsVertexMarker(self.canvas)
+        marker.setCenter(point)
+        marker.setIconType(QgsVertexMarker.ICON_CROSS)
+        marker.setIconSize(14)
+        marker.setPenWidth(3)
+        marker.setColor(QColor("#e74c3c"))
+        self.markers.append(marker)
+        self.show_status()
+
+    def show_status(self):
+        self.iface.mainWindow().statusBar().showMessage(
+            f"📍 {len(self.captured)} point(s) — clic droit ou Entrée pour générer, "
+            "Retour arrière pour annuler le dernier, Échap pour abandonner"
+        )
+
+    def _clear_markers(self):
+        for marker in self.markers:
+            self.canvas.scene().removeItem(marker)
+        self.markers = []
+
+    def _finish(self):
+        """Génère tous les QR codes capturés en un seul traitement par lots."""
+        points = [(f"P{k + 1}", p.x(), p.y()) for k, p in enumerate(self.captured)]
+        crs = self.canvas.mapSettings().destinationCrs()
+        self.canvas.unsetMapTool(self)
+        if not points:
+            return
+        dlg = QRBatchDialog(self.iface, self.iface.mainWindow(), points=points, crs=crs)
+        dlg.exec_()
+
+    def deactivate(self):
+        """Abandon de la capture : marqueurs retirés, points oubliés."""
+        self._clear_markers()
+        self.captured = []
+        if self.multi:
+            self.iface.mainWindow().statusBar().clearMessage()
+        super().deactivate()
+
 
 class QRLocationModule(BaseModule):
     """Module pour générer des QR codes de localisation."""
@@ -297,6 +723,25 @@ class QRLocationModule(BaseModule):
     def __init__(self, iface, toolbar, plugin_dir):
         super().__init__(iface, toolbar, plugin_dir)
         self.map_tool = None
+        self.batch_action = None
+        self.multi_action = None
+
+    def register(self):
+        """Outil de clic (barre d'outils) + traitement par lots (menu)."""
+        super().register()
+        self.batch_action = QAction(
+            QIcon(self._icon_path()), "QR codes par lots (couche de points)",
+            self.iface.mainWindow()
+        )
+        self.batch_action.triggered.connect(self.run_batch)
+        self.iface.addPluginToMenu("ELFADILY TopoTools", self.batch_action)
+
+        self.multi_action = QAction(
+            QIcon(self._icon_path()), "QR codes de plusieurs points (capture sur la carte)",
+            self.iface.mainWindow()
+        )
+        self.multi_action.triggered.connect(self.run_multi)
+        self.iface.addPluginToMenu("ELFADILY TopoTools", self.multi_action)
 
     def run(self):
         """Active l'outil de sélection sur la carte."""
@@ -315,8 +760,23 @@ class QRLocationModule(BaseModule):
             5000  # 5 secondes
         )
 
+    def run_multi(self):
+        """Active l'outil en capture multiple."""
+        self.map_tool = QRLocationMapTool(self.iface.mapCanvas(), self.iface, multi=True)
+        self.iface.mapCanvas().setMapTool(self.map_tool)
+        self.map_tool.show_status()
+
+    def run_batch(self):
+        """QR codes de toutes les entités d'une couche de points."""
+        dlg = QRBatchDialog(self.iface, self.iface.mainWindow())
+        dlg.exec_()
+
     def unload(self):
         """Nettoie le module."""
+        for action in (self.batch_action, self.multi_action):
+            if action:
+                self.iface.removePluginMenu("ELFADILY TopoTools", action)
+        self.batch_action = self.multi_action = None
         if self.map_tool:
             self.iface.mapCanvas().unsetMapTool(self.map_tool)
             self.map_tool = None
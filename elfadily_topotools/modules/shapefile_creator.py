@@ -28,6 +28,7 @@ from qgis.core import (
 )
 
 from ..base_module import BaseModule
+from ..utils import crs_registry
 
 
 class ShapefileCreatorDialog(QDialog):
@@ -50,17 +51,7 @@ class ShapefileCreatorDialog(QDialog):
         "Multi-Polygone": "MultiPolygon",
     }
 
-    COMMON_CRS = [
-        ("WGS 84 (GPS) - EPSG:4326", "EPSG:4326"),
-        ("WGS 84 / UTM zone 28N - EPSG:32628", "EPSG:32628"),
-        ("WGS 84 / UTM zone 29N - EPSG:32629", "EPSG:32629"),
-        ("WGS 84 / UTM zone 30N - EPSG:32630", "EPSG:32630"),
-        ("Merchich / Nord Maroc - EPSG:26191", "EPSG:26191"),
-        ("Merchich / Sud Maroc - EPSG:26192", "EPSG:26192"),
-        ("Merchich / Sahara Nord - EPSG:26194", "EPSG:26194"),
-        ("Merchich / Sahara Sud - EPSG:26195", "EPSG:26195"),
-        ("Autre (sélection manuelle)...", None),
-    ]
+    COMMON_CRS = crs_registry.COMMON_CRS
 
     # Templates prédéfinis pour les tâches courantes topo
     PRESET_TEMPLATES = {
@@ -325,6 +316,7 @@ class ShapefileCreatorDialog(QDialog):
             dlg = QgsProjectionSelectionDialog(self)
             if dlg.exec_():
                 crs = dlg.crs()
+                crs_registry.register(crs)
                 self.cmb_crs.setItemText(index, f"{crs.description()} - {crs.authid()}")
                 self.cmb_crs.setItemData(index, crs.authid())
 
@@ -573,7 +565,7 @@ class ShapefileCreatorDialog(QDialog):
 
         # CRS
         crs_code = self.cmb_crs.currentData() or "EPSG:4326"
-        crs = QgsCoordinateReferenceSystem(crs_code)
+        crs = crs_registry.get_crs(crs_code)
 
         # Type de géométrie
         geom_key = self.cmb_geom.currentText()
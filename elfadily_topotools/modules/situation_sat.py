@@ -1,32 +1,58 @@
 """
 Module Situation Satellite
 - Capture de la vue courante (le basemap satellite est déjà ouvert par l'équipe)
-- Deux modes : capture simple (PNG/JPEG) ou PDF avec cartouche
+- Deux modes : capture simple (PNG/JPEG/GeoTIFF) ou PDF avec cartouche
+- Capture simple rendue par tuiles : mémoire bornée quelle que soit la
+  taille de l'image
+- Exports en tâche de fond (progression, annulation) : QGIS reste
+  utilisable, notification dans la barre de messages à la fin
+- PDF avec cartouche : seul le fond raster (satellite) est rendu en
+  tâche de fond ; la carte du layout, couches du dessus en vectoriel,
+  est exportée ensuite dans le thread GUI
+- Cache local (MBTiles) des fonds XYZ : l'emprise exportée est
+  préchargée, un nouvel export de la même zone est servi localement
+- Mode atlas : un plan par entité d'une couche (cartouche rempli par
+  expressions [% "champ" %]), plan assemblé pendant le rendu du
+  suivant, PDF séparés ou un seul PDF de plusieurs pages
+- Un seul rendu pour plusieurs formats (PNG, JPEG, GeoTIFF + .tfw,
+  PDF), encodés en parallèle
+- Cache des cartes rendues (emprise, SCR, couches et styles, taille,
+  DPI) : changer le cartouche ou le format ne relance pas le rendu
+- Seules les couches visibles sur l'emprise exportée (étendue, plage
+  d'échelles) sont rendues
+- Mise en page du cartouche construite une fois par format papier
+  (mémoire + modèle .qpt) ; chaque export ne met à jour que la carte
+  et les variables du cartouche
 - Pas de gestion de source satellite - on utilise ce qui est déjà affiché
 """
 
 import os
+import re
 import datetime
+import tempfile
+from contextlib import contextmanager
 from qgis.PyQt.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QGroupBox, QLabel,
     QComboBox, QCheckBox, QSpinBox, QLineEdit, QPushButton,
     QFileDialog, QMessageBox, QFormLayout, QFrame,
     QRadioButton, QWidget, QSizePolicy
 )
-from qgis.PyQt.QtGui import QFont
-from qgis.PyQt.QtCore import Qt, QSize, QEventLoop, QSettings
+from qgis.PyQt.QtGui import QFont, QPainter, QPdfWriter, QPageSize, QPageLayout
+from qgis.PyQt.QtCore import Qt, QSettings, QSizeF, QMarginsF, pyqtSignal
+from qgis.PyQt.QtXml import QDomDocument
 from qgis.core import (
-    QgsProject, QgsVectorLayer,
-    QgsCoordinateTransform, QgsRectangle,
-    QgsLayoutExporter, QgsPrintLayout,
+    Qgis, QgsApplication, QgsTask,
+    QgsExpression, QgsExpressionContext, QgsExpressionContextUtils,
+    QgsProject, QgsVectorLayer, QgsRectangle,
+    QgsLayoutExporter, QgsPrintLayout, QgsReadWriteContext,
     QgsLayoutItemMap, QgsLayoutItemLabel,
-    QgsLayoutItemPicture, QgsLayoutItemShape,
+    QgsLayoutItemPicture, QgsLayoutItemShape, QgsRasterLayer,
     QgsLayoutPoint, QgsLayoutSize, QgsUnitTypes,
-    QgsMapSettings, QgsMapRendererParallelJob,
-    QgsFillSymbol, QgsLayoutMeasurement
+    QgsMapSettings, QgsFillSymbol, QgsLayoutMeasurement
 )
 
 from ..base_module import BaseModule
+from ..utils import basemap_cache, map_cache, tile_cache, tiled_render, transforms
 
 
 class SituationSatDialog(QDialog):
@@ -92,6 +118,13 @@ class SituationSatDialog(QDialog):
         h_buffer.addStretch()
         ext_layout.addLayout(h_buffer)
 
+        self.chk_tile_cache = QCheckBox("Cache local des fonds de carte (tuiles XYZ)")
+        self.chk_tile_cache.setToolTip(
+            "Les tuiles de la zone sont gardées sur le disque : "
+            "un nouvel export de la même zone ne les télécharge plus."
+        )
+        ext_layout.addWidget(self.chk_tile_cache)
+
         grp_extent.setLayout(ext_layout)
         layout.addWidget(grp_extent)
 
@@ -99,7 +132,7 @@ class SituationSatDialog(QDialog):
         grp_mode = QGroupBox("Mode d'export")
         mode_layout = QVBoxLayout()
 
-        self.rb_simple = QRadioButton("Capture simple (image PNG/JPEG)")
+        self.rb_simple = QRadioButton("Capture simple (image PNG/JPEG/GeoTIFF/PDF)")
         self.rb_cartouche = QRadioButton("PDF avec cartouche professionnel")
         self.rb_simple.setChecked(True)
         self.rb_simple.toggled.connect(self._on_mode_changed)
@@ -114,16 +147,22 @@ class SituationSatDialog(QDialog):
         simple_layout = QFormLayout()
 
         self.cmb_format = QComboBox()
-        self.cmb_format.addItems(["PNG", "JPEG"])
+        self.cmb_format.addItems(tiled_render.FORMATS.keys())
         simple_layout.addRow("Format :", self.cmb_format)
 
+        # Formats supplémentaires, encodés depuis le même rendu
+        row, self.chk_formats = self._format_checks(tiled_render.FORMATS)
+        simple_layout.addRow("Aussi en :", row)
+        self.cmb_format.currentTextChanged.connect(self._on_format_changed)
+        self._on_format_changed(self.cmb_format.currentText())
+
         self.spn_dpi = QSpinBox()
         self.spn_dpi.setRange(72, 600)
         self.spn_dpi.setValue(300)
         simple_layout.addRow("Résolution (DPI) :", self.spn_dpi)
 
         self.spn_width = QSpinBox()
-        self.spn_width.setRange(500, 10000)
+        self.spn_width.setRange(500, 50000)
         self.spn_width.setValue(2000)
         simple_layout.addRow("Largeur (px) :", self.spn_width)
 
@@ -171,6 +210,27 @@ class SituationSatDialog(QDialog):
         h_logo.addWidget(btn_logo)
         cart_form.addRow("Logo :", h_logo)
 
+        row, self.chk_cart_formats = self._format_checks(("PNG", "JPEG", "GeoTIFF"))
+        cart_form.addRow("Carte aussi en :", row)
+
+        # Atlas : un plan par entité de la couche choisie ci-dessus
+        self.chk_atlas = QCheckBox("Atlas : un plan par entité de la couche")
+        self.chk_atlas.setToolTip(
+            "Les champs du cartouche acceptent les expressions QGIS, "
+            'ex. Projet : Lot [% "num_lot" %]'
+        )
+        self.chk_atlas.toggled.connect(self._on_atlas_toggled)
+        cart_form.addRow("", self.chk_atlas)
+
+        self.cmb_atlas_output = QComboBox()
+        self.cmb_atlas_output.addItem("Un PDF par entité (dossier)", "separate")
+        self.cmb_atlas_output.addItem("Un seul PDF (une page par entité)", "merged")
+        cart_form.addRow("Sortie atlas :", self.cmb_atlas_output)
+
+        self.txt_atlas_name = QLineEdit("situation_[% $id %]")
+        cart_form.addRow("Nom des fichiers :", self.txt_atlas_name)
+        self._on_atlas_toggled(False)
+
         self.grp_cart.setLayout(cart_form)
         self.grp_cart.setVisible(False)
         layout.addWidget(self.grp_cart)
@@ -232,6 +292,25 @@ class SituationSatDialog(QDialog):
         # Recalculer la taille pour éviter que le dialogue grandisse
         self.setFixedHeight(self.sizeHint().height())
 
+    @staticmethod
+    def _format_checks(formats):
+        """Ligne de cases à cocher, une par format d'image."""
+        row = QHBoxLayout()
+        checks = {}
+        for fmt in formats:
+            checks[fmt] = QCheckBox(fmt)
+            row.addWidget(checks[fmt])
+        row.addStretch()
+        return row, checks
+
+    def _on_format_changed(self, fmt):
+        for name, chk in self.chk_formats.items():
+            chk.setEnabled(name != fmt)
+
+    def _on_atlas_toggled(self, checked):
+        self.cmb_atlas_output.setEnabled(checked)
+        self.txt_atlas_name.setEnabled(checked)
+
     def _populate_layers(self):
         """Remplit la liste des couches vectorielles du projet."""
         self.cmb_layers.clear()
@@ -255,6 +334,10 @@ class SituationSatDialog(QDialog):
         self.txt_soc_devise.setText(s.value(p + "soc_devise", "TOPOGRAPHIE - SIG - ETUDES"))
         self.txt_soc_adresse.setText(s.value(p + "soc_adresse", "LAAYOUNE"))
         self.txt_logo.setText(s.value(p + "logo_path", ""))
+        self.chk_tile_cache.setChecked(s.value(p + "tile_cache", True, type=bool))
+        extra = s.value(p + "extra_formats", "").split(",")
+        for name, chk in self.chk_formats.items():
+            chk.setChecked(name in extra)
 
     def _save_settings(self):
         """Sauvegarde les valeurs pour la prochaine ouverture."""
@@ -264,6 +347,10 @@ class SituationSatDialog(QDialog):
         s.setValue(p + "soc_devise", self.txt_soc_devise.text())
         s.setValue(p + "soc_adresse", self.txt_soc_adresse.text())
         s.setValue(p + "logo_path", self.txt_logo.text())
+        s.setValue(p + "tile_cache", self.chk_tile_cache.isChecked())
+        s.setValue(p + "extra_formats", ",".join(
+            name for name, chk in self.chk_formats.items() if chk.isChecked()
+        ))
 
     def reject(self):
         """Sauvegarde les paramètres en fermant."""
@@ -287,22 +374,14 @@ class SituationSatDialog(QDialog):
                 layer = QgsProject.instance().mapLayer(layer_id)
                 if layer:
                     canvas_crs = self.iface.mapCanvas().mapSettings().destinationCrs()
-                    transform = QgsCoordinateTransform(
-                        layer.crs(), canvas_crs, QgsProject.instance()
+                    return transforms.transform_extent(
+                        layer.extent(), layer.crs(), canvas_crs
                     )
-                    return transform.transformBoundingBox(layer.extent())
         return self.iface.mapCanvas().extent()
 
     def _get_buffered_extent(self):
         """Emprise + marge en %."""
-        extent = self._get_extent()
-        buf = self.spn_buffer.value() / 100.0
-        dx = extent.width() * buf / 2
-        dy = extent.height() * buf / 2
-        return QgsRectangle(
-            extent.xMinimum() - dx, extent.yMinimum() - dy,
-            extent.xMaximum() + dx, extent.yMaximum() + dy
-        )
+        return buffer_extent(self._get_extent(), self.spn_buffer.value())
 
     # ----------------------------------------------------------------
     # Preview
@@ -322,14 +401,28 @@ class SituationSatDialog(QDialog):
         self._save_settings()
         if self.rb_simple.isChecked():
             self._do_export_simple()
+        elif self.chk_atlas.isChecked():
+            self._do_export_atlas()
         else:
             self._do_export_cartouche()
 
-    # ---------- EXPORT SIMPLE (PNG / JPEG) ----------
+    # ---------- EXPORT SIMPLE (PNG / JPEG / GeoTIFF) ----------
+
+    def _map_settings(self, dpi):
+        """Clone les settings du canevas (garde toutes les couches visibles)."""
+        ms = QgsMapSettings(self.iface.mapCanvas().mapSettings())
+        ms.setOutputDpi(dpi)
+        return ms
+
+    @staticmethod
+    def _render_key(settings, extent, width, fingerprint=None):
+        """Clé du cache des rendus ; les couches sont suivies pour l'invalidation."""
+        map_cache.watch(settings.layers())
+        return map_cache.map_key(settings, extent, width, fingerprint)
 
     def _do_export_simple(self):
         fmt = self.cmb_format.currentText()
-        ext = "jpg" if fmt == "JPEG" else "png"
+        ext = tiled_render.FORMATS[fmt][1]
         default_name = f"situation_{datetime.date.today().isoformat()}.{ext}"
 
         file_path, _ = QFileDialog.getSaveFileName(
@@ -340,37 +433,43 @@ class SituationSatDialog(QDialog):
         if not file_path:
             return
 
-        extent = self._get_buffered_extent()
-        width = self.spn_width.value()
-        ratio = extent.height() / extent.width() if extent.width() else 1
-        height = int(width * ratio)
-
-        # Clone les settings du canevas (garde toutes les couches visibles)
-        ms = QgsMapSettings(self.iface.mapCanvas().mapSettings())
-        ms.setExtent(extent)
-        ms.setOutputSize(QSize(width, height))
-        ms.setOutputDpi(self.spn_dpi.value())
-
-        job = QgsMapRendererParallelJob(ms)
-        loop = QEventLoop()
-        job.finished.connect(loop.quit)
-        job.start()
-        loop.exec_()
-
-        img = job.renderedImage()
-        if fmt == "JPEG":
-            img.save(file_path, "JPEG", 95)
-        else:
-            img.save(file_path, "PNG")
-
-        QMessageBox.information(
-            self, "Succès",
-            f"Image exportée :\n{file_path}\n"
-            f"Taille : {width} x {height} px"
+        # Un seul rendu, encodé dans chaque format coché (même nom de fichier)
+        extra = [name for name, chk in self.chk_formats.items()
+                 if chk.isChecked() and name != fmt]
+        outputs = [(fmt, file_path)] + sibling_outputs(file_path, extra)
+
+        # Rendu par tuiles en tâche de fond (QGIS reste utilisable)
+        extent, width = self._get_buffered_extent(), self.spn_width.value()
+        settings = tiled_render.prune_layers(self._map_settings(self.spn_dpi.value()), extent, width)
+        task = SituationRenderTask(
+            "Situation satellite : image", settings, extent, width, outputs,
+            use_cache=self.chk_tile_cache.isChecked(),
+            cache_key=self._render_key(settings, extent, width)
         )
+        iface = self.iface
+        start_task(task, lambda result: _on_image_done(iface, task, result))
+        self._export_started()
 
     # ---------- EXPORT PDF AVEC CARTOUCHE ----------
 
+    def _cartouche_options(self):
+        """Valeurs du cartouche, figées au lancement de l'export."""
+        return {
+            "paper_size": self.PAPER_SIZES[self.cmb_paper.currentText()],
+            "dpi": self.spn_dpi_cart.value(),
+            "titre": self.txt_titre.text(),
+            "projet": self.txt_projet.text(),
+            "commune": self.txt_commune.text(),
+            "client": self.txt_client.text(),
+            "operateur": self.txt_operateur.text(),
+            "logo": self.txt_logo.text().strip(),
+            "societe": [
+                self.txt_soc_nom.text().strip(),
+                self.txt_soc_devise.text().strip(),
+                self.txt_soc_adresse.text().strip(),
+            ],
+        }
+
     def _do_export_cartouche(self):
         default_name = f"situation_{datetime.date.today().isoformat()}.pdf"
         file_path, _ = QFileDialog.getSaveFileName(
@@ -381,299 +480,981 @@ class SituationSatDialog(QDialog):
         if not file_path:
             return
 
-        project = QgsProject.instance()
-        manager = project.layoutManager()
+        options = self._cartouche_options()
+        dpi = options["dpi"]
+        frame = cartouche_geometry(*options["paper_size"])
+        width = int(round(frame["map_w"] / 25.4 * dpi))
+        height = int(round(frame["map_h"] / 25.4 * dpi))
+        extent = tiled_render.fit_extent(self._get_buffered_extent(), width, height)
+        crs = self.iface.mapCanvas().mapSettings().destinationCrs()
+
+        # Seul le fond raster (partie longue : satellite) est rendu en tâche
+        # de fond ; les couches du dessus restent dans la carte du layout,
+        # exportée en vectoriel dans le thread GUI
+        upper, basemap = split_basemap(self._map_settings(dpi))
+        upper = tiled_render.prune_layers(upper, extent, width)
+        basemap = tiled_render.prune_layers(basemap, extent, width)
+        layer_ids = [layer.id() for layer in upper.layers()]
+        # La carte du cadre peut aussi être gardée en image
+        extra = [name for name, chk in self.chk_cart_formats.items() if chk.isChecked()]
+        outputs = sibling_outputs(file_path, extra)
+        iface = self.iface
+        if not basemap.layers() and not outputs:
+            self.accept()
+            _export_pdf(iface, options, layer_ids, None, extent, crs, file_path)
+            return
+
+        if not basemap.layers():
+            basemap = None
+        task = CartoucheMapTask(
+            "Situation satellite : PDF", upper, basemap, extent, width, outputs,
+            use_cache=self.chk_tile_cache.isChecked(),
+            cache_key=self._render_key(basemap, extent, width) if basemap else None
+        )
+        start_task(task, lambda result: _on_map_rendered(
+            iface, task, result, options, layer_ids, extent, crs, file_path
+        ))
+        self._export_started()
 
-        # Créer un layout temporaire et l'enregistrer dans le manager
-        # (nécessaire pour que l'export fonctionne correctement)
-        ts = datetime.datetime.now().strftime('%H%M%S')
-        layout_name = f"_TopoTools_Situation_{ts}"
-        layout = QgsPrintLayout(project)
-        layout.initializeDefaults()
-        layout.setName(layout_name)
-        manager.addLayout(layout)
+    # ---------- ATLAS : UN PLAN PAR ENTITÉ ----------
 
-        try:
-            self._build_cartouche_layout(layout)
+    def _do_export_atlas(self):
+        layer_id = self.cmb_layers.currentData()
+        layer = QgsProject.instance().mapLayer(layer_id) if layer_id else None
+        if layer is None:
+            QMessageBox.warning(self, "Attention", "Choisissez la couche de l'atlas.")
+            return
 
-            # Export PDF
-            exporter = QgsLayoutExporter(layout)
-            pdf_settings = QgsLayoutExporter.PdfExportSettings()
-            pdf_settings.dpi = self.spn_dpi_cart.value()
+        merged = self.cmb_atlas_output.currentData() == "merged"
+        if merged:
+            default_name = f"atlas_situation_{datetime.date.today().isoformat()}.pdf"
+            target, _ = QFileDialog.getSaveFileName(
+                self, "Enregistrer l'atlas",
+                os.path.expanduser(f"~/{default_name}"), "PDF (*.pdf)"
+            )
+        else:
+            target = QFileDialog.getExistingDirectory(
+                self, "Dossier des plans", os.path.expanduser("~")
+            )
+        if not target:
+            return
 
-            result = exporter.exportToPdf(file_path, pdf_settings)
+        options = self._cartouche_options()
+        dpi = options["dpi"]
+        frame = cartouche_geometry(*options["paper_size"])
+        width = int(round(frame["map_w"] / 25.4 * dpi))
+        height = int(round(frame["map_h"] / 25.4 * dpi))
+        canvas_crs = self.iface.mapCanvas().mapSettings().destinationCrs()
 
-            if result == QgsLayoutExporter.Success:
-                QMessageBox.information(
-                    self, "Succès",
-                    f"PDF avec cartouche exporté :\n{file_path}"
-                )
-            else:
-                error_map = {
-                    QgsLayoutExporter.FileError: "Erreur d'accès au fichier",
-                    QgsLayoutExporter.MemoryError: "Mémoire insuffisante",
-                    QgsLayoutExporter.PrintError: "Erreur d'impression",
-                    QgsLayoutExporter.SvgLayerError: "Erreur couche SVG",
-                    QgsLayoutExporter.Canceled: "Export annulé",
-                }
-                err_msg = error_map.get(result, f"Erreur inconnue (code {result})")
-                QMessageBox.warning(
-                    self, "Erreur",
-                    f"Échec de l'export PDF :\n{err_msg}"
-                )
+        # Emprises et textes du cartouche évalués entité par entité
+        context = QgsExpressionContext(
+            QgsExpressionContextUtils.globalProjectLayerScopes(layer)
+        )
+        # Fond raster rendu en tâche de fond, couches du dessus dans le layout
+        upper, basemap = split_basemap(self._map_settings(dpi))
+        map_cache.watch(basemap.layers())
+        fingerprint = map_cache.layers_fingerprint(basemap.layers())
+        names = set()
+        jobs = []
+        for feature in layer.getFeatures():
+            geom = feature.geometry()
+            if geom.isNull() or geom.isEmpty():
+                continue
+            context.setFeature(feature)
+            extent = transforms.transform_extent(geom.boundingBox(), layer.crs(), canvas_crs)
+            extent = buffer_extent(extent, self.spn_buffer.value(), canvas_crs.isGeographic())
+
+            name = _safe_name(expand_text(self.txt_atlas_name.text(), context), names)
+            extent = tiled_render.fit_extent(extent, width, height)
+            # Couches réduites à celles visibles sur ce plan
+            job_basemap = tiled_render.prune_layers(basemap, extent, width)
+            jobs.append({
+                "extent": extent,
+                "basemap": job_basemap if job_basemap.layers() else None,
+                "layers": [layer.id() for layer in
+                           tiled_render.prune_layers(upper, extent, width).layers()],
+                "key": map_cache.map_key(basemap, extent, width, fingerprint),
+                "options": expand_options(options, context),
+                "image": None,        # fond rendu (GeoTIFF), fixé par la tâche
+                "temporary": False,   # fond hors cache, supprimé après le plan
+                "pdf": None if merged else os.path.join(target, f"{name}.pdf"),
+            })
+        if not jobs:
+            QMessageBox.warning(self, "Attention", "La couche ne contient aucune géométrie.")
+            return
+
+        task = SituationAtlasTask(
+            f"Atlas de situation ({len(jobs)} plans)",
+            jobs, width, use_cache=self.chk_tile_cache.isChecked()
+        )
+        writer = AtlasWriter(jobs, options, canvas_crs, target if merged else None)
+        task.mapReady.connect(writer.add)
+        iface = self.iface
+        start_task(task, lambda result: _on_atlas_done(iface, task, writer, result))
+        self._export_started()
+
+    def _export_started(self):
+        """Ferme le dialogue : l'export continue dans le gestionnaire de tâches."""
+        self.iface.messageBar().pushMessage(
+            "Situation satellite",
+            "Export lancé en arrière-plan (progression et annulation dans la barre d'état).",
+            Qgis.Info, 5
+        )
+        self.accept()
 
-        except Exception as e:
-            QMessageBox.warning(
-                self, "Erreur",
-                f"Erreur lors de la création du layout :\n{str(e)}"
-            )
 
-        finally:
-            # Nettoyer : retirer le layout temporaire du manager
-            manager.removeLayout(layout)
+# ----------------------------------------------------------------
+# Exports en tâche de fond
+# ----------------------------------------------------------------
 
-    def _build_cartouche_layout(self, layout):
-        """Construit le layout complet : carte + cartouche."""
+_running = set()  # tâches lancées : références gardées jusqu'à leur fin
 
-        paper_name = self.cmb_paper.currentText()
-        pw, ph = self.PAPER_SIZES[paper_name]
 
-        # --- Configurer la page ---
-        page = layout.pageCollection().page(0)
-        page.setPageSize(QgsLayoutSize(pw, ph, QgsUnitTypes.LayoutMillimeters))
+def sibling_outputs(path, formats):
+    """[(format, chemin)] : même nom de fichier que path, extension du format."""
+    stem = os.path.splitext(path)[0]
+    return [(fmt, f"{stem}.{tiled_render.FORMATS[fmt][1]}") for fmt in formats]
 
-        # --- Dimensions ---
-        margin = 5        # marge extérieure (mm)
-        cart_h = 35        # hauteur du cartouche (mm)
-        gap = 2            # espace entre carte et cartouche
 
-        map_x = margin
-        map_y = margin
-        map_w = pw - 2 * margin
-        map_h = ph - margin - cart_h - gap - margin
+class SituationRenderTask(QgsTask):
+    """
+    Tâche de fond : rendu par tuiles de la carte, encodé dans un ou
+    plusieurs fichiers outputs [(format, chemin), ...].
+    """
 
-        cart_x = margin
-        cart_y = map_y + map_h + gap
-        cart_w = map_w
+    resultReady = pyqtSignal(object)
 
-        # ============================================================
-        # 1. CARTE
-        # ============================================================
-        map_item = QgsLayoutItemMap(layout)
-        map_item.attemptMove(
-            QgsLayoutPoint(map_x, map_y, QgsUnitTypes.LayoutMillimeters)
+    def __init__(self, description, settings, extent, width, outputs,
+                 use_cache=False, cache_key=None):
+        super().__init__(description, QgsTask.CanCancel)
+        self.settings = settings
+        self.extent = extent
+        self.width = width
+        self.outputs = outputs
+        self.use_cache = use_cache
+        self.cache_key = cache_key
+        self.renders = map_cache.cache() if cache_key else None
+        # Jobs de rendu préparés dans le thread GUI (créé ici, thread GUI)
+        self.preparer = tiled_render.JobPreparer()
+        self.result = None
+        self.exception = None
+
+    def run(self):
+        try:
+            self.result = render_map(
+                self.settings, self.extent, self.width, self.outputs,
+                use_cache=self.use_cache, renders=self.renders, key=self.cache_key,
+                progress=self.setProgress, is_canceled=self.isCanceled,
+                preparer=self.preparer
+            )
+        except (tiled_render.Canceled, tile_cache.Canceled):
+            return False
+        except Exception as e:
+            self.exception = e
+            return False
+        return True
+
+    def finished(self, ok):
+        self.resultReady.emit(self.result if ok else None)
+
+
+def render_map(settings, extent, width, outputs, use_cache=False, renders=None, key=None,
+               progress=None, is_canceled=None, preparer=None):
+    """
+    Rend la carte dans outputs (voir tiled_render.render_to_files) :
+    - carte déjà dans le cache des rendus (renders, clé key) : encodage seul
+    - sinon rendu, précédé si use_cache du préchargement des fonds XYZ
+      (0-30 %), puis conservé dans le cache des rendus
+    preparer : tiled_render.JobPreparer de la tâche (jobs préparés dans
+    le thread GUI). Retourne (largeur, hauteur).
+    """
+    progress = progress or (lambda p: None)
+    layer_ids = [layer.id() for layer in settings.layers()]
+    if renders is not None:
+        cached = renders.get(key, layer_ids)
+        if cached:
+            tiled_render.encode(cached, outputs, settings.outputDpi(), progress, is_canceled)
+            return width, tiled_render.image_extent(extent, width)[1]
+
+    work = renders.reserve(key) if renders is not None else None
+    result = _render(settings, extent, width, outputs, work, use_cache, progress, is_canceled,
+                     preparer)
+    if work is not None and renders.commit(key, work, layer_ids) == work:
+        renders.discard(work)   # trop gros pour le cache
+    return result
+
+
+def render_basemap(settings, extent, width, use_cache=False, renders=None, key=None,
+                   progress=None, is_canceled=None, preparer=None):
+    """
+    Fond de carte en GeoTIFF, servi directement depuis le cache des rendus
+    (renders, clé key) ou rendu puis mis en cache.
+    Retourne (chemin, temporaire) : un fichier temporaire (hors cache) est
+    à supprimer après usage (remove_render). preparer : voir render_map.
+    """
+    progress = progress or (lambda p: None)
+    layer_ids = [layer.id() for layer in settings.layers()]
+    if renders is not None:
+        cached = renders.get(key, layer_ids)
+        if cached:
+            return cached, False
+        work = renders.reserve(key)
+    else:
+        handle, work = tempfile.mkstemp(suffix=".tif")
+        os.close(handle)
+    _render(settings, extent, width, [], work, use_cache, progress, is_canceled, preparer)
+    if renders is None:
+        return work, True
+    path = renders.commit(key, work, layer_ids)
+    return path, path == work   # trop gros pour le cache : temporaire
+
+
+def _render(settings, extent, width, outputs, work, use_cache, progress, is_canceled,
+            preparer):
+    """Rendu par tuiles, précédé si use_cache du préchargement des fonds XYZ (0-30 %)."""
+    # local_layers : couches MBTiles gardées en vie jusqu'à la fin du rendu
+    local_layers = []
+    render_progress = progress
+    if use_cache:
+        full, _, _ = tiled_render.image_extent(extent, width)
+        settings, local_layers = basemap_cache.use_cache(
+            settings, full, width,
+            progress=lambda p: progress(0.3 * p), is_canceled=is_canceled
         )
-        map_item.attemptResize(
-            QgsLayoutSize(map_w, map_h, QgsUnitTypes.LayoutMillimeters)
+        render_progress = lambda p: progress(30 + 0.7 * p)
+
+    result = tiled_render.render_to_files(
+        settings, extent, width, outputs,
+        progress=render_progress, is_canceled=is_canceled, work=work, preparer=preparer
+    )
+    del local_layers
+    return result
+
+
+def split_basemap(settings):
+    """
+    Sépare les couches de settings en deux QgsMapSettings : les couches du
+    dessus, et le fond de carte (suite de couches raster en bas de la
+    liste : satellite, orthophoto...).
+    """
+    layers = settings.layers()   # du dessus vers le bas
+    count = len(layers)
+    while count and isinstance(layers[count - 1], QgsRasterLayer):
+        count -= 1
+    upper, basemap = QgsMapSettings(settings), QgsMapSettings(settings)
+    upper.setLayers(layers[:count])
+    basemap.setLayers(layers[count:])
+    return upper, basemap
+
+
+def basemap_layer(path, crs):
+    """Fond déjà rendu (GeoTIFF) en couche raster hors projet."""
+    layer = QgsRasterLayer(path, "Fond de carte", "gdal")
+    if not layer.isValid():
+        raise IOError(f"Fond de carte illisible : {path}")
+    layer.setCrs(crs)
+    return layer
+
+
+def remove_render(path):
+    """Supprime un GeoTIFF temporaire et ses fichiers annexes (.tfw, .aux.xml)."""
+    for name in (path, os.path.splitext(path)[0] + ".tfw", path + ".aux.xml"):
+        if os.path.exists(name):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+
+class CartoucheMapTask(QgsTask):
+    """
+    Tâche de fond de l'export avec cartouche : fond de carte (basemap,
+    None s'il n'y en a pas) rendu en GeoTIFF ou repris du cache des rendus,
+    puis images « carte aussi en » outputs (couches du dessus + ce fond).
+    Le PDF est exporté ensuite dans le thread GUI, avec la carte du layout
+    (voir _on_map_rendered).
+    """
+
+    resultReady = pyqtSignal(object)
+
+    def __init__(self, description, upper, basemap, extent, width, outputs,
+                 use_cache=False, cache_key=None):
+        super().__init__(description, QgsTask.CanCancel)
+        self.upper = upper
+        self.basemap = basemap
+        self.extent = extent
+        self.width = width
+        self.path = None          # GeoTIFF du fond
+        self.temporary = False    # à supprimer après l'export (hors cache)
+        self.outputs = outputs
+        self.use_cache = use_cache
+        self.cache_key = cache_key
+        self.renders = map_cache.cache() if cache_key else None
+        self.preparer = tiled_render.JobPreparer()   # thread GUI
+        self.result = None
+        self.exception = None
+
+    def run(self):
+        # Progression : fond 0-60 %, images 60-100 % (ou l'un des deux seul)
+        has_basemap = self.basemap is not None
+        share = 60.0 if has_basemap and self.outputs else (100.0 if has_basemap else 0.0)
+        try:
+            if has_basemap:
+                self.path, self.temporary = render_basemap(
+                    self.basemap, self.extent, self.width,
+                    use_cache=self.use_cache, renders=self.renders, key=self.cache_key,
+                    progress=lambda p: self.setProgress(share * p / 100),
+                    is_canceled=self.isCanceled, preparer=self.preparer
+                )
+            if self.outputs:
+                layers = self.upper.layers()
+                if self.path:
+                    layers = layers + [basemap_layer(self.path, self.upper.destinationCrs())]
+                settings = QgsMapSettings(self.upper)
+                settings.setLayers(layers)
+                tiled_render.render_to_files(
+                    settings, self.extent, self.width, self.outputs,
+                    progress=lambda p: self.setProgress(share + (100 - share) * p / 100),
+                    is_canceled=self.isCanceled, preparer=self.preparer
+                )
+        except (tiled_render.Canceled, tile_cache.Canceled):
+            return False
+        except Exception as e:
+            self.exception = e
+            return False
+        self.result = {"basemap": self.path, "images": [path for _, path in self.outputs]}
+        return True
+
+    def finished(self, ok):
+        self.resultReady.emit(self.result if ok else None)
+
+
+def start_task(task, on_done):
+    """
+    Lance une tâche dans le gestionnaire de tâches de QGIS ; on_done(résultat)
+    est appelé dans le thread GUI, même si le dialogue a été fermé.
+    """
+    _running.add(task)
+
+    def done(result):
+        _running.discard(task)
+        on_done(result)
+
+    task.resultReady.connect(done)
+    QgsApplication.taskManager().addTask(task)
+
+
+def _message(iface, text, level, duration=10):
+    iface.messageBar().pushMessage("Situation satellite", text, level, duration)
+
+
+def _report_failure(iface, task):
+    if task.exception is not None:
+        _message(iface, f"Échec de l'export : {task.exception}", Qgis.Critical, 0)
+    else:
+        _message(iface, "Export annulé.", Qgis.Info, 5)
+
+
+def _on_image_done(iface, task, result):
+    if result is None:
+        _report_failure(iface, task)
+        return
+    width, height = result
+    paths = ", ".join(path for _, path in task.outputs)
+    _message(iface, f"Image exportée ({width} x {height} px) : {paths}", Qgis.Success)
+
+
+def map_layers(layer_ids, basemap, crs):
+    """
+    Couches de la carte du layout (thread GUI) : couches du projet encore
+    présentes, puis le fond rendu basemap (GeoTIFF, ou None).
+    """
+    project = QgsProject.instance()
+    layers = [project.mapLayer(layer_id) for layer_id in layer_ids]
+    layers = [layer for layer in layers if layer is not None]
+    if basemap:
+        layers.append(basemap_layer(basemap, crs))
+    return layers
+
+
+def _export_pdf(iface, options, layer_ids, basemap, extent, crs, pdf_path, images=()):
+    """Export PDF avec la vraie carte du layout (thread GUI)."""
+    try:
+        layers = map_layers(layer_ids, basemap, crs)
+    except IOError as e:
+        error = str(e)
+    else:
+        error = export_cartouche_pdf(options, layers, extent, crs, pdf_path)
+        del layers   # fond libéré avant la suppression de son fichier
+
+    if error:
+        _message(iface, f"Échec de l'export PDF : {error}", Qgis.Critical, 0)
+        return
+    text = f"PDF avec cartouche exporté : {pdf_path}"
+    if images:
+        text += f" (carte : {', '.join(images)})"
+    _message(iface, text, Qgis.Success)
+
+
+def _on_map_rendered(iface, task, result, options, layer_ids, extent, crs, pdf_path):
+    """Fond de carte rendu : export PDF (thread GUI)."""
+    try:
+        if result is None:
+            _report_failure(iface, task)
+            return
+        _export_pdf(iface, options, layer_ids, result["basemap"], extent, crs,
+                    pdf_path, result["images"])
+    finally:
+        if task.temporary:
+            remove_render(task.path)
+
+
+# ----------------------------------------------------------------
+# Modèles de mise en page (un par format papier)
+# ----------------------------------------------------------------
+
+TEMPLATE_VERSION = 3   # à incrémenter à chaque modification de build_cartouche_layout
+_templates = {}        # (largeur, hauteur) mm -> QgsPrintLayout réutilisé
+
+
+def template_path(pw, ph):
+    """Modèle .qpt d'un format papier, dans le profil QGIS."""
+    return os.path.join(
+        QgsApplication.qgisSettingsDirPath(), "elfadily_topotools", "layouts",
+        f"situation_v{TEMPLATE_VERSION}_{pw:g}x{ph:g}.qpt"
+    )
+
+
+def _load_template(layout, path):
+    if not os.path.exists(path):
+        return False
+    with open(path, encoding="utf-8") as f:
+        doc = QDomDocument()
+        if not doc.setContent(f.read()):
+            return False
+    _, ok = layout.loadFromTemplate(doc, QgsReadWriteContext())
+    # Modèle d'une ancienne version (carte en image) : reconstruit
+    return (ok and all(layout.itemById(item_id) for item_id in CARTOUCHE_ITEMS)
+            and isinstance(layout.itemById("carte"), QgsLayoutItemMap))
+
+
+def cartouche_template(paper_size):
+    """
+    Mise en page du cartouche pour un format papier : construite une seule
+    fois (ou relue depuis son .qpt), puis gardée en mémoire.
+    La mise en page n'est pas ajoutée au projet : elle n'y est pas enregistrée.
+    """
+    paper_size = tuple(paper_size)
+    layout = _templates.get(paper_size)
+    if layout is not None:
+        return layout
+
+    project = QgsProject.instance()
+    path = template_path(*paper_size)
+    layout = QgsPrintLayout(project)
+    if not _load_template(layout, path):
+        layout = QgsPrintLayout(project)
+        layout.initializeDefaults()
+        build_cartouche_layout(layout, paper_size)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            layout.saveAsTemplate(path, QgsReadWriteContext())
+        except OSError:
+            pass  # le modèle sur disque est facultatif
+    layout.setName("_TopoTools_Situation_{:g}x{:g}".format(*paper_size))
+    _templates[paper_size] = layout
+    return layout
+
+
+def clear_templates():
+    _templates.clear()
+
+
+def fill_cartouche(layout, options, layers, extent, crs):
+    """Met à jour la carte (couches, emprise, SCR) et les variables du cartouche."""
+    info_parts = []
+    if options["projet"]:
+        info_parts.append(f"Projet: {options['projet']}")
+    if options["commune"]:
+        info_parts.append(f"Commune: {options['commune']}")
+    if options["client"]:
+        info_parts.append(f"Client: {options['client']}")
+    if options["operateur"]:
+        info_parts.append(f"Opérateur: {options['operateur']}")
+    info_parts.append(f"Date: {datetime.date.today().strftime('%d/%m/%Y')}")
+    soc_parts = [part for part in options["societe"] if part]
+
+    for name, value in (
+        ("topo_titre", options["titre"] or "PLAN DE SITUATION"),
+        ("topo_info", "\n".join(info_parts)),
+        ("topo_societe", "\n".join(soc_parts)),
+    ):
+        QgsExpressionContextUtils.setLayoutVariable(layout, name, value)
+    layout.itemById("societe").setVisibility(bool(soc_parts))
+
+    logo_path = options["logo"]
+    has_logo = bool(logo_path and os.path.exists(logo_path))
+    logo = layout.itemById("logo")
+    if logo.picturePath() != (logo_path if has_logo else ""):
+        logo.setPicturePath(logo_path if has_logo else "")   # relu seulement s'il change
+    logo.setVisibility(has_logo)
+
+    # Carte du modèle : seules ses couches, son emprise et son SCR changent
+    carte = layout.itemById("carte")
+    carte.setCrs(crs)
+    carte.setLayers(layers)
+    carte.setExtent(extent)
+    layout.refresh()
+
+
+@contextmanager
+def cartouche_layout(options, layers, extent, crs):
+    """Mise en page du format papier, remplie pour un export (thread GUI)."""
+    layout = cartouche_template(options["paper_size"])
+    fill_cartouche(layout, options, layers, extent, crs)
+    try:
+        yield layout
+    finally:
+        # Ne pas retenir les couches (fond de carte temporaire)
+        layout.itemById("carte").setLayers([])
+
+
+def export_cartouche_pdf(options, layers, extent, crs, pdf_path):
+    """Exporte le layout en PDF, carte comprise (thread GUI).
+    Retourne None si tout va bien, sinon le message d'erreur."""
+    try:
+        with cartouche_layout(options, layers, extent, crs) as layout:
+            exporter = QgsLayoutExporter(layout)
+            pdf_settings = QgsLayoutExporter.PdfExportSettings()
+            pdf_settings.dpi = options["dpi"]
+            result = exporter.exportToPdf(pdf_path, pdf_settings)
+    except Exception as e:
+        return f"Erreur lors de la création du layout : {str(e)}"
+
+    if result == QgsLayoutExporter.Success:
+        return None
+    error_map = {
+        QgsLayoutExporter.FileError: "Erreur d'accès au fichier",
+        QgsLayoutExporter.MemoryError: "Mémoire insuffisante",
+        QgsLayoutExporter.PrintError: "Erreur d'impression",
+        QgsLayoutExporter.SvgLayerError: "Erreur couche SVG",
+        QgsLayoutExporter.Canceled: "Export annulé",
+    }
+    return error_map.get(result, f"Erreur inconnue (code {result})")
+
+
+# ----------------------------------------------------------------
+# Atlas
+# ----------------------------------------------------------------
+
+TEXT_OPTIONS = ("titre", "projet", "commune", "client", "operateur")
+
+
+def buffer_extent(extent, percent, geographic=False):
+    """Emprise + marge en % ; une emprise ponctuelle reçoit une taille minimale."""
+    minimum = 0.001 if geographic else 100.0
+    if extent.width() < minimum or extent.height() < minimum:
+        c = extent.center()
+        half_w = max(extent.width(), minimum) / 2
+        half_h = max(extent.height(), minimum) / 2
+        extent = QgsRectangle(c.x() - half_w, c.y() - half_h, c.x() + half_w, c.y() + half_h)
+    buf = percent / 100.0
+    dx = extent.width() * buf / 2
+    dy = extent.height() * buf / 2
+    return QgsRectangle(
+        extent.xMinimum() - dx, extent.yMinimum() - dy,
+        extent.xMaximum() + dx, extent.yMaximum() + dy
+    )
+
+
+def expand_text(text, context):
+    """Remplace les expressions [% ... %] d'un texte pour l'entité du contexte."""
+    return QgsExpression.replaceExpressionText(text, context) if "[%" in text else text
+
+
+def expand_options(options, context):
+    expanded = dict(options)
+    for key in TEXT_OPTIONS:
+        expanded[key] = expand_text(options[key], context)
+    expanded["societe"] = [expand_text(part, context) for part in options["societe"]]
+    return expanded
+
+
+def _safe_name(name, used):
+    base = re.sub(r"[^\w\-.]+", "_", name).strip("._") or "plan"
+    candidate, count = base, 0
+    while candidate.lower() in used:
+        count += 1
+        candidate = f"{base}_{count}"
+    used.add(candidate.lower())
+    return candidate
+
+
+class SituationAtlasTask(QgsTask):
+    """
+    Tâche de fond : fonds de carte de l'atlas rendus l'un après l'autre
+    (un seul job de rendu QGIS à la fois, préparé dans le thread GUI),
+    chaque plan étant assemblé dans le thread GUI pendant le rendu du suivant.
+    """
+
+    resultReady = pyqtSignal(object)
+    mapReady = pyqtSignal(int, bool)   # index du plan, rendu réussi
+
+    def __init__(self, description, jobs, width, use_cache=False):
+        super().__init__(description, QgsTask.CanCancel)
+        self.jobs = jobs
+        self.width = width
+        self.use_cache = use_cache
+        self.renders = map_cache.cache()
+        self.preparer = tiled_render.JobPreparer()   # thread GUI
+        self.result = None
+        self.exception = None
+
+    def _render(self, index):
+        job = self.jobs[index]
+        if job["basemap"] is None:
+            return   # pas de fond raster sur ce plan
+        job["image"], job["temporary"] = render_basemap(
+            job["basemap"], job["extent"], self.width,
+            use_cache=self.use_cache, renders=self.renders, key=job["key"],
+            is_canceled=self.isCanceled, preparer=self.preparer
         )
 
-        # IMPORTANT : assigner explicitement les couches visibles du canevas
-        canvas = self.iface.mapCanvas()
-        visible_layers = canvas.layers()
-        map_item.setLayers(visible_layers)
-        map_item.setCrs(canvas.mapSettings().destinationCrs())
+    def run(self):
+        failed = []
+        for index in range(len(self.jobs)):
+            if self.isCanceled():
+                return False
+            try:
+                self._render(index)
+                ok = True
+            except (tiled_render.Canceled, tile_cache.Canceled):
+                return False
+            except Exception as e:
+                failed.append((index, str(e)))
+                ok = False
+            self.mapReady.emit(index, ok)
+            self.setProgress(100.0 * (index + 1) / len(self.jobs))
+        self.result = {"count": len(self.jobs), "failed": failed}
+        return True
+
+    def finished(self, ok):
+        self.resultReady.emit(self.result if ok else None)
+
+
+class AtlasWriter:
+    """
+    Assemble les plans de l'atlas (thread GUI) au fur et à mesure que les
+    fonds de carte sont rendus (dans l'ordre des entités) : un PDF par
+    entité, ou une page par entité d'un PDF unique.
+    """
+
+    def __init__(self, jobs, options, crs, merged_path=None):
+        self.jobs = jobs
+        self.crs = crs
+        self.merged_path = merged_path
+        self.written = 0
+        self.errors = []
+        self.writer = None
+        self.painter = None
+        if merged_path:
+            pw, ph = options["paper_size"]
+            self.writer = QPdfWriter(merged_path)
+            self.writer.setPageSize(QPageSize(QSizeF(pw, ph), QPageSize.Millimeter))
+            self.writer.setPageMargins(QMarginsF(0, 0, 0, 0), QPageLayout.Millimeter)
+            self.writer.setResolution(options["dpi"])
+            self.writer.setTitle(options["titre"] or "PLAN DE SITUATION")
+
+    def add(self, index, ok):
+        if ok:
+            if self.writer is None:
+                self._export_separate(index)
+            else:
+                self._append_page(index)
+        self._discard(index)
 
-        # Définir l'emprise
-        map_item.setExtent(self._get_buffered_extent())
+    def _export_separate(self, index):
+        job = self.jobs[index]
+        try:
+            layers = map_layers(job["layers"], job["image"], self.crs)
+        except IOError as e:
+            error = str(e)
+        else:
+            error = export_cartouche_pdf(job["options"], layers, job["extent"], self.crs, job["pdf"])
+        if error:
+            self.errors.append(f"{os.path.basename(job['pdf'])} : {error}")
+        else:
+            self.written += 1
 
-        # Cadre
-        map_item.setFrameEnabled(True)
-        map_item.setFrameStrokeWidth(
-            QgsLayoutMeasurement(0.3, QgsUnitTypes.LayoutMillimeters)
-        )
-        map_item.setBackgroundEnabled(True)
-
-        layout.addLayoutItem(map_item)
-
-        # Forcer le rendu
-        map_item.refresh()
-
-        # ============================================================
-        # 2. FLECHE NORD (coin haut-droit de la carte)
-        # ============================================================
-        north = QgsLayoutItemPicture(layout)
-
-        # Chercher la flèche nord dans les SVG de QGIS
-        from qgis.core import QgsApplication
-        north_svg_path = None
-        for svg_dir in QgsApplication.svgPaths():
-            for candidate in ['arrows/NorthArrow_02.svg',
-                              'arrows/NorthArrow_01.svg',
-                              'arrows/north_arrow.svg']:
-                full = os.path.join(svg_dir, candidate)
-                if os.path.exists(full):
-                    north_svg_path = full
-                    break
-            if north_svg_path:
-                break
+    def _append_page(self, index):
+        job = self.jobs[index]
+        try:
+            layers = map_layers(job["layers"], job["image"], self.crs)
+            with cartouche_layout(job["options"], layers, job["extent"], self.crs) as layout:
+                if self.painter is None:
+                    self.painter = QPainter(self.writer)
+                else:
+                    self.writer.newPage()
+                QgsLayoutExporter(layout).renderPage(self.painter, 0)
+            self.written += 1
+        except Exception as e:
+            self.errors.append(f"Page {index + 1} : {e}")
+
+    def _discard(self, index):
+        job = self.jobs[index]
+        if job["temporary"]:
+            remove_render(job["image"])
+
+    def close(self):
+        """Termine le PDF unique et supprime les fonds temporaires restants."""
+        if self.painter is not None:
+            self.painter.end()
+            self.painter = None
+        self.writer = None
+        for index in range(len(self.jobs)):
+            self._discard(index)
+
+
+def _on_atlas_done(iface, task, writer, result):
+    writer.close()
+    if result is None:
+        _report_failure(iface, task)
+        return
+    failed = len(result["failed"]) + len(writer.errors)
+    where = writer.merged_path or os.path.dirname(writer.jobs[0]["pdf"])
+    text = f"Atlas : {writer.written} plan(s) exporté(s) : {where}"
+    if failed:
+        details = [f"plan {k + 1} : {e}" for k, e in result["failed"]] + writer.errors
+        _message(iface, f"{text} — {failed} échec(s) ({details[0]}...)", Qgis.Warning, 0)
+    else:
+        _message(iface, text, Qgis.Success)
+
+
+def cartouche_geometry(pw, ph):
+    """Position et taille (mm) du cadre carte et du cartouche sur la page."""
+    margin = 5        # marge extérieure (mm)
+    cart_h = 35        # hauteur du cartouche (mm)
+    gap = 2            # espace entre carte et cartouche
+
+    map_w = pw - 2 * margin
+    map_h = ph - margin - cart_h - gap - margin
+    return {
+        "map_x": margin, "map_y": margin, "map_w": map_w, "map_h": map_h,
+        "cart_x": margin, "cart_y": margin + map_h + gap,
+        "cart_w": map_w, "cart_h": cart_h,
+    }
 
-        # Fallback : flèche nord intégrée au plugin
-        if not north_svg_path:
-            north_svg_path = os.path.join(
-                os.path.dirname(os.path.dirname(__file__)),
-                'icons', 'north_arrow.svg'
-            )
 
-        north.setPicturePath(north_svg_path)
+# Éléments du modèle mis à jour à chaque export (voir fill_cartouche)
+CARTOUCHE_ITEMS = ("carte", "logo", "titre", "infos", "societe")
+
+
+def build_cartouche_layout(layout, paper_size):
+    """
+    Construit le layout complet : carte (couches et emprise fixées par
+    fill_cartouche) + cartouche. Les textes sont des variables de
+    mise en page (@topo_titre, @topo_info, @topo_societe).
+    """
+    pw, ph = paper_size
+
+    # --- Configurer la page ---
+    page = layout.pageCollection().page(0)
+    page.setPageSize(QgsLayoutSize(pw, ph, QgsUnitTypes.LayoutMillimeters))
+
+    # --- Dimensions ---
+    frame = cartouche_geometry(pw, ph)
+    map_x, map_y = frame["map_x"], frame["map_y"]
+    map_w, map_h = frame["map_w"], frame["map_h"]
+    cart_x, cart_y = frame["cart_x"], frame["cart_y"]
+    cart_w, cart_h = frame["cart_w"], frame["cart_h"]
+
+    # ============================================================
+    # 1. CARTE (fond rendu en tâche de fond + couches du dessus)
+    # ============================================================
+    map_item = QgsLayoutItemMap(layout)
+    map_item.setId("carte")
+    # Couches fixées à chaque export (fill_cartouche), pas celles du projet
+    map_item.setKeepLayerSet(True)
+    map_item.setFollowVisibilityPreset(False)
+    map_item.attemptMove(
+        QgsLayoutPoint(map_x, map_y, QgsUnitTypes.LayoutMillimeters)
+    )
+    map_item.attemptResize(
+        QgsLayoutSize(map_w, map_h, QgsUnitTypes.LayoutMillimeters)
+    )
+
+    # Cadre
+    map_item.setFrameEnabled(True)
+    map_item.setFrameStrokeWidth(
+        QgsLayoutMeasurement(0.3, QgsUnitTypes.LayoutMillimeters)
+    )
+    map_item.setBackgroundEnabled(True)
+
+    layout.addLayoutItem(map_item)
+
+    # ============================================================
+    # 2. FLECHE NORD (coin haut-droit de la carte)
+    # ============================================================
+    north = QgsLayoutItemPicture(layout)
+
+    # Chercher la flèche nord dans les SVG de QGIS
+    north_svg_path = None
+    for svg_dir in QgsApplication.svgPaths():
+        for candidate in ['arrows/NorthArrow_02.svg',
+                          'arrows/NorthArrow_01.svg',
+                          'arrows/north_arrow.svg']:
+            full = os.path.join(svg_dir, candidate)
+            if os.path.exists(full):
+                north_svg_path = full
+                break
+        if north_svg_path:
+            break
+
+    # Fallback : flèche nord intégrée au plugin
+    if not north_svg_path:
+        north_svg_path = os.path.join(
+            os.path.dirname(os.path.dirname(__file__)),
+            'icons', 'north_arrow.svg'
+        )
 
-        north_size = 12  # mm
-        north.attemptMove(QgsLayoutPoint(
-            map_x + map_w - north_size - 3,
-            map_y + 3,
-            QgsUnitTypes.LayoutMillimeters
+    north.setPicturePath(north_svg_path)
+
+    north_size = 12  # mm
+    north.attemptMove(QgsLayoutPoint(
+        map_x + map_w - north_size - 3,
+        map_y + 3,
+        QgsUnitTypes.LayoutMillimeters
+    ))
+    north.attemptResize(QgsLayoutSize(
+        north_size, north_size, QgsUnitTypes.LayoutMillimeters
+    ))
+    north.setFrameEnabled(False)
+    layout.addLayoutItem(north)
+
+    # ============================================================
+    # 3. CADRE DU CARTOUCHE (rectangle de fond)
+    # ============================================================
+    cart_rect = QgsLayoutItemShape(layout)
+    cart_rect.setShapeType(QgsLayoutItemShape.Rectangle)
+    cart_rect.attemptMove(
+        QgsLayoutPoint(cart_x, cart_y, QgsUnitTypes.LayoutMillimeters)
+    )
+    cart_rect.attemptResize(
+        QgsLayoutSize(cart_w, cart_h, QgsUnitTypes.LayoutMillimeters)
+    )
+    sym = QgsFillSymbol.createSimple({
+        'color': '255,255,255,255',
+        'outline_color': '0,0,0,255',
+        'outline_width': '0.4',
+    })
+    cart_rect.setSymbol(sym)
+    cart_rect.setFrameEnabled(False)
+    layout.addLayoutItem(cart_rect)
+
+    # ============================================================
+    # 4. CONTENU DU CARTOUCHE
+    #    | Logo | Infos projet | Titre | Bureau |
+    # ============================================================
+
+    pad = 2  # padding interne
+
+    # Calculer les colonnes
+    col1_x = cart_x + pad          # Logo
+    col1_w = 28
+    col2_x = col1_x + col1_w + pad  # Infos projet
+    col2_w = cart_w * 0.32
+    col4_w = cart_w * 0.22          # Bureau (droite)
+    col4_x = cart_x + cart_w - col4_w - pad
+    col3_x = col2_x + col2_w + pad  # Titre (centre)
+    col3_w = col4_x - col3_x - pad
+
+    row_y = cart_y + pad
+    row_h = cart_h - 2 * pad
+
+    # --- Logo (masqué s'il n'y en a pas) ---
+    logo = QgsLayoutItemPicture(layout)
+    logo.setId("logo")
+    logo.attemptMove(QgsLayoutPoint(
+        col1_x + 2, row_y + 2, QgsUnitTypes.LayoutMillimeters
+    ))
+    logo.attemptResize(QgsLayoutSize(
+        col1_w - 4, row_h - 4, QgsUnitTypes.LayoutMillimeters
+    ))
+    logo.setFrameEnabled(False)
+    layout.addLayoutItem(logo)
+
+    # --- Infos projet (colonne 2) ---
+    lbl_info = QgsLayoutItemLabel(layout)
+    lbl_info.setId("infos")
+    lbl_info.setText("[% @topo_info %]")
+    lbl_info.setFont(QFont("Arial", 7))
+    lbl_info.setVAlign(Qt.AlignTop)
+    lbl_info.attemptMove(QgsLayoutPoint(
+        col2_x, row_y, QgsUnitTypes.LayoutMillimeters
+    ))
+    lbl_info.attemptResize(QgsLayoutSize(
+        col2_w, row_h, QgsUnitTypes.LayoutMillimeters
+    ))
+    lbl_info.setFrameEnabled(False)
+    layout.addLayoutItem(lbl_info)
+
+    # --- Titre (colonne 3, centré) ---
+    lbl_titre = QgsLayoutItemLabel(layout)
+    lbl_titre.setId("titre")
+    lbl_titre.setText("[% @topo_titre %]")
+    lbl_titre.setFont(QFont("Arial", 12, QFont.Bold))
+    lbl_titre.setHAlign(Qt.AlignCenter)
+    lbl_titre.setVAlign(Qt.AlignVCenter)
+    lbl_titre.attemptMove(QgsLayoutPoint(
+        col3_x, row_y, QgsUnitTypes.LayoutMillimeters
+    ))
+    lbl_titre.attemptResize(QgsLayoutSize(
+        col3_w, row_h, QgsUnitTypes.LayoutMillimeters
+    ))
+    lbl_titre.setFrameEnabled(False)
+    layout.addLayoutItem(lbl_titre)
+
+    # --- Société (colonne 4, droite ; masquée si vide) ---
+    lbl_bureau = QgsLayoutItemLabel(layout)
+    lbl_bureau.setId("societe")
+    lbl_bureau.setText("[% @topo_societe %]")
+    # Nom en gras : on met tout en même police,
+    # le nom est la première ligne et ressort naturellement
+    lbl_bureau.setFont(QFont("Arial", 7))
+    lbl_bureau.setHAlign(Qt.AlignCenter)
+    lbl_bureau.setVAlign(Qt.AlignVCenter)
+    lbl_bureau.attemptMove(QgsLayoutPoint(
+        col4_x, row_y, QgsUnitTypes.LayoutMillimeters
+    ))
+    lbl_bureau.attemptResize(QgsLayoutSize(
+        col4_w, row_h, QgsUnitTypes.LayoutMillimeters
+    ))
+    lbl_bureau.setFrameEnabled(False)
+    layout.addLayoutItem(lbl_bureau)
+
+    # --- Lignes séparatrices verticales ---
+    sep_positions = [
+        col1_x + col1_w,    # après logo
+        col2_x + col2_w,    # après infos
+        col4_x - pad,       # avant bureau
+    ]
+    for sx in sep_positions:
+        vline = QgsLayoutItemShape(layout)
+        vline.setShapeType(QgsLayoutItemShape.Rectangle)
+        vline.attemptMove(QgsLayoutPoint(
+            sx, cart_y, QgsUnitTypes.LayoutMillimeters
         ))
-        north.attemptResize(QgsLayoutSize(
-            north_size, north_size, QgsUnitTypes.LayoutMillimeters
+        vline.attemptResize(QgsLayoutSize(
+            0.3, cart_h, QgsUnitTypes.LayoutMillimeters
         ))
-        north.setFrameEnabled(False)
-        layout.addLayoutItem(north)
-
-        # ============================================================
-        # 3. CADRE DU CARTOUCHE (rectangle de fond)
-        # ============================================================
-        cart_rect = QgsLayoutItemShape(layout)
-        cart_rect.setShapeType(QgsLayoutItemShape.Rectangle)
-        cart_rect.attemptMove(
-            QgsLayoutPoint(cart_x, cart_y, QgsUnitTypes.LayoutMillimeters)
-        )
-        cart_rect.attemptResize(
-            QgsLayoutSize(cart_w, cart_h, QgsUnitTypes.LayoutMillimeters)
-        )
-        sym = QgsFillSymbol.createSimple({
-            'color': '255,255,255,255',
+        line_sym = QgsFillSymbol.createSimple({
+            'color': '0,0,0,255',
             'outline_color': '0,0,0,255',
-            'outline_width': '0.4',
+            'outline_width': '0',
         })
-        cart_rect.setSymbol(sym)
-        cart_rect.setFrameEnabled(False)
-        layout.addLayoutItem(cart_rect)
-
-        # ============================================================
-        # 4. CONTENU DU CARTOUCHE
-        #    | Logo | Infos projet | Titre | Bureau |
-        # ============================================================
-
-        pad = 2  # padding interne
-
-        # Calculer les colonnes
-        col1_x = cart_x + pad          # Logo
-        col1_w = 28
-        col2_x = col1_x + col1_w + pad  # Infos projet
-        col2_w = cart_w * 0.32
-        col4_w = cart_w * 0.22          # Bureau (droite)
-        col4_x = cart_x + cart_w - col4_w - pad
-        col3_x = col2_x + col2_w + pad  # Titre (centre)
-        col3_w = col4_x - col3_x - pad
-
-        row_y = cart_y + pad
-        row_h = cart_h - 2 * pad
-
-        # --- Logo ---
-        logo_path = self.txt_logo.text().strip()
-        if logo_path and os.path.exists(logo_path):
-            logo = QgsLayoutItemPicture(layout)
-            logo.setPicturePath(logo_path)
-            logo.attemptMove(QgsLayoutPoint(
-                col1_x + 2, row_y + 2, QgsUnitTypes.LayoutMillimeters
-            ))
-            logo.attemptResize(QgsLayoutSize(
-                col1_w - 4, row_h - 4, QgsUnitTypes.LayoutMillimeters
-            ))
-            logo.setFrameEnabled(False)
-            layout.addLayoutItem(logo)
-
-        # --- Infos projet (colonne 2) ---
-        info_parts = []
-        if self.txt_projet.text():
-            info_parts.append(f"Projet: {self.txt_projet.text()}")
-        if self.txt_commune.text():
-            info_parts.append(f"Commune: {self.txt_commune.text()}")
-        if self.txt_client.text():
-            info_parts.append(f"Client: {self.txt_client.text()}")
-        if self.txt_operateur.text():
-            info_parts.append(f"Opérateur: {self.txt_operateur.text()}")
-        info_parts.append(f"Date: {datetime.date.today().strftime('%d/%m/%Y')}")
-
-        lbl_info = QgsLayoutItemLabel(layout)
-        lbl_info.setText("\n".join(info_parts))
-        lbl_info.setFont(QFont("Arial", 7))
-        lbl_info.setVAlign(Qt.AlignTop)
-        lbl_info.attemptMove(QgsLayoutPoint(
-            col2_x, row_y, QgsUnitTypes.LayoutMillimeters
-        ))
-        lbl_info.attemptResize(QgsLayoutSize(
-            col2_w, row_h, QgsUnitTypes.LayoutMillimeters
-        ))
-        lbl_info.setFrameEnabled(False)
-        layout.addLayoutItem(lbl_info)
-
-        # --- Titre (colonne 3, centré) ---
-        lbl_titre = QgsLayoutItemLabel(layout)
-        lbl_titre.setText(self.txt_titre.text() or "PLAN DE SITUATION")
-        lbl_titre.setFont(QFont("Arial", 12, QFont.Bold))
-        lbl_titre.setHAlign(Qt.AlignCenter)
-        lbl_titre.setVAlign(Qt.AlignVCenter)
-        lbl_titre.attemptMove(QgsLayoutPoint(
-            col3_x, row_y, QgsUnitTypes.LayoutMillimeters
-        ))
-        lbl_titre.attemptResize(QgsLayoutSize(
-            col3_w, row_h, QgsUnitTypes.LayoutMillimeters
-        ))
-        lbl_titre.setFrameEnabled(False)
-        layout.addLayoutItem(lbl_titre)
-
-        # --- Société (colonne 4, droite) ---
-        soc_parts = []
-        nom = self.txt_soc_nom.text().strip()
-        devise = self.txt_soc_devise.text().strip()
-        adresse = self.txt_soc_adresse.text().strip()
-        if nom:
-            soc_parts.append(nom)
-        if devise:
-            soc_parts.append(devise)
-        if adresse:
-            soc_parts.append(adresse)
-
-        if soc_parts:
-            lbl_bureau = QgsLayoutItemLabel(layout)
-            lbl_bureau.setText("\n".join(soc_parts))
-            # Nom en gras : on met tout en même police,
-            # le nom est la première ligne et ressort naturellement
-            lbl_bureau.setFont(QFont("Arial", 7))
-            lbl_bureau.setHAlign(Qt.AlignCenter)
-            lbl_bureau.setVAlign(Qt.AlignVCenter)
-            lbl_bureau.attemptMove(QgsLayoutPoint(
-                col4_x, row_y, QgsUnitTypes.LayoutMillimeters
-            ))
-            lbl_bureau.attemptResize(QgsLayoutSize(
-                col4_w, row_h, QgsUnitTypes.LayoutMillimeters
-            ))
-            lbl_bureau.setFrameEnabled(False)
-            layout.addLayoutItem(lbl_bureau)
-
-        # --- Lignes séparatrices verticales ---
-        sep_positions = [
-            col1_x + col1_w,    # après logo
-            col2_x + col2_w,    # après infos
-            col4_x - pad,       # avant bureau
-        ]
-        for sx in sep_positions:
-            vline = QgsLayoutItemShape(layout)
-            vline.setShapeType(QgsLayoutItemShape.Rectangle)
-            vline.attemptMove(QgsLayoutPoint(
-                sx, cart_y, QgsUnitTypes.LayoutMillimeters
-            ))
-            vline.attemptResize(QgsLayoutSize(
-                0.3, cart_h, QgsUnitTypes.LayoutMillimeters
-            ))
-            line_sym = QgsFillSymbol.createSimple({
-                'color': '0,0,0,255',
-                'outline_color': '0,0,0,255',
-                'outline_width': '0',
-            })
-            vline.setSymbol(line_sym)
-            vline.setFrameEnabled(False)
-            layout.addLayoutItem(vline)
+        vline.setSymbol(line_sym)
+        vline.setFrameEnabled(False)
+        layout.addLayoutItem(vline)
 
 
 class SituationSatModule(BaseModule):
@@ -684,3 +1465,11 @@ class SituationSatModule(BaseModule):
     def run(self):
         dlg = SituationSatDialog(self.iface, self.iface.mainWindow())
         dlg.exec_()
+
+    def unload(self):
+        """Annule les exports encore en cours et libère les mises en page."""
+        for task in list(_running):
+            task.cancel()
+        clear_templates()
+        map_cache.unwatch_all()
+        super().unload()
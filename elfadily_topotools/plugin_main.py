@@ -31,6 +31,12 @@ class ElfadilyTopoTools:
         self.toolbar.setObjectName("ElfadilyTopoToolsToolbar")
         self.toolbar.setToolTip(f"{self.PLUGIN_NAME} v{self.VERSION}")
 
+        # SCR courants résolus une fois, cache de transformations partagé
+        from qgis.core import QgsProject
+        from .utils import crs_registry, transforms
+        crs_registry.preload()
+        transforms.watch_project(QgsProject.instance())
+
         # ============================================================
         # ENREGISTREMENT DES MODULES
         # Pour ajouter un nouveau module, il suffit d'ajouter une ligne ici
@@ -73,6 +79,11 @@ class ElfadilyTopoTools:
             except Exception:
                 pass
 
+        from qgis.core import QgsProject
+        from .utils import crs_registry, transforms
+        transforms.unwatch_project(QgsProject.instance())
+        crs_registry.clear()
+
         # Supprimer la toolbar
         if self.toolbar:
             del self.toolbar
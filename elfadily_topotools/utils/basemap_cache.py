@@ -0,0 +1,138 @@
+"""
+Fonds de carte XYZ servis depuis le cache local (utils/tile_cache).
+- Repère les couches XYZ (fournisseur « wms », type=xyz) d'un rendu
+- Précharge les tuiles de l'emprise exportée au niveau de zoom adapté
+  à la résolution de sortie
+- Remplace chaque couche XYZ par une couche MBTiles locale pour le rendu :
+  un second export de la même zone ne télécharge plus rien
+- Tuiles en échec au préchargement : la couche XYZ d'origine est
+  gardée pour le rendu (pas de trous dans l'image)
+"""
+
+import os
+
+from qgis.PyQt.QtCore import QUrl
+from qgis.PyQt.QtNetwork import QNetworkRequest
+from qgis.core import (
+    QgsApplication, QgsBlockingNetworkRequest, QgsDataSourceUri,
+    QgsMapSettings, QgsRasterLayer
+)
+
+from . import tile_cache, transforms
+
+
+def cache_directory():
+    return os.path.join(QgsApplication.qgisSettingsDirPath(), "elfadily_topotools", "tiles")
+
+
+def qgis_fetch(url, headers=None):
+    """Téléchargement par le réseau QGIS (proxy, authentification, cache HTTP)."""
+    request = QNetworkRequest(QUrl(url))
+    for name, value in (headers or {}).items():
+        request.setRawHeader(name.encode(), value.encode())
+    blocking = QgsBlockingNetworkRequest()
+    if blocking.get(request) != QgsBlockingNetworkRequest.NoError:
+        return None
+    return bytes(blocking.reply().content())
+
+
+def xyz_source(layer):
+    """(modèle d'URL, zmin, zmax, en-têtes) d'une couche XYZ, sinon None."""
+    if not isinstance(layer, QgsRasterLayer) or layer.providerType() != "wms":
+        return None
+    uri = QgsDataSourceUri()
+    uri.setEncodedUri(layer.source())
+    if uri.param("type") != "xyz":
+        return None
+    template = uri.param("url")
+    if template.startswith("file:") or "{z}" not in template:
+        return None
+    zmin = int(uri.param("zmin") or 0)
+    zmax = int(uri.param("zmax") or 19)
+    headers = {}
+    referer = uri.param("referer") or uri.param("http-header:referer")
+    if referer:
+        headers["Referer"] = referer
+    return template, zmin, zmax, headers
+
+
+def _local_layer(path, zoom, source_layer):
+    uri = QgsDataSourceUri()
+    uri.setParam("type", "mbtiles")
+    uri.setParam("url", QUrl.fromLocalFile(path).toString())
+    # Un seul niveau : celui préchargé pour cet export
+    uri.setParam("zmin", str(zoom))
+    uri.setParam("zmax", str(zoom))
+    layer = QgsRasterLayer(bytes(uri.encodedUri()).decode(), source_layer.name(), "wms")
+    if not layer.isValid():
+        return None
+    layer.renderer().setOpacity(source_layer.renderer().opacity())
+    return layer
+
+
+def use_cache(settings, extent, width, progress=None, is_canceled=None, fetch=None):
+    """
+    Précharge les tuiles de extent (SCR de settings) pour une image de
+    width px, puis retourne (settings modifiés, couches locales). Les
+    couches locales doivent rester en vie pendant le rendu.
+    Sans couche XYZ, settings est retourné tel quel.
+    """
+    sources = [(layer, xyz_source(layer)) for layer in settings.layers()]
+    if not any(source for _, source in sources):
+        return settings, []
+
+    web = transforms.transform_extent(extent, settings.destinationCrs(), "EPSG:3857")
+    resolution = web.width() / width
+
+    replaced, local_layers = [], []
+    count = sum(1 for _, source in sources if source)
+    done = 0
+    for layer, source in sources:
+        if not source:
+            replaced.append(layer)
+            continue
+        template, zmin, zmax, headers = source
+        zoom = tile_cache.zoom_for_resolution(resolution, zmin, zmax)
+        x0, y0, x1, y1 = tile_cache.tile_range(
+            web.xMinimum(), web.yMinimum(), web.xMaximum(), web.yMaximum(), zoom
+        )
+        if (x1 - x0 + 1) * (y1 - y0 + 1) > tile_cache.MAX_TILES:
+            replaced.append(layer)  # trop de tuiles : rendu direct par QGIS
+            continue
+
+        # Une tuile de marge autour de l'emprise (rééchantillonnage au bord)
+        last = 2 ** zoom - 1
+        x0, y0 = max(0, x0 - 1), max(0, y0 - 1)
+        x1, y1 = min(last, x1 + 1), min(last, y1 + 1)
+
+        cache = tile_cache.TileCache(
+            tile_cache.cache_path(cache_directory(), template), template,
+            fetch=fetch or qgis_fetch, headers=headers
+        )
+
+        def step(percent, base=done):
+            if progress:
+                progress((base + percent / 100.0) * 100.0 / count)
+
+        try:
+            _, failed = cache.prefetch(zoom, x0, y0, x1, y1, progress=step, is_canceled=is_canceled)
+        finally:
+            cache.close()
+        done += 1
+        if failed:
+            # Tuiles manquantes : la couche d'origine (réseau) plutôt que des trous
+            replaced.append(layer)
+            continue
+
+        local = _local_layer(cache.path, zoom, layer)
+        if local is None:
+            replaced.append(layer)
+        else:
+            replaced.append(local)
+            local_layers.append(local)
+
+    if not local_layers:
+        return settings, []
+    settings = QgsMapSettings(settings)
+    settings.setLayers(replaced)
+    return settings, local_layers
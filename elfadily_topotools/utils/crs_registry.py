@@ -0,0 +1,64 @@
+"""
+Registre des systèmes de coordonnées partagé par les modules.
+- Un QgsCoordinateReferenceSystem résolu une seule fois par authid
+  (une seule recherche dans proj.db), puis réutilisé
+- Liste COMMON_CRS commune aux dialogues (Maroc), préchargée au démarrage
+- Les SCR choisis manuellement y sont ajoutés
+"""
+
+import threading
+
+from qgis.core import QgsCoordinateReferenceSystem
+
+
+COMMON_CRS = [
+    ("WGS 84 (GPS) - EPSG:4326", "EPSG:4326"),
+    ("WGS 84 / UTM zone 28N - EPSG:32628", "EPSG:32628"),
+    ("WGS 84 / UTM zone 29N - EPSG:32629", "EPSG:32629"),
+    ("WGS 84 / UTM zone 30N - EPSG:32630", "EPSG:32630"),
+    ("Merchich / Nord Maroc - EPSG:26191", "EPSG:26191"),
+    ("Merchich / Sud Maroc - EPSG:26192", "EPSG:26192"),
+    ("Merchich / Sahara Nord - EPSG:26194", "EPSG:26194"),
+    ("Merchich / Sahara Sud - EPSG:26195", "EPSG:26195"),
+    ("Autre (sélection manuelle)...", None),
+]
+
+_registry = {}
+_lock = threading.Lock()
+
+
+def get_crs(authid):
+    """
+    SCR correspondant à un authid (« EPSG:26191 »...).
+    Retourne une copie légère (données partagées) de l'objet enregistré.
+    """
+    with _lock:
+        crs = _registry.get(authid)
+    if crs is None:
+        crs = QgsCoordinateReferenceSystem(authid)
+        if not crs.isValid():
+            return crs
+        with _lock:
+            crs = _registry.setdefault(authid, crs)
+    return QgsCoordinateReferenceSystem(crs)
+
+
+def register(crs):
+    """Ajoute un SCR déjà résolu (sélection manuelle) ; retourne son authid."""
+    authid = crs.authid()
+    if authid and crs.isValid():
+        with _lock:
+            _registry.setdefault(authid, QgsCoordinateReferenceSystem(crs))
+    return authid
+
+
+def preload():
+    """Résout à l'avance les SCR de COMMON_CRS."""
+    for _, authid in COMMON_CRS:
+        if authid:
+            get_crs(authid)
+
+
+def clear():
+    with _lock:
+        _registry.clear()
@@ -0,0 +1,338 @@
+"""
+Construction en masse des entités à partir d'une PointTable.
+- Les QgsPointXY sont créés une seule fois et partagés entre la géométrie
+  principale (polygone / polyligne) et la couche des sommets
+- Les entités ponctuelles sont créées et ajoutées au fournisseur par lots :
+  un seul lot de QgsFeature vit en mémoire à la fois
+- Regroupement : une entité par groupe (parcelle / lot), surfaces et
+  périmètres calculés en masse (voir measures.group_measures)
+- Reprojection optionnelle en bloc vers un SCR cible (celui du projet) :
+  les géométries sont converties une fois, les attributs x / y / z et les
+  mesures restent dans le SCR de saisie
+- Export direct vers un fichier (Shapefile, GeoPackage, FlatGeobuf) par
+  QgsVectorFileWriter, sans couche mémoire intermédiaire
+- Utilisable depuis une QgsTask (progression + annulation)
+"""
+
+import os
+from itertools import islice
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import (
+    QgsFeature, QgsGeometry, QgsPointXY, QgsField, QgsFields, QgsVectorLayer,
+    QgsFillSymbol, QgsLineSymbol, QgsVectorFileWriter, QgsWkbTypes,
+    QgsCoordinateTransformContext
+)
+
+from .measures import group_measures
+from . import crs_registry, transforms
+
+
+def point_fields(grouped=False, reprojected=False):
+    """Champs des couches ponctuelles (points importés / sommets)."""
+    fields = [
+        QgsField("num", QVariant.String),
+        QgsField("x", QVariant.Double),
+        QgsField("y", QVariant.Double),
+        QgsField("z", QVariant.Double),
+    ]
+    if grouped:
+        fields.append(QgsField("groupe", QVariant.String))
+    if reprojected:
+        # x / y / z restent les coordonnées saisies, dans ce SCR
+        fields.append(QgsField("scr_orig", QVariant.String))
+    return fields
+
+
+class Canceled(Exception):
+    """Construction interrompue par l'utilisateur."""
+
+
+# Formats d'export direct : pilote OGR -> (libellé, extension)
+FILE_FORMATS = {
+    "ESRI Shapefile": ("Shapefile", ".shp"),
+    "GPKG": ("GeoPackage", ".gpkg"),
+    "FlatGeobuf": ("FlatGeobuf", ".fgb"),
+}
+
+WKB_TYPES = {
+    "Polygon": QgsWkbTypes.Polygon,
+    "LineString": QgsWkbTypes.LineString,
+    "Point": QgsWkbTypes.Point,
+}
+
+
+class FeatureBuilder:
+    """Crée les couches mémoire d'une PointTable, entités par lots."""
+
+    CHUNK_SIZE = 50000  # entités ajoutées au fournisseur par appel
+
+    def __init__(self, points, crs_code, progress=None, is_canceled=None,
+                 target_crs=None):
+        self.points = points
+        self.crs_code = crs_code
+        # SCR des couches produites : cible de reprojection ou SCR de saisie
+        self.reprojected = bool(target_crs) and target_crs != crs_code
+        self.layer_crs = target_crs if self.reprojected else crs_code
+        self._progress = progress
+        self._is_canceled = is_canceled
+        self._xy = None
+
+    # ----------------------------------------------------------------
+    # Données partagées
+    # ----------------------------------------------------------------
+
+    def xy_points(self):
+        """
+        Liste des QgsPointXY, construite une seule fois (dans le SCR des
+        couches : reprojetée en bloc si nécessaire).
+        """
+        if self._xy is None:
+            xs, ys = self.points.x, self.points.y
+            if self.reprojected:
+                columns = transforms.transform_arrays(
+                    xs, ys, self.crs_code, self.layer_crs,
+                    is_canceled=self._is_canceled
+                )
+                if columns is None:
+                    raise Canceled()
+                xs, ys = columns
+            self._xy = list(map(QgsPointXY, xs, ys))
+        return self._xy
+
+    def _check_canceled(self):
+        if self._is_canceled and self._is_canceled():
+            raise Canceled()
+
+    # ----------------------------------------------------------------
+    # Entités ponctuelles par lots
+    # ----------------------------------------------------------------
+
+    def point_feature_chunks(self):
+        """Génère les entités ponctuelles par lots de CHUNK_SIZE."""
+        pts = self.points
+        total = len(pts)
+        # Géométries reprojetées : toujours depuis la liste partagée
+        shared = self.xy_points() if self.reprojected else self._xy
+        extra = [self.crs_code] if self.reprojected else []
+        from_point = QgsGeometry.fromPointXY
+        for start in range(0, total, self.CHUNK_SIZE):
+            self._check_canceled()
+            stop = min(start + self.CHUNK_SIZE, total)
+            xs, ys, zs = pts.x[start:stop], pts.y[start:stop], pts.z[start:stop]
+            nums = pts.numbers(start, stop)
+            if shared is not None:
+                xy = shared[start:stop]
+            else:
+                xy = map(QgsPointXY, xs, ys)
+            chunk = []
+            if pts.groups is not None:
+                rows = zip(nums, xy, xs, ys, zs, pts.groups[start:stop])
+            else:
+                rows = zip(nums, xy, xs, ys, zs)
+            for num, pt, *attrs in rows:
+                feat = QgsFeature()
+                feat.setGeometry(from_point(pt))
+                feat.setAttributes([num] + attrs + extra)
+                chunk.append(feat)
+            yield chunk
+            if self._progress:
+                self._progress(100.0 * stop / total)
+
+    def add_point_features(self, *layers):
+        """
+        Ajoute les entités ponctuelles aux couches données : chaque lot est
+        construit une fois et partagé entre toutes les couches.
+        """
+        providers = [layer.dataProvider() for layer in layers]
+        for chunk in self.point_feature_chunks():
+            for pr in providers:
+                pr.addFeatures(chunk)
+        for layer in layers:
+            layer.updateExtents()
+
+    # ----------------------------------------------------------------
+    # Couches
+    # ----------------------------------------------------------------
+
+    def _memory_layer(self, geom_type, name, fields):
+        layer = QgsVectorLayer(f"{geom_type}?crs={self.layer_crs}", name, "memory")
+        layer.dataProvider().addAttributes(fields)
+        layer.updateFields()
+        return layer
+
+    def _group_features(self, geom_type):
+        """
+        Une entité par groupe de points (une seule sans regroupement).
+        Surfaces et périmètres viennent d'un calcul en masse.
+        """
+        pts = self.points
+        grouped = pts.groups is not None
+        closed = geom_type == "Polygon"
+        indices = pts.group_indices()
+        measures = group_measures(pts, indices, closed=closed)
+        xy = self.xy_points()
+
+        for fid, (key, rows) in enumerate(indices.items(), 1):
+            if fid % 1000 == 0:
+                self._check_canceled()
+            vertices = xy if not grouped else [xy[i] for i in rows]
+            if closed:
+                geom = QgsGeometry.fromPolygonXY([vertices])
+            else:
+                geom = QgsGeometry.fromPolylineXY(vertices)
+            area, perimeter = measures[key]
+            attrs = [fid]
+            if grouped:
+                attrs.append(key)
+            if closed:
+                attrs += [round(abs(area), 2), round(perimeter, 2)]
+            else:
+                attrs.append(round(perimeter, 2))
+            feat = QgsFeature()
+            feat.setGeometry(geom)
+            feat.setAttributes(attrs)
+            yield feat
+
+    def _chunks(self, features):
+        """Découpe un flux d'entités en lots de CHUNK_SIZE."""
+        while True:
+            chunk = list(islice(features, self.CHUNK_SIZE))
+            if not chunk:
+                break
+            yield chunk
+
+    def _add_chunked(self, layer, features):
+        """Ajoute un flux d'entités au fournisseur par lots de CHUNK_SIZE."""
+        pr = layer.dataProvider()
+        for chunk in self._chunks(features):
+            pr.addFeatures(chunk)
+        layer.updateExtents()
+
+    def fields(self, geom_type):
+        """Champs de la couche principale selon le type de géométrie."""
+        if geom_type == "Point":
+            return point_fields(self.points.groups is not None, self.reprojected)
+        fields = [QgsField("id", QVariant.Int)]
+        if self.points.groups is not None:
+            fields.append(QgsField("groupe", QVariant.String))
+        if geom_type == "Polygon":
+            fields += [
+                QgsField("surface_m2", QVariant.Double),
+                QgsField("perimetre_m", QVariant.Double),
+            ]
+        else:
+            fields.append(QgsField("longueur_m", QVariant.Double))
+        return fields
+
+    def polygon_layer(self):
+        layer = self._memory_layer("Polygon", "Points_Polygone", self.fields("Polygon"))
+        self._add_chunked(layer, self._group_features("Polygon"))
+
+        # Style
+        symbol = QgsFillSymbol.createSimple({
+            'color': '52,152,219,60',
+            'outline_color': '#e74c3c',
+            'outline_width': '0.8'
+        })
+        layer.renderer().setSymbol(symbol)
+        return layer
+
+    def polyline_layer(self):
+        layer = self._memory_layer("LineString", "Points_Polyligne", self.fields("LineString"))
+        self._add_chunked(layer, self._group_features("LineString"))
+
+        symbol = QgsLineSymbol.createSimple({
+            'color': '#e74c3c',
+            'width': '0.8'
+        })
+        layer.renderer().setSymbol(symbol)
+        return layer
+
+    def points_layer(self, name="Points_Import"):
+        """Couche ponctuelle vide (remplie par add_point_features)."""
+        return self._memory_layer("Point", name, self.fields("Point"))
+
+    def vertices_layer(self):
+        """Couche des sommets, étiquetée par le N° de point."""
+        from qgis.core import QgsPalLayerSettings, QgsVectorLayerSimpleLabeling
+        layer = self.points_layer("Sommets")
+        label_settings = QgsPalLayerSettings()
+        label_settings.fieldName = "num"
+        label_settings.isExpression = False
+        labeling = QgsVectorLayerSimpleLabeling(label_settings)
+        layer.setLabeling(labeling)
+        layer.setLabelsEnabled(True)
+        return layer
+
+    def build(self, geom_type, with_vertices=False):
+        """
+        Construit la couche principale et, si demandé, la couche des
+        sommets. Retourne (couche, sommets ou None). Lève Canceled.
+        """
+        if geom_type == "Polygon":
+            layer = self.polygon_layer()
+        elif geom_type == "LineString":
+            layer = self.polyline_layer()
+        else:
+            layer = self.points_layer()
+            self.add_point_features(layer)
+            return layer, None
+
+        vertices = None
+        if with_vertices:
+            vertices = self.vertices_layer()
+            self.add_point_features(vertices)
+        return layer, vertices
+
+    # ----------------------------------------------------------------
+    # Export direct
+    # ----------------------------------------------------------------
+
+    def write_file(self, path, geom_type, driver="ESRI Shapefile"):
+        """
+        Écrit la géométrie principale directement dans un fichier : les
+        entités passent par lots du PointTable au QgsVectorFileWriter,
+        sans couche mémoire ni seconde copie. Lève Canceled ou IOError ;
+        un fichier incomplet est supprimé.
+        """
+        qgs_fields = QgsFields()
+        for field in self.fields(geom_type):
+            qgs_fields.append(field)
+
+        options = QgsVectorFileWriter.SaveVectorOptions()
+        options.driverName = driver
+        options.fileEncoding = "UTF-8"
+        options.layerName = os.path.splitext(os.path.basename(path))[0]
+
+        writer = QgsVectorFileWriter.create(
+            path, qgs_fields, WKB_TYPES[geom_type],
+            crs_registry.get_crs(self.layer_crs),
+            QgsCoordinateTransformContext(), options
+        )
+        if writer.hasError() != QgsVectorFileWriter.NoError:
+            raise IOError(writer.errorMessage())
+
+        if geom_type == "Point":
+            chunks = self.point_feature_chunks()
+        else:
+            chunks = self._chunks(self._group_features(geom_type))
+        try:
+            for chunk in chunks:
+                if not writer.addFeatures(chunk):
+                    raise IOError(writer.errorMessage())
+        except BaseException:
+            writer = None
+            _remove_dataset(path, driver)
+            raise
+        # La destruction du writer ferme et finalise le fichier
+        writer = None
+        return path
+
+
+def _remove_dataset(path, driver):
+    """Supprime un export incomplet (avec ses fichiers annexes)."""
+    if driver == "ESRI Shapefile":
+        QgsVectorFileWriter.deleteShapeFile(path)
+    elif os.path.exists(path):
+        os.remove(path)
@@ -0,0 +1,174 @@
+"""
+Re-parsing incrémental de la zone de saisie (Points → Géométrie).
+- Chaque ligne du texte sait si elle a produit un point (bytearray)
+- Une modification ne re-parse que les lignes touchées ; la PointTable
+  est corrigée sur place (les colonnes sont décalées, pas reconstruites)
+- Les erreurs sont indexées par ligne et suivent les insertions
+- Texte lu par blocs (PointParser.iter_blocks) : jamais la liste de
+  toutes les lignes en mémoire
+- Nombre de points par groupe tenu à jour à chaque modification
+- Le mode « ligne vide = nouveau groupe » dépend des lignes précédentes :
+  il n'est pas pris en charge (re-parsing complet)
+"""
+
+from collections import Counter
+
+from .point_parser import ParseResult, GROUP_BLANK
+from .point_table import PointTable
+
+
+class IncrementalParser:
+    """Parseur qui garde la correspondance lignes de texte → points."""
+
+    # Lignes parsées ensemble ; jamais plus d'erreurs par lot que le
+    # parseur n'en conserve, ce qui garde l'index des erreurs exact.
+    BATCH_LINES = 1000
+
+    def __init__(self, parser):
+        if not self.supports(parser):
+            raise ValueError("Mode de regroupement non incrémental")
+        self.parser = parser
+        self.points = PointTable()
+        self._flags = bytearray()  # 1 si la ligne a produit un point
+        self._errors = {}          # index de ligne -> détail de l'erreur
+        self._groups = None        # clé de groupe -> nombre de points
+        batch = min(self.BATCH_LINES, parser.MAX_ERRORS)
+        self._batch = max(batch, 1)
+
+    @staticmethod
+    def supports(parser):
+        return parser.group_mode != GROUP_BLANK
+
+    def __len__(self):
+        """Nombre de lignes de texte suivies."""
+        return len(self._flags)
+
+    @property
+    def error_count(self):
+        return len(self._errors)
+
+    @property
+    def group_count(self):
+        """Nombre de groupes (None sans colonne de groupe)."""
+        return None if self._groups is None else len(self._groups)
+
+    def result(self):
+        """État courant sous forme de ParseResult (table partagée)."""
+        result = ParseResult()
+        result.points = self.points
+        result.error_count = len(self._errors)
+        lines = sorted(self._errors)[:self.parser.MAX_ERRORS]
+        result.error_lines = [(i + 1, self._errors[i]) for i in lines]
+        result.group_count = self.group_count
+        return result
+
+    def parse(self, text, progress=None, is_canceled=None):
+        """
+        Analyse complète du texte (mêmes arguments que PointParser.parse).
+        Les lignes sont numérotées comme les blocs du document.
+        """
+        size = max(len(text), 1)
+        points = PointTable()
+        flags = bytearray()
+        errors = {}
+        # Même découpage en blocs que PointParser.parse : seules les
+        # lignes du bloc en cours sont matérialisées
+        for block, end in self.parser.iter_blocks(text):
+            lines = block.split("\n")
+            for start in range(0, len(lines), self._batch):
+                table, batch_flags, batch_errors = self._parse_lines(
+                    lines[start:start + self._batch], len(flags))
+                if len(table):
+                    points.extend(table)
+                flags += batch_flags
+                errors.update(batch_errors)
+            if progress:
+                progress(100.0 * min(end + 1, size) / size)
+            if is_canceled and is_canceled():
+                result = ParseResult()
+                result.canceled = True
+                return result
+
+        self.points, self._flags, self._errors = points, flags, errors
+        self._groups = None if points.groups is None else Counter(points.groups)
+        return self.result()
+
+    def update(self, first, count, lines, splice=None):
+        """
+        Remplace les lignes [first, first + count) par lines et corrige la
+        table en conséquence.
+
+        splice : callable(ligne, retirées, ajoutées, apply) optionnel, qui
+                 doit appeler apply() ; permet d'encadrer la modification
+                 (notification d'un modèle Qt). Sans lui, apply est direct.
+        Retourne (1re ligne de la table touchée, retirées, ajoutées).
+        """
+        stop = first + count
+        table = PointTable()
+        batch_flags = bytearray()
+        batch_errors = {}
+        for start in range(0, len(lines), self._batch):
+            t, f, e = self._parse_lines(lines[start:start + self._batch], first + start)
+            if len(t):
+                table.extend(t)
+            batch_flags += f
+            batch_errors.update(e)
+
+        flags = self._flags
+        row = flags.count(1, 0, first)
+        removed = flags.count(1, first, stop)
+        added = len(table)
+
+        def apply():
+            self._count_groups(row, removed, table)
+            self.points.splice(row, row + removed, table)
+            flags[first:stop] = batch_flags
+            shift = len(lines) - count
+            if self._errors or batch_errors:
+                errors = {
+                    (i + shift if i >= stop else i): detail
+                    for i, detail in self._errors.items()
+                    if not first <= i < stop
+                }
+                errors.update(batch_errors)
+                self._errors = errors
+
+        if splice:
+            splice(row, removed, added, apply)
+        else:
+            apply()
+        return row, removed, added
+
+    def _count_groups(self, row, removed, table):
+        """Met à jour le nombre de points par groupe avant un remplacement
+        (coût proportionnel aux lignes modifiées, pas à la table)."""
+        counts = self._groups
+        if counts is None:
+            if table.groups is None:
+                return
+            counts = self._groups = Counter()
+        old = self.points.groups
+        if old is not None and removed:
+            gone = old[row:row + removed]
+            counts.subtract(gone)
+            for key in set(gone):
+                if counts[key] <= 0:
+                    del counts[key]
+        if table.groups is not None:
+            counts.update(table.groups)
+
+    def _parse_lines(self, lines, first):
+        """Parse un lot de lignes : (table, drapeaux, erreurs par ligne)."""
+        result = ParseResult()
+        self.parser.parse_block("\n".join(lines), first + 1, result)
+
+        flags = bytearray(map(bool, map(str.strip, lines)))
+        if any("#" in line for line in lines):
+            for i, line in enumerate(lines):
+                if line.lstrip().startswith("#"):
+                    flags[i] = 0
+        errors = {}
+        for lineno, detail in result.error_lines:
+            flags[lineno - 1 - first] = 0
+            errors[lineno - 1] = detail
+        return result.points, flags, errors
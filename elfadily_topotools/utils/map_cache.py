@@ -0,0 +1,133 @@
+"""
+Cache des cartes rendues par Situation satellite (utils/render_cache).
+- Clé d'un rendu : emprise, SCR, rotation, DPI, taille, fond, plage
+  temporelle, styles imposés (thème de carte), et pour chaque couche :
+  source, filtre, style et révision
+- Révision d'une couche incrémentée (et rendus supprimés) quand elle est
+  redessinée, modifiée ou change de style
+- Rendus gardés d'une session à l'autre seulement si toutes leurs couches
+  sont des fichiers (date de modification dans la clé) ; PostGIS, WFS,
+  XYZ... : rendus valables pour la session en cours seulement
+- Clés calculées dans le thread GUI ; lecture / écriture du cache
+  possibles depuis les tâches de fond
+"""
+
+import os
+import uuid
+
+from qgis.PyQt.QtCore import Qt
+from qgis.core import QgsApplication, QgsMapLayerStyle, QgsVectorLayer
+
+from .render_cache import RenderCache, make_key
+
+
+_cache = None
+_revisions = {}     # id de couche -> révision (modifications dans la session)
+_watched = {}       # id de couche -> [(signal, slot)]
+_session = uuid.uuid4().hex   # marque des sources qui ne sont pas des fichiers
+
+
+def cache():
+    """Cache partagé, dans le profil QGIS (créé au premier appel, thread GUI)."""
+    global _cache
+    if _cache is None:
+        _cache = RenderCache(os.path.join(
+            QgsApplication.qgisSettingsDirPath(), "elfadily_topotools", "renders"
+        ))
+    return _cache
+
+
+def _source_stamp(layer):
+    """
+    Date de modification du fichier de la couche. Sans fichier (base de
+    données, service web), rien ne dit si les données ont changé depuis
+    la dernière session : marque de la session, les rendus sur disque
+    des sessions précédentes ne sont jamais repris (élagués avec l'âge).
+    """
+    path = layer.source().split("|")[0]
+    try:
+        return os.path.getmtime(path) if os.path.isfile(path) else _session
+    except (OSError, ValueError):
+        return _session
+
+
+def layers_fingerprint(layers):
+    """Empreinte des couches d'un rendu (ordre compris) ; thread GUI."""
+    parts = []
+    for layer in layers:
+        style = QgsMapLayerStyle()
+        style.readFromLayer(layer)
+        subset = layer.subsetString() if isinstance(layer, QgsVectorLayer) else ""
+        parts.append((
+            layer.id(), layer.source(), subset, _source_stamp(layer),
+            style.xmlData(), _revisions.get(layer.id(), 0),
+        ))
+    return make_key(tuple(parts))
+
+
+def map_key(settings, extent, width, fingerprint=None):
+    """
+    Clé du rendu de settings (QgsMapSettings) sur extent à width px.
+    fingerprint : empreinte des couches déjà calculée (atlas : une seule
+    fois pour toutes les entités).
+    """
+    if fingerprint is None:
+        fingerprint = layers_fingerprint(settings.layers())
+    crs = settings.destinationCrs()
+    return make_key((
+        extent.xMinimum(), extent.yMinimum(), extent.xMaximum(), extent.yMaximum(),
+        crs.authid() or crs.toWkt(), settings.rotation(), settings.outputDpi(),
+        width, settings.backgroundColor().name(), int(settings.flags()),
+        _temporal_state(settings),
+        tuple(sorted(settings.layerStyleOverrides().items())),   # thème de carte
+        fingerprint,
+    ))
+
+
+def _temporal_state(settings):
+    """Plage temporelle du rendu (contrôleur temporel du canevas), ou None."""
+    if not settings.isTemporal():
+        return None
+    period = settings.temporalRange()
+    return (
+        period.begin().toString(Qt.ISODateWithMs), period.end().toString(Qt.ISODateWithMs),
+        period.includeBeginning(), period.includeEnd(),
+    )
+
+
+def invalidate(layer_id):
+    """La couche a changé : nouvelle révision, rendus qui l'utilisent supprimés."""
+    _revisions[layer_id] = _revisions.get(layer_id, 0) + 1
+    cache().invalidate(layer_id)
+
+
+def watch(layers):
+    """Suit les modifications des couches d'un rendu (thread GUI)."""
+    for layer in layers:
+        layer_id = layer.id()
+        if layer_id in _watched:
+            continue
+        slots = []
+        for signal in (layer.repaintRequested, layer.dataChanged, layer.styleChanged,
+                       layer.rendererChanged):
+            def slot(*args, layer_id=layer_id):
+                invalidate(layer_id)
+            signal.connect(slot)
+            slots.append((signal, slot))
+
+        def forget(layer_id=layer_id):
+            _watched.pop(layer_id, None)
+        layer.willBeDeleted.connect(forget)
+        slots.append((layer.willBeDeleted, forget))
+        _watched[layer_id] = slots
+
+
+def unwatch_all():
+    """Déconnecte le suivi des couches (déchargement de l'extension)."""
+    for slots in _watched.values():
+        for signal, slot in slots:
+            try:
+                signal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                pass
+    _watched.clear()
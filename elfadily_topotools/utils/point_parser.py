@@ -0,0 +1,392 @@
+"""
+Moteur de parsing des coordonnées collées (Points → Géométrie).
+- Tokenizer précompilé (split natif pour les séparateurs littéraux)
+- Lecture en flux du texte, sans matérialiser la liste des lignes
+- Lecture directe de fichiers mappés en mémoire (mmap), y compris Leica GSI
+- Conversion par lots vers une PointTable (colonnes array('d'))
+- Rapport d'erreurs ligne par ligne identique à l'ancien parseur
+"""
+
+import codecs
+import re
+import sys
+from array import array
+from itertools import zip_longest
+from operator import methodcaller
+
+from .point_table import PointTable
+
+
+REGEX_META = set(".^$*+?{}[]\\|()")
+
+WHITESPACE_PATTERN = r"\s+"
+
+# Modes de regroupement (une géométrie par groupe)
+GROUP_COLUMN = "column"  # 1re colonne = clé de groupe
+GROUP_BLANK = "blank"    # ligne vide ou « # nom » = nouveau groupe
+
+_LEADING_WS = re.compile(r"\s*")
+_ESCAPED_CHAR = re.compile(r"\\(.)", re.S)
+
+
+def _literal_separator(pattern):
+    """Retourne le séparateur littéral équivalent au pattern, ou None."""
+    if not pattern:
+        return None
+    if not any(c in REGEX_META for c in pattern):
+        return pattern
+    unescaped = _ESCAPED_CHAR.sub(r"\1", pattern)
+    if unescaped and re.escape(unescaped) == pattern:
+        return unescaped
+    return None
+
+
+def _decode(data):
+    """Décode un bloc d'octets : UTF-8, sinon Windows-1252 (exports Excel)."""
+    try:
+        return data.decode("utf-8")
+    except UnicodeDecodeError:
+        return data.decode("cp1252", errors="replace")
+
+
+def _to_doubles(tokens):
+    """Convertit un lot de chaînes en array('d') (virgule décimale acceptée)."""
+    joined = "\n".join(tokens)
+    if "," in joined:
+        tokens = joined.replace(",", ".").split("\n")
+    return array("d", map(float, tokens))
+
+
+class ParseResult:
+    """Résultat du parsing : table de points + erreurs."""
+
+    def __init__(self):
+        self.points = PointTable()
+        self.error_lines = []  # (n° de ligne, détail) des erreurs conservées
+        self.error_count = 0
+        self.canceled = False
+        self.source = None  # chemin du fichier importé, le cas échéant
+        self.group_count = None  # nombre de groupes, s'il est déjà connu
+
+    def __len__(self):
+        return len(self.points)
+
+    @property
+    def errors(self):
+        """Messages d'erreur « Ligne n: ... »."""
+        return [f"Ligne {lineno}: {detail}" for lineno, detail in self.error_lines]
+
+
+class PointParser:
+    """Parseur en flux des lignes « N° X Y [Z] »."""
+
+    BLOCK_SIZE = 1 << 20  # caractères lus par bloc (coupé sur une fin de ligne)
+    MAX_ERRORS = 1000     # messages d'erreur conservés (le compte reste exact)
+
+    def __init__(self, separator=WHITESPACE_PATTERN, has_num=True, is_yx=False,
+                 group_mode=None):
+        self.has_num = has_num
+        self.is_yx = is_yx
+        self.group_mode = group_mode
+        self._whitespace = separator == WHITESPACE_PATTERN
+        self._split = self._make_splitter(separator)
+        # Colonnes : [groupe] [N°] X Y [Z]
+        self._lead = 1 if group_mode == GROUP_COLUMN else 0
+        self._x_col = self._lead + (1 if has_num else 0)
+        self._reset_groups()
+
+    def _reset_groups(self):
+        self._group = None
+        self._group_count = 0
+        self._group_break = True
+        self._group_name = None
+
+    @staticmethod
+    def _make_splitter(separator):
+        """Compile le tokenizer une seule fois pour tout le texte."""
+        if separator == WHITESPACE_PATTERN:
+            # Équivalent à re.split(r"\s+", line) sur une ligne strippée
+            return str.split
+        literal = _literal_separator(separator)
+        if literal is not None:
+            def split(line):
+                return line.split(literal)
+            split.literal = literal
+            return split
+        return re.compile(separator).split
+
+    def parse(self, text, progress=None, is_canceled=None):
+        """
+        Analyse le texte bloc par bloc.
+
+        progress : callable(pourcentage) appelé après chaque bloc
+        is_canceled : callable() -> bool, interrompt le parsing si True
+        """
+        # Même numérotation que raw.strip().splitlines()
+        start = _LEADING_WS.match(text).end()
+        return self._parse_source(text, start, None, progress, is_canceled)
+
+    def parse_buffer(self, buffer, progress=None, is_canceled=None):
+        """
+        Analyse un tampon d'octets (typiquement un fichier mappé par mmap).
+        Seul le bloc en cours est décodé : le fichier n'est jamais copié
+        en entier en mémoire. Les lignes sont numérotées depuis le début
+        du fichier.
+        """
+        start = len(codecs.BOM_UTF8) if buffer[:3] == codecs.BOM_UTF8 else 0
+        return self._parse_source(buffer, start, _decode, progress, is_canceled)
+
+    def iter_blocks(self, source, pos=0, newline="\n"):
+        """
+        Découpe source[pos:] en blocs d'environ BLOCK_SIZE caractères,
+        coupés sur une fin de ligne. Génère (bloc, fin), fin étant la
+        position qui suit le bloc. Les blocs joints par newline redonnent
+        exactement source[pos:] (au moins un bloc, éventuellement vide).
+        """
+        size = len(source)
+        while True:
+            end = source.find(newline, pos + self.BLOCK_SIZE)
+            if end < 0:
+                yield source[pos:size], size
+                return
+            yield source[pos:end], end
+            pos = end + 1
+
+    def _parse_source(self, source, pos, decode, progress, is_canceled):
+        self._reset_groups()
+        result = ParseResult()
+        size = len(source)
+        if pos >= size:
+            return result
+        lineno = 1
+
+        for block, end in self.iter_blocks(source, pos, b"\n" if decode else "\n"):
+            if decode:
+                block = decode(block)
+            lineno = self.parse_block(block, lineno, result)
+            if progress:
+                progress(100.0 * min(end + 1, size) / size)
+            if is_canceled and is_canceled():
+                result.canceled = True
+                break
+
+        return result
+
+    def parse_block(self, block, first_lineno, result):
+        """
+        Ajoute à result les points d'un bloc de lignes brutes.
+        Retourne le numéro de la ligne qui suit le bloc.
+        """
+        lines = block.split("\n")
+        if self.group_mode == GROUP_BLANK:
+            self._parse_runs(lines, first_lineno, result)
+        elif "#" in block or not self._parse_fast(block, lines, result):
+            self._parse_slow(lines, first_lineno, result)
+        return first_lineno + len(lines)
+
+    def _parse_runs(self, lines, first_lineno, result):
+        """
+        Mode GROUP_BLANK : chaque suite de lignes de données forme un groupe,
+        séparée par des lignes vides ou un commentaire « # nom du groupe ».
+        """
+        start = None
+        for i, line in enumerate(lines):
+            line = line.strip()
+            if line and line[0] != "#":
+                if start is None:
+                    start = i
+                continue
+            if start is not None:
+                self._parse_run(lines[start:i], first_lineno + start, result)
+                start = None
+            self._group_break = True
+            if line[1:].strip():
+                self._group_name = line[1:].strip()
+        if start is not None:
+            self._parse_run(lines[start:], first_lineno + start, result)
+
+    def _parse_run(self, lines, first_lineno, result):
+        if self._group_break:
+            self._group_count += 1
+            self._group = sys.intern(self._group_name or str(self._group_count))
+            self._group_break = False
+            self._group_name = None
+        block = "\n".join(lines)
+        if not self._parse_fast(block, lines, result):
+            self._parse_slow(lines, first_lineno, result)
+
+    def _parse_fast(self, block, lines, result):
+        """
+        Chemin rapide : tokens du bloc découpés d'un seul appel, colonnes
+        extraites par tranches puis converties d'un tenant. Retourne False
+        si une ligne est invalide (le bloc repasse alors ligne par ligne).
+        """
+        cols, width = self._columns(block, lines)
+        if not cols:
+            return True
+        off = self._x_col
+        if width < off + 2:
+            return False
+
+        nrows = len(cols[0])
+        try:
+            cx = _to_doubles(cols[off])
+            cy = _to_doubles(cols[off + 1])
+            cz = _to_doubles(cols[off + 2]) if len(cols) > off + 2 \
+                else array("d", bytes(8 * nrows))
+        except ValueError:
+            return False
+
+        nums = list(map(sys.intern, cols[off - 1])) if self.has_num else None
+        groups = list(map(sys.intern, cols[0])) if self._lead else None
+        self._append(result, nums, cx, cy, cz, groups)
+        return True
+
+    def _columns(self, block, lines):
+        """
+        Découpe un bloc en colonnes de tokens.
+        Retourne (colonnes, nombre de tokens de la ligne la plus courte).
+        Les lignes plus courtes que la plus longue sont complétées par "0"
+        (Z manquant, comme l'ancien parseur) ; une colonne n'est retenue que
+        si toutes les lignes l'ont, ou si c'est la colonne Z.
+        """
+        split = self._split
+        literal = getattr(split, "literal", None)
+        if self._whitespace:
+            counts = list(filter(None, map(len, map(split, lines))))
+            rows = None
+        elif literal is not None:
+            rows = list(filter(None, map(str.strip, lines)))
+            counts = [c + 1 for c in map(methodcaller("count", literal), rows)]
+        else:
+            rows = list(map(split, filter(None, map(str.strip, lines))))
+            counts = list(map(len, rows))
+        if not counts:
+            return [], 0
+
+        width = min(counts)
+        if width == max(counts) and (self._whitespace or literal is not None):
+            # Toutes les lignes ont le même nombre de colonnes : tranches
+            tokens = block.split() if self._whitespace \
+                else literal.join(rows).split(literal)
+            return [tokens[i::width] for i in range(width)], width
+
+        if rows is None or literal is not None:
+            rows = list(map(split, filter(None, map(str.strip, lines))))
+        cols = list(zip_longest(*rows, fillvalue="0"))
+        # Seule la colonne Z peut être absente
+        return cols[:max(width, self._x_col + 3)], width
+
+    def _parse_slow(self, lines, first_lineno, result):
+        """Chemin ligne par ligne, avec message d'erreur par ligne."""
+        split = self._split
+        has_num = self.has_num
+        lead = self._lead
+        intern = sys.intern
+
+        nums = [] if has_num else None
+        groups = [] if lead else None
+        cx, cy, cz = array("d"), array("d"), array("d")
+        errors = []
+        for lineno, line in enumerate(lines, first_lineno):
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+
+            parts = split(line)
+            if lead:
+                group, parts = parts[0], parts[1:]
+
+            try:
+                if has_num:
+                    num = intern(parts[0])
+                    x_str, y_str = parts[1], parts[2]
+                    z_str = parts[3] if len(parts) > 3 else "0"
+                else:
+                    x_str, y_str = parts[0], parts[1]
+                    z_str = parts[2] if len(parts) > 2 else "0"
+
+                x = float(x_str.replace(",", "."))
+                y = float(y_str.replace(",", "."))
+                z = float(z_str.replace(",", "."))
+            except (IndexError, ValueError) as e:
+                errors.append((lineno, f"{line} → {str(e)}"))
+                continue
+
+            if has_num:
+                nums.append(num)  # sinon numérotation automatique
+            if lead:
+                groups.append(intern(group))
+            cx.append(x)
+            cy.append(y)
+            cz.append(z)
+
+        self._append(result, nums, cx, cy, cz, groups)
+
+        if errors:
+            result.error_count += len(errors)
+            room = self.MAX_ERRORS - len(result.error_lines)
+            if room > 0:
+                result.error_lines.extend(errors[:room])
+
+    def _append(self, result, nums, cx, cy, cz, groups=None):
+        if self.is_yx:
+            cx, cy = cy, cx
+        if self.group_mode == GROUP_BLANK:
+            groups = [self._group] * len(cx)
+        result.points.extend_columns(nums, cx, cy, cz, groups)
+
+
+class GsiParser(PointParser):
+    """
+    Parseur des fichiers Leica GSI (GSI-8 / GSI-16).
+    Chaque mot porte son code (11 = N°, 81 = X/Est, 82 = Y/Nord, 83 = Z) :
+    l'ordre des colonnes et le séparateur de l'interface ne s'appliquent pas.
+    """
+
+    # Code unité (6e caractère du mot) -> (décimales, facteur)
+    UNITS = {
+        "0": (3, 1.0),       # mètre, 1 mm
+        "1": (3, 0.3048),    # pied, 1/1000 ft
+        "6": (4, 1.0),       # mètre, 1/10 mm
+        "7": (4, 0.3048),    # pied, 1/10000 ft
+        "8": (5, 1.0),       # mètre, 1/100 mm
+    }
+
+    def __init__(self):
+        super().__init__(WHITESPACE_PATTERN, has_num=True, is_yx=False)
+        self._count = 0  # numérotation des points sans mot 11
+
+    def parse_block(self, block, first_lineno, result):
+        converted = "\n".join(map(self._convert_line, block.split("\n")))
+        return super().parse_block(converted, first_lineno, result)
+
+    def _convert_line(self, line):
+        """
+        Ligne GSI -> « N° X Y Z ». Les blocs sans coordonnées (codes,
+        mesures brutes) sont ignorés ; une valeur illisible laisse la ligne
+        telle quelle pour qu'elle soit signalée en erreur.
+        """
+        words = {}
+        for word in line.replace("*", " ").split():
+            if len(word) >= 8 and word[:2].isdigit():
+                words[word[:2]] = word
+        if "81" not in words or "82" not in words:
+            return ""
+        try:
+            x = self._value(words["81"])
+            y = self._value(words["82"])
+            z = self._value(words["83"]) if "83" in words else 0.0
+        except ValueError:
+            return line
+        self._count += 1
+        if "11" in words:
+            num = words["11"][7:].lstrip("0") or "0"
+        else:
+            num = str(self._count)
+        return f"{num} {x!r} {y!r} {z!r}"
+
+    def _value(self, word):
+        decimals, factor = self.UNITS.get(word[5], (3, 1.0))
+        value = int(word[7:]) / 10 ** decimals * factor
+        return -value if word[6] == "-" else value
@@ -0,0 +1,167 @@
+"""
+Stockage colonne des points parsés (Points → Géométrie).
+- x / y / z dans des array('d') (8 octets par valeur)
+- N° de points dans une liste de chaînes internées, ou numérotation
+  automatique implicite (1..n) quand la saisie n'a pas de colonne N°
+- Colonne de groupe optionnelle (une géométrie par parcelle / lot)
+- Partagé par le parsing, l'aperçu et la création des couches
+"""
+
+import sys
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # NumPy est optionnel
+    np = None
+
+
+class PointTable:
+    """Table de points en colonnes : num, x, y, z."""
+
+    __slots__ = ("nums", "x", "y", "z", "groups")
+
+    def __init__(self, nums=None, x=None, y=None, z=None, groups=None):
+        # nums=None : numérotation automatique "1", "2", ...
+        self.nums = nums
+        self.x = x if x is not None else array("d")
+        self.y = y if y is not None else array("d")
+        self.z = z if z is not None else array("d")
+        # groups=None : pas de regroupement (une seule géométrie)
+        self.groups = groups
+
+    def __len__(self):
+        return len(self.x)
+
+    def __iter__(self):
+        """Itère sur les tuples (num, x, y, z)."""
+        return zip(self.numbers(), self.x, self.y, self.z)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if self.nums is not None:
+                nums = self.nums[index]
+            else:
+                rows = range(len(self))[index]
+                # Une tranche qui commence au début garde la numérotation auto
+                auto = rows.step == 1 and (rows.start == 0 or not rows)
+                nums = None if auto else [str(i + 1) for i in rows]
+            groups = self.groups[index] if self.groups is not None else None
+            return PointTable(nums, self.x[index], self.y[index], self.z[index], groups)
+        if index < 0:
+            index += len(self)
+        return self.num(index), self.x[index], self.y[index], self.z[index]
+
+    @property
+    def auto_numbered(self):
+        return self.nums is None
+
+    def num(self, index):
+        """N° du point à l'index donné."""
+        if self.nums is None:
+            return str(index + 1)
+        return self.nums[index]
+
+    def numbers(self, start=0, stop=None):
+        """Itère sur les N° de points (éventuellement d'une plage)."""
+        if stop is None:
+            stop = len(self)
+        if self.nums is None:
+            return map(str, range(start + 1, stop + 1))
+        return iter(self.nums[start:stop])
+
+    def group(self, index):
+        """Clé de groupe du point à l'index donné (None sans regroupement)."""
+        return self.groups[index] if self.groups is not None else None
+
+    def group_indices(self):
+        """
+        Index des points de chaque groupe, en un seul passage.
+        Retourne un dict {clé: [index, ...]} dans l'ordre d'apparition ;
+        sans regroupement, un seul groupe de clé None.
+        """
+        if self.groups is None:
+            return {None: range(len(self))}
+        indices = {}
+        for i, key in enumerate(self.groups):
+            rows = indices.get(key)
+            if rows is None:
+                rows = indices[key] = array("l")
+            rows.append(i)
+        return indices
+
+    def xy(self):
+        """Itère sur les couples (x, y)."""
+        return zip(self.x, self.y)
+
+    def append(self, num, x, y, z=0.0, group=None):
+        if self.nums is not None:
+            self.nums.append(sys.intern(num))
+        if self.groups is not None:
+            self.groups.append(sys.intern(group))
+        self.x.append(x)
+        self.y.append(y)
+        self.z.append(z)
+
+    def extend_columns(self, nums, x, y, z, groups=None):
+        """Ajoute des colonnes déjà converties (nums=None : auto)."""
+        if len(self) == 0:
+            self.nums = None if nums is None else []
+            self.groups = None if groups is None else []
+        elif (nums is None) != (self.nums is None) \
+                or (groups is None) != (self.groups is None):
+            raise ValueError("Colonnes incompatibles entre les tables")
+        if nums is not None:
+            self.nums.extend(nums)
+        if groups is not None:
+            self.groups.extend(groups)
+        self.x.extend(x)
+        self.y.extend(y)
+        self.z.extend(z)
+
+    def extend(self, other):
+        self.extend_columns(other.nums, other.x, other.y, other.z, other.groups)
+
+    def splice(self, start, stop, other):
+        """
+        Remplace les lignes [start, stop) par celles d'une autre table,
+        sur place (déplacement mémoire des colonnes, sans reconstruction).
+        """
+        if len(other) == 0:
+            other = PointTable([] if self.nums is not None else None,
+                               groups=[] if self.groups is not None else None)
+        elif start == 0 and stop >= len(self):
+            self.nums = None if other.nums is None else []
+            self.groups = None if other.groups is None else []
+        elif (other.nums is None) != (self.nums is None) \
+                or (other.groups is None) != (self.groups is None):
+            raise ValueError("Colonnes incompatibles entre les tables")
+        if self.nums is not None:
+            self.nums[start:stop] = other.nums
+        if self.groups is not None:
+            self.groups[start:stop] = other.groups
+        self.x[start:stop] = other.x
+        self.y[start:stop] = other.y
+        self.z[start:stop] = other.z
+
+    def swap_xy(self):
+        """Inverse les colonnes X et Y (saisie Y X)."""
+        self.x, self.y = self.y, self.x
+
+    def as_numpy(self):
+        """Vues NumPy (sans copie) sur les colonnes x, y, z."""
+        if np is None:
+            raise RuntimeError("NumPy n'est pas disponible")
+        return (np.frombuffer(self.x, dtype=np.float64),
+                np.frombuffer(self.y, dtype=np.float64),
+                np.frombuffer(self.z, dtype=np.float64))
+
+    @property
+    def nbytes(self):
+        """Taille approximative des colonnes en mémoire."""
+        size = 3 * 8 * len(self)
+        for column in (self.nums, self.groups):
+            if column is not None:
+                size += sys.getsizeof(column)
+                size += sum(sys.getsizeof(v) for v in set(column))
+        return size
@@ -0,0 +1,547 @@
+"""
+Contrôle qualité géométrique des points parsés (Points → Géométrie).
+- Points en double et points quasi confondus (tolérance), par grille de
+  hachage : chaque point n'est comparé qu'aux cellules voisines
+- Segments de longueur nulle
+- Auto-intersections de chaque polygone / polyligne, segments rangés dans
+  une grille pour ne tester que les paires proches
+- Sens de parcours des anneaux (surface signée, voir group_measures)
+- Vectorisé avec NumPy si disponible (mêmes grilles, tous les groupes
+  d'un coup) ; sinon, ou pour un jeu pathologique, boucles Python
+Temps quasi linéaire en nombre de points.
+"""
+
+import math
+
+try:
+    import numpy as np
+except ImportError:  # NumPy est optionnel
+    np = None
+
+from .measures import group_measures
+
+
+MAX_CANDIDATES = 10000000   # cellules / paires candidates au plus (NumPy)
+
+
+class Canceled(Exception):
+    """Contrôle interrompu par l'utilisateur."""
+
+
+class QaReport:
+    """Anomalies détectées ; les listes sont limitées, les comptes exacts."""
+
+    MAX_ITEMS = 1000  # anomalies conservées par catégorie
+
+    def __init__(self, tolerance=0.0, closed=True):
+        self.tolerance = tolerance
+        self.closed = closed
+        self.duplicates = []       # (i, j) : j répète exactement i
+        self.near_duplicates = []  # (i, j, distance)
+        self.zero_segments = []    # (i, j) : segment i → j de longueur nulle
+        self.intersections = []    # (groupe, i, j, (x, y)) segments partant de i et j
+        self.orientation = {}      # groupe -> surface signée (> 0 : anti-horaire)
+        self.counts = {
+            "duplicates": 0, "near_duplicates": 0,
+            "zero_segments": 0, "intersections": 0,
+        }
+        # Recherche des intersections arrêtée au-delà de MAX_ITEMS : un tracé
+        # qui se recoupe partout en compterait un nombre quadratique
+        self.truncated = False
+
+    def _add(self, kind, item):
+        self.counts[kind] += 1
+        items = getattr(self, kind)
+        if len(items) < self.MAX_ITEMS:
+            items.append(item)
+
+    def _add_all(self, kind, count, items):
+        """count anomalies d'un coup ; items(n) : les n premières."""
+        self.counts[kind] += count
+        kept = getattr(self, kind)
+        room = self.MAX_ITEMS - len(kept)
+        if count and room > 0:
+            kept.extend(items(min(room, count)))
+
+    @property
+    def ok(self):
+        return not any(self.counts.values())
+
+    def row_issues(self, points):
+        """{index de point: message} pour signaler les lignes de l'aperçu."""
+        issues = {}
+        num = points.num
+
+        def note(row, text):
+            issues[row] = f"{issues[row]}\n{text}" if row in issues else text
+
+        for i, j in self.duplicates:
+            note(j, f"Doublon du point {num(i)}")
+        for i, j, dist in self.near_duplicates:
+            note(j, f"À {dist:.3f} m du point {num(i)}")
+        for i, j in self.zero_segments:
+            note(j, f"Segment de longueur nulle depuis le point {num(i)}")
+        for _, i, j, (x, y) in self.intersections:
+            text = f"Auto-intersection ({x:.3f}, {y:.3f})"
+            note(i, text)
+            note(j, text)
+        return issues
+
+    def summary(self):
+        """Lignes de texte résumant le contrôle."""
+        lines = []
+        counts = self.counts
+        if counts["duplicates"]:
+            lines.append(f"⚠ {counts['duplicates']} point(s) en double")
+        if counts["near_duplicates"]:
+            lines.append(
+                f"⚠ {counts['near_duplicates']} point(s) à moins de "
+                f"{self.tolerance:g} m d'un autre"
+            )
+        if counts["zero_segments"]:
+            lines.append(f"⚠ {counts['zero_segments']} segment(s) de longueur nulle")
+        if counts["intersections"]:
+            more = "plus de " if self.truncated else ""
+            lines.append(f"⚠ {more}{counts['intersections']} auto-intersection(s)")
+        if not lines:
+            lines.append("✔ Aucune anomalie détectée")
+
+        if self.closed and self.orientation:
+            cw = sum(1 for a in self.orientation.values() if a < 0)
+            flat = sum(1 for a in self.orientation.values() if a == 0)
+            ccw = len(self.orientation) - cw - flat
+            if len(self.orientation) == 1:
+                sens = "horaire" if cw else ("dégénéré" if flat else "anti-horaire")
+                lines.append(f"Sens de parcours : {sens}")
+            else:
+                text = f"Sens : {ccw} anti-horaire, {cw} horaire"
+                if flat:
+                    text += f", {flat} dégénéré(s)"
+                lines.append(text)
+        return lines
+
+
+def check_points(points, tolerance=0.01, closed=True, is_canceled=None):
+    """
+    Contrôle une PointTable et retourne un QaReport.
+
+    tolerance : distance (unités du SCR) sous laquelle deux points
+                distincts sont signalés comme quasi confondus
+    closed : True pour des polygones (segment de fermeture et sens de
+             parcours contrôlés), False pour des polylignes
+    is_canceled : callable() -> bool, lève Canceled si True
+    """
+    report = QaReport(tolerance, closed)
+    indices = points.group_indices()
+    vectorized = np is not None and len(points) > 0
+    if not (vectorized and _check_duplicates_numpy(points, report, tolerance, indices, closed)):
+        _check_duplicates(points, report, tolerance, indices, closed)
+    if is_canceled and is_canceled():
+        raise Canceled()
+    if not (vectorized and _check_segments_numpy(points, indices, closed, report)):
+        for key, rows in indices.items():
+            if is_canceled and is_canceled():
+                raise Canceled()
+            rows = _ring_rows(points, rows, closed)
+            _check_segments(points, key, rows, closed, report)
+    if closed:
+        report.orientation = {
+            key: area for key, (area, _) in group_measures(points, indices).items()
+        }
+    return report
+
+
+def _ring_rows(points, rows, closed):
+    """Ignore le dernier point d'un anneau fermé explicitement (= premier)."""
+    if closed and len(rows) > 3:
+        first, last = rows[0], rows[-1]
+        if points.x[first] == points.x[last] and points.y[first] == points.y[last]:
+            return rows[:-1]
+    return rows
+
+
+def _closing_rows(points, indices, closed):
+    """Index des derniers points qui ne font que fermer leur anneau."""
+    skip = set()
+    if closed:
+        for rows in indices.values():
+            if len(_ring_rows(points, rows, closed)) != len(rows):
+                skip.add(rows[-1])
+    return skip
+
+
+def _check_duplicates(points, report, tolerance, indices, closed):
+    """
+    Doublons exacts au sein d'un même groupe (deux parcelles voisines
+    partagent légitimement leurs sommets) ; points quasi confondus mais
+    distincts dans tout le jeu (écarts entre parcelles compris).
+    """
+    xs, ys = points.x, points.y
+    groups = points.groups
+    skip = _closing_rows(points, indices, closed)
+    seen = {}
+    cells = {}
+    size = tolerance if tolerance > 0 else None
+    floor = math.floor
+    tol2 = tolerance * tolerance
+
+    for j, (x, y) in enumerate(zip(xs, ys)):
+        if j in skip:
+            continue
+        key = (x, y) if groups is None else (groups[j], x, y)
+        i = seen.get(key)
+        if i is not None:
+            report._add("duplicates", (i, j))
+            continue
+        seen[key] = j
+        if size is None:
+            continue
+
+        cx, cy = floor(x / size), floor(y / size)
+        for gx in (cx - 1, cx, cx + 1):
+            for gy in (cy - 1, cy, cy + 1):
+                for i in cells.get((gx, gy), ()):
+                    d2 = (xs[i] - x) ** 2 + (ys[i] - y) ** 2
+                    if 0 < d2 <= tol2:
+                        report._add("near_duplicates", (i, j, math.sqrt(d2)))
+        cell = cells.get((cx, cy))
+        if cell is None:
+            cells[(cx, cy)] = [j]
+        else:
+            cell.append(j)
+
+
+def _grid_codes(cx, cy):
+    """Codes entiers uniques des cellules (cx, cy), None s'ils dépassent 64 bits."""
+    if not (np.isfinite(cx).all() and np.isfinite(cy).all()):
+        return None, None
+    x0, y0 = cx.min(), cy.min()
+    width = cy.max() - y0 + 3   # marge d'une cellule de chaque côté
+    if (cx.max() - x0 + 3) * width >= 2.0 ** 62:
+        return None, None
+    width = int(width)
+    return (cx - x0 + 1).astype(np.int64) * width + (cy - y0 + 1).astype(np.int64), width
+
+
+def _run_pairs(starts_flag):
+    """
+    Paires (p, q), q < p, de positions d'un même bloc : starts_flag marque
+    le début de chaque bloc d'un tableau trié. None au-delà de MAX_CANDIDATES.
+    """
+    pos = np.arange(len(starts_flag))
+    start = np.maximum.accumulate(np.where(starts_flag, pos, 0))
+    count = pos - start
+    total = int(count.sum())
+    if total > MAX_CANDIDATES:
+        return None
+    p = np.repeat(pos, count)
+    q = np.repeat(start, count) + (np.arange(total) - np.repeat(np.cumsum(count) - count, count))
+    return p, q
+
+
+def _check_duplicates_numpy(points, report, tolerance, indices, closed):
+    """
+    _check_duplicates vectorisé : mêmes anomalies (quasi-doublons d'un
+    point rangés par index). False, sans rien signaler, si la grille est
+    trop grande pour NumPy : l'appelant reprend la boucle.
+    """
+    xs, ys, _ = points.as_numpy()
+    n = len(xs)
+    group = np.zeros(n, dtype=np.int64)
+    if points.groups is not None:
+        for code, rows in enumerate(indices.values()):
+            group[np.asarray(rows, dtype=np.int64)] = code
+    keep = np.ones(n, dtype=bool)
+    skip = _closing_rows(points, indices, closed)
+    if skip:
+        keep[np.fromiter(skip, dtype=np.int64, count=len(skip))] = False
+    rows = np.flatnonzero(keep)
+
+    # Doublons exacts : (groupe, x, y) triés, le premier index de chaque bloc reste
+    order = rows[np.lexsort((rows, ys[rows], xs[rows], group[rows]))]
+    first = np.ones(len(order), dtype=bool)
+    first[1:] = ((group[order[1:]] != group[order[:-1]]) | (xs[order[1:]] != xs[order[:-1]])
+                 | (ys[order[1:]] != ys[order[:-1]]))
+    origin = order[first][np.cumsum(first) - 1]
+    dup_i, dup_j = origin[~first], order[~first]
+    by_j = np.argsort(dup_j, kind="stable")
+    dup_i, dup_j = dup_i[by_j], dup_j[by_j]
+
+    # Quasi-doublons entre points distincts : grille de côté tolerance,
+    # chaque point comparé aux points d'index inférieur des 9 cellules voisines
+    near = None
+    if tolerance > 0 and len(order):
+        kept = np.sort(order[first])
+        codes, width = _grid_codes(np.floor(xs[kept] / tolerance), np.floor(ys[kept] / tolerance))
+        if codes is None:
+            return False
+        by_cell = np.argsort(codes, kind="stable")
+        cell_codes, cell_rows = codes[by_cell], kept[by_cell]
+        found_i, found_j = [], []
+        total = 0
+        tol2 = tolerance * tolerance
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                target = codes + (dx * width + dy)
+                lo = np.searchsorted(cell_codes, target, "left")
+                count = np.searchsorted(cell_codes, target, "right") - lo
+                size = int(count.sum())
+                total += size
+                if total > MAX_CANDIDATES:
+                    return False
+                j = np.repeat(kept, count)
+                i = cell_rows[np.repeat(lo, count)
+                              + (np.arange(size) - np.repeat(np.cumsum(count) - count, count))]
+                d2 = (xs[i] - xs[j]) ** 2 + (ys[i] - ys[j]) ** 2
+                hit = (i < j) & (d2 > 0) & (d2 <= tol2)
+                found_i.append(i[hit])
+                found_j.append(j[hit])
+        near_i, near_j = np.concatenate(found_i), np.concatenate(found_j)
+        by_j = np.lexsort((near_i, near_j))
+        near = near_i[by_j], near_j[by_j]
+
+    report._add_all("duplicates", len(dup_j), lambda k: list(zip(
+        dup_i[:k].tolist(), dup_j[:k].tolist())))
+    if near is not None:
+        near_i, near_j = near
+        report._add_all("near_duplicates", len(near_j), lambda k: [
+            (i, j, math.sqrt((xs[i] - xs[j]) ** 2 + (ys[i] - ys[j]) ** 2))
+            for i, j in zip(near_i[:k].tolist(), near_j[:k].tolist())
+        ])
+    return True
+
+
+def _check_segments_numpy(points, indices, closed, report):
+    """
+    _check_segments vectorisé, pour tous les groupes d'un coup : mêmes
+    grilles (cellules traversées colonne par colonne, voir _cells), mêmes
+    tests d'intersection. False, sans rien signaler, si le nombre de
+    cellules ou de paires candidates dépasse MAX_CANDIDATES.
+    """
+    keys = list(indices)
+    rings = [_ring_rows(points, rows, closed) for rows in indices.values()]
+    sizes = np.fromiter(map(len, rings), dtype=np.int64, count=len(rings))
+    flat = np.concatenate([np.asarray(rows, dtype=np.int64) for rows in rings])
+    xs_all, ys_all, _ = points.as_numpy()
+
+    # Segments k -> k + 1 de chaque groupe (k = n - 1 -> 0 pour un anneau)
+    starts = np.cumsum(sizes) - sizes
+    gid = np.repeat(np.arange(len(keys)), sizes)
+    local = np.arange(len(flat)) - starts[gid]
+    ring = closed & (sizes >= 3)
+    nseg = np.where(ring, sizes, sizes - 1)
+    nxt = np.arange(1, len(flat) + 1)
+    last = starts + sizes - 1
+    nxt[last] = starts
+    seg = np.flatnonzero(local < nseg[gid])
+    a, b = flat[seg], flat[nxt[seg]]
+    ax, ay, bx, by = xs_all[a], ys_all[a], xs_all[b], ys_all[b]
+    zero = (ax == bx) & (ay == by)
+
+    # Segments non nuls, numérotés dans leur groupe (voisins : n° consécutifs)
+    keep = ~zero
+    a, g = a[keep], gid[seg][keep]
+    ax, ay, bx, by = ax[keep], ay[keep], bx[keep], by[keep]
+    count = np.bincount(g, minlength=len(keys))
+    number = np.arange(len(g)) - (np.cumsum(count) - count)[g]
+    length = np.bincount(g, weights=np.hypot(bx - ax, by - ay), minlength=len(keys))
+    size = np.maximum(length / np.maximum(count, 1), 1e-9)
+    tested = count >= np.where(ring, 3, 2)
+
+    s = np.flatnonzero(tested[g])
+    cells = _segment_cells(ax[s], ay[s], bx[s], by[s], size[g[s]])
+    if cells is None:
+        return False
+    hits = None
+    if cells[0].size:
+        owner, gx, gy = cells
+        owner = s[owner]
+        order = np.lexsort((owner, gy, gx, g[owner]))
+        owner, gx, gy = owner[order], gx[order], gy[order]
+        new = np.ones(len(owner), dtype=bool)
+        new[1:] = (gx[1:] != gx[:-1]) | (gy[1:] != gy[:-1]) | (g[owner[1:]] != g[owner[:-1]])
+        pairs = _run_pairs(new)
+        if pairs is None:
+            return False
+        k, m = owner[pairs[0]], owner[pairs[1]]
+        code = np.unique(k * len(g) + m)   # paires uniques, rangées par (k, m)
+        k, m = code // len(g), code % len(g)
+        d = number[k] - number[m]
+        gk = g[k]
+        near = (d <= 1) | (ring[gk] & (d == count[gk] - 1))
+        k, m = k[~near], m[~near]
+        hits = _intersections(ax[k], ay[k], bx[k], by[k], ax[m], ay[m], bx[m], by[m])
+        hits = (k[hits[0]], m[hits[0]], hits[1], hits[2])
+
+    zero_a, zero_b = flat[seg][zero], flat[nxt[seg]][zero]
+    report._add_all("zero_segments", len(zero_a), lambda n: list(zip(
+        zero_a[:n].tolist(), zero_b[:n].tolist())))
+    if hits is not None:
+        k, m, hx, hy = hits
+        room = report.MAX_ITEMS - report.counts["intersections"]
+        if len(k) >= room:
+            report.truncated = True
+            k, m, hx, hy = k[:room], m[:room], hx[:room], hy[:room]
+        report._add_all("intersections", len(k), lambda n: [
+            (keys[gk], am, ak, (x, y)) for gk, am, ak, x, y in zip(
+                g[k[:n]].tolist(), a[m[:n]].tolist(), a[k[:n]].tolist(),
+                hx[:n].tolist(), hy[:n].tolist())
+        ])
+    return True
+
+
+def _segment_cells(ax, ay, bx, by, size):
+    """
+    Cellules traversées par chaque segment, comme _cells (colonne par
+    colonne) : (n° de segment, gx, gy), ou None au-delà de MAX_CANDIDATES.
+    """
+    swap = ax > bx
+    ax, ay, bx, by = (np.where(swap, bx, ax), np.where(swap, by, ay),
+                      np.where(swap, ax, bx), np.where(swap, ay, by))
+    x0, x1 = np.floor(ax / size), np.floor(bx / size)
+    ncol = x1 - x0 + 1
+    if not np.isfinite(ncol).all() or ncol.sum() > MAX_CANDIDATES:
+        return None
+    ncol = ncol.astype(np.int64)
+    owner = np.repeat(np.arange(len(ax)), ncol)
+    gx = x0[owner] + (np.arange(len(owner)) - np.repeat(np.cumsum(ncol) - ncol, ncol))
+    sa, sb, sz = ax[owner], bx[owner], size[owner]
+    ya, yb = ay[owner], by[owner]
+    column = x0[owner] != x1[owner]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        slope = (yb - ya) / (sb - sa)
+        y_lo = ya + (np.maximum(sa, gx * sz) - sa) * slope
+        y_hi = ya + (np.minimum(sb, (gx + 1) * sz) - sa) * slope
+    y_lo, y_hi = np.where(column, y_lo, ya), np.where(column, y_hi, yb)
+    gy0 = np.floor(np.minimum(y_lo, y_hi) / sz)
+    nrow = np.floor(np.maximum(y_lo, y_hi) / sz) - gy0 + 1
+    if not np.isfinite(nrow).all() or nrow.sum() > MAX_CANDIDATES:
+        return None
+    nrow = nrow.astype(np.int64)
+    cell = np.repeat(np.arange(len(owner)), nrow)
+    gy = gy0[cell] + (np.arange(len(cell)) - np.repeat(np.cumsum(nrow) - nrow, nrow))
+    return owner[cell], gx[cell], gy
+
+
+def _intersections(ax, ay, bx, by, cx, cy, dx, dy):
+    """_intersection vectorisé : (masque des paires qui se coupent, x, y)."""
+    rx, ry = bx - ax, by - ay
+    sx, sy = dx - cx, dy - cy
+    qx, qy = cx - ax, cy - ay
+    den = rx * sy - ry * sx
+    with np.errstate(divide="ignore", invalid="ignore"):
+        t = (qx * sy - qy * sx) / den
+        u = (qx * ry - qy * rx) / den
+        crossing = (den != 0) & (t >= 0) & (t <= 1) & (u >= 0) & (u <= 1)
+        # Colinéaires : recouvrement des projections sur le premier segment
+        rr = rx * rx + ry * ry
+        t0 = (qx * rx + qy * ry) / rr
+        t1 = t0 + (sx * rx + sy * ry) / rr
+        lo, hi = np.minimum(t0, t1), np.maximum(t0, t1)
+        overlap = (den == 0) & (qx * ry - qy * rx == 0) & ~((hi < 0) | (lo > 1))
+    t = np.where(crossing, t, np.maximum(lo, 0.0))
+    hit = crossing | overlap
+    return hit, (ax + t * rx)[hit], (ay + t * ry)[hit]
+
+
+def _check_segments(points, key, rows, closed, report):
+    """Segments nuls et auto-intersections d'un groupe."""
+    n = len(rows)
+    if n < 2:
+        return
+    xs, ys = points.x, points.y
+    closed = closed and n >= 3
+    nseg = n if closed else n - 1
+    segs = []   # (n° du segment, coordonnées), segments nuls exclus
+    total = 0.0
+    for k in range(nseg):
+        a, b = rows[k], rows[(k + 1) % n]
+        ax, ay, bx, by = xs[a], ys[a], xs[b], ys[b]
+        if ax == bx and ay == by:
+            report._add("zero_segments", (a, b))
+            continue
+        segs.append((k, (ax, ay, bx, by)))
+        total += math.hypot(bx - ax, by - ay)
+
+    count = len(segs)
+    if count < (3 if closed else 2) or report.truncated:
+        return
+
+    # Cellule ~ longueur moyenne des segments : chaque segment n'occupe
+    # que quelques cellules, les paires testées restent locales
+    size = max(total / count, 1e-9)
+    grid = {}
+    tested = set()
+    # Numérotation compacte : deux segments voisins partagent un sommet,
+    # même séparés par des segments nuls
+    for k, (_, seg) in enumerate(segs):
+        for gxy in _cells(seg, size):
+            cell = grid.get(gxy)
+            if cell is None:
+                grid[gxy] = [k]
+                continue
+            for m in cell:
+                if m in tested or _adjacent(k, m, count, closed):
+                    continue
+                tested.add(m)
+                hit = _intersection(seg, segs[m][1])
+                if hit is not None:
+                    report._add(
+                        "intersections", (key, rows[segs[m][0]], rows[segs[k][0]], hit))
+                    if report.counts["intersections"] >= report.MAX_ITEMS:
+                        report.truncated = True
+                        return
+            cell.append(k)
+        tested.clear()
+
+
+def _cells(seg, size):
+    """Cellules de la grille traversées par un segment (colonne par colonne)."""
+    ax, ay, bx, by = seg
+    if ax > bx:
+        ax, ay, bx, by = bx, by, ax, ay
+    floor = math.floor
+    x0, x1 = floor(ax / size), floor(bx / size)
+    if x0 == x1:
+        for gy in range(floor(min(ay, by) / size), floor(max(ay, by) / size) + 1):
+            yield x0, gy
+        return
+    slope = (by - ay) / (bx - ax)
+    for gx in range(x0, x1 + 1):
+        ya = ay + (max(ax, gx * size) - ax) * slope
+        yb = ay + (min(bx, (gx + 1) * size) - ax) * slope
+        for gy in range(floor(min(ya, yb) / size), floor(max(ya, yb) / size) + 1):
+            yield gx, gy
+
+
+def _adjacent(k, m, nseg, closed):
+    """Segments consécutifs (qui partagent un sommet par construction)."""
+    d = abs(k - m)
+    return d <= 1 or (closed and d == nseg - 1)
+
+
+def _intersection(s1, s2):
+    """Point d'intersection de deux segments, ou None."""
+    ax, ay, bx, by = s1
+    cx, cy, dx, dy = s2
+    rx, ry = bx - ax, by - ay
+    sx, sy = dx - cx, dy - cy
+    qx, qy = cx - ax, cy - ay
+    den = rx * sy - ry * sx
+    if den == 0:
+        if qx * ry - qy * rx != 0:
+            return None  # parallèles distincts
+        # Colinéaires : recouvrement des projections sur le premier segment
+        rr = rx * rx + ry * ry
+        t0 = (qx * rx + qy * ry) / rr
+        t1 = t0 + (sx * rx + sy * ry) / rr
+        lo, hi = min(t0, t1), max(t0, t1)
+        if hi < 0 or lo > 1:
+            return None
+        t = max(lo, 0.0)
+        return ax + t * rx, ay + t * ry
+    t = (qx * sy - qy * sx) / den
+    u = (qx * ry - qy * rx) / den
+    if 0 <= t <= 1 and 0 <= u <= 1:
+        return ax + t * rx, ay + t * ry
+    return None
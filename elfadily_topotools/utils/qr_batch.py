@@ -0,0 +1,192 @@
+"""
+Génération de QR codes par lots.
+- Encodage dans une simple boucle, en tâche de fond : l'encodeur est en
+  Python pur (GIL), un pool de threads n'y apporterait rien
+- Un PNG par point : rendu et compression PNG (Qt, hors GIL) sur un pool
+  de threads, pendant l'encodage des QR codes suivants
+- Sorties : un PNG par point, planche(s) PNG en grille, ou PDF A4 paginé
+- Chaque QR code est légendé (numéro de borne, identifiant...)
+"""
+
+import os
+import re
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+from qgis.PyQt.QtGui import QImage, QPainter, QColor, QFont, QPdfWriter, QPageSize, QPageLayout
+from qgis.PyQt.QtCore import Qt, QRect, QMarginsF
+
+from . import qr_images
+
+
+OUTPUT_PNG = "png"       # un fichier par point
+OUTPUT_SHEET = "sheet"   # planche(s) PNG en grille
+OUTPUT_PDF = "pdf"       # document A4, plusieurs QR codes par page
+
+MAX_WORKERS = 4               # PNG rendus / compressés simultanément
+MAX_SHEET_PIXELS = 25000000   # ~100 Mo par planche ; au-delà, planches suivantes
+
+
+class Canceled(Exception):
+    """Traitement interrompu par l'utilisateur."""
+
+
+def map_items(func, items, progress=None, is_canceled=None):
+    """
+    Applique func à chaque élément, dans l'ordre.
+
+    progress : callable(pourcentage) appelé au fil des éléments
+    is_canceled : callable() -> bool ; si True, lève Canceled
+    """
+    items = list(items)
+    total = len(items)
+    step = max(1, total // 100)
+    results = []
+    for i, item in enumerate(items):
+        if is_canceled and i % step == 0 and is_canceled():
+            raise Canceled()
+        results.append(func(item))
+        if progress and (i % step == 0 or i == total - 1):
+            progress(100.0 * (i + 1) / total)
+    return results
+
+
+def write_pngs(directory, matrices, names, size, progress=None, is_canceled=None,
+               workers=None):
+    """
+    Un PNG par QR code (matrices : itérable, éventuellement un générateur
+    qui encode au fil de l'eau). Rendu et compression sur un pool de
+    threads (QImage.save libère le GIL) pendant que la boucle appelante
+    encode les suivants. Retourne les fichiers dans l'ordre des noms.
+    """
+    workers = workers or min(MAX_WORKERS, os.cpu_count() or 1)
+    total = len(names)
+    step = max(1, total // 100)
+    files = []
+    pending = deque()
+
+    def save(matrix, name):
+        image = qr_images.render_qr(matrix, size)
+        file_path = os.path.join(directory, name)
+        if not image.save(file_path, "PNG"):
+            raise OSError(f"Impossible d'écrire {file_path}")
+        return file_path
+
+    def collect():
+        files.append(pending.popleft().result())
+        done = len(files)
+        if progress and (done % step == 0 or done == total):
+            progress(100.0 * done / total)
+
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        try:
+            for k, (matrix, name) in enumerate(zip(matrices, names)):
+                if is_canceled and k % step == 0 and is_canceled():
+                    raise Canceled()
+                pending.append(pool.submit(save, matrix, name))
+                if len(pending) >= 2 * workers:   # images en attente bornées
+                    collect()
+            while pending:
+                collect()
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+    return files
+
+
+def file_names(labels, prefix="qr_", ext=".png"):
+    """Noms de fichiers sûrs et uniques à partir des légendes."""
+    names, used = [], set()
+    for label in labels:
+        base = re.sub(r"[^\w\-.]+", "_", str(label)).strip("._") or "point"
+        name, count = base, 0
+        while name.lower() in used:
+            count += 1
+            name = f"{base}_{count}"
+        used.add(name.lower())
+        names.append(f"{prefix}{name}{ext}")
+    return names
+
+
+def _caption_font(pixel_size):
+    font = QFont("Segoe UI")
+    font.setPixelSize(max(8, int(pixel_size)))
+    return font
+
+
+def _paint_cell(painter, matrix, label, x, y, size, caption):
+    qr_images.paint_qr(painter, matrix, x, y, size)
+    painter.drawText(
+        QRect(x, y + size, size, caption), Qt.AlignHCenter | Qt.AlignTop, str(label)
+    )
+
+
+def write_sheets(path, matrices, labels, size, columns):
+    """
+    Planche PNG : grille de columns QR codes légendés. Si la planche
+    dépasse MAX_SHEET_PIXELS, elle est découpée en fichiers numérotés
+    (nom_001.png, nom_002.png...). Retourne la liste des fichiers écrits.
+    """
+    columns = max(1, min(columns, len(matrices)))
+    caption = max(20, size // 8)
+    cell_w, cell_h = size, size + caption
+    sheet_w = columns * cell_w
+    rows_total = (len(matrices) + columns - 1) // columns
+    rows_per_sheet = max(1, min(rows_total, MAX_SHEET_PIXELS // (sheet_w * cell_h)))
+    per_sheet = rows_per_sheet * columns
+
+    stem, ext = os.path.splitext(path)
+    written = []
+    for first in range(0, len(matrices), per_sheet):
+        chunk = matrices[first:first + per_sheet]
+        rows = (len(chunk) + columns - 1) // columns
+        image = QImage(sheet_w, rows * cell_h, QImage.Format_RGB32)
+        image.fill(QColor("white"))
+        painter = QPainter(image)
+        painter.setFont(_caption_font(caption * 0.6))
+        for k, matrix in enumerate(chunk):
+            row, col = divmod(k, columns)
+            _paint_cell(painter, matrix, labels[first + k],
+                        col * cell_w, row * cell_h, size, caption)
+        painter.end()
+
+        if per_sheet >= len(matrices):
+            sheet_path = path
+        else:
+            sheet_path = f"{stem}_{first // per_sheet + 1:03d}{ext or '.png'}"
+        if not image.save(sheet_path, "PNG"):
+            raise OSError(f"Impossible d'écrire {sheet_path}")
+        written.append(sheet_path)
+    return written
+
+
+def write_pdf(path, matrices, labels, columns, title=None):
+    """PDF A4 (300 dpi) : columns QR codes légendés par ligne, pages successives."""
+    writer = QPdfWriter(path)
+    writer.setPageSize(QPageSize(QPageSize.A4))
+    writer.setPageMargins(QMarginsF(10, 10, 10, 10), QPageLayout.Millimeter)
+    writer.setResolution(300)
+    if title:
+        writer.setTitle(title)
+
+    columns = max(1, columns)
+    width, height = writer.width(), writer.height()
+    cell_w = width // columns
+    size = int(cell_w * 0.85)
+    caption = max(40, size // 8)
+    cell_h = size + caption + (cell_w - size)
+    rows_per_page = max(1, height // cell_h)
+    per_page = rows_per_page * columns
+
+    painter = QPainter(writer)
+    painter.setFont(_caption_font(caption * 0.55))
+    for k, matrix in enumerate(matrices):
+        if k and k % per_page == 0:
+            writer.newPage()
+        row, col = divmod(k % per_page, columns)
+        x = col * cell_w + (cell_w - size) // 2
+        y = row * cell_h
+        _paint_cell(painter, matrix, labels[k], x, y, size, caption)
+    painter.end()
+    return [path]
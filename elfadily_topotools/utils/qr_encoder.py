@@ -0,0 +1,416 @@
+"""
+Encodeur QR code local, en Python pur (aucun accès réseau).
+- Mode octet (UTF-8), versions 1 à 40, niveaux de correction L / M / Q / H
+- Correction d'erreurs Reed-Solomon sur GF(256), blocs entrelacés
+- Choix automatique du plus petit symbole puis du masque le moins pénalisé
+- Produit la matrice des modules : le rendu (QImage, taille en pixels) se
+  fait à part, un changement de taille ne ré-encode rien
+- Gabarit calculé une fois par version (motifs fixes, ordre de placement,
+  masques, format) ; la matrice tient dans un seul entier, les pénalités
+  des 8 masques se calculent par opérations bit à bit
+"""
+
+from operator import itemgetter
+
+
+# Niveaux de correction : index des tables, bits du format
+EC_LEVELS = {"L": (0, 1), "M": (1, 0), "Q": (2, 3), "H": (3, 2)}
+
+# Codewords de correction par bloc [niveau][version]
+_ECC_PER_BLOCK = (
+    (-1, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28,
+     28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    (-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26,
+     26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),
+    (-1, 13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30,
+     28, 30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+    (-1, 17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28,
+     30, 24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),
+)
+
+# Nombre de blocs de correction [niveau][version]
+_NUM_BLOCKS = (
+    (-1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8,
+     8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25),
+    (-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16,
+     17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),
+    (-1, 1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20,
+     23, 23, 25, 27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),
+    (-1, 1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25,
+     25, 34, 30, 32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81),
+)
+
+# Tables exp / log de GF(256), polynôme 0x11D
+_EXP = [0] * 512
+_LOG = [0] * 256
+_value = 1
+for _i in range(255):
+    _EXP[_i] = _value
+    _LOG[_value] = _i
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11D
+for _i in range(255, 512):
+    _EXP[_i] = _EXP[_i - 255]
+del _i, _value
+
+_MASKS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+
+try:
+    _popcount = int.bit_count
+except AttributeError:  # Python < 3.10
+    def _popcount(value):
+        return bin(value).count("1")
+
+
+class QrError(ValueError):
+    """Données trop longues pour un QR code."""
+
+
+def encode(text, level="M", boost=True):
+    """
+    Encode un texte (UTF-8, mode octet) et retourne la matrice des modules :
+    liste de lignes de booléens (True = module noir), sans marge.
+
+    level : niveau de correction minimal ("L", "M", "Q", "H")
+    boost : monte le niveau de correction tant que la version ne change pas
+    """
+    data = text.encode("utf-8")
+    ecl = EC_LEVELS[level][0]
+
+    for version in range(1, 41):
+        count_bits = 8 if version < 10 else 16
+        used = 4 + count_bits + 8 * len(data)
+        if used <= _data_codewords(version, ecl) * 8:
+            break
+    else:
+        raise QrError("Texte trop long pour un QR code")
+
+    if boost:
+        for better in range(ecl + 1, 4):
+            if used <= _data_codewords(version, better) * 8:
+                ecl = better
+
+    # Flux de bits : mode octet, longueur, données, terminaison, bourrage
+    capacity = _data_codewords(version, ecl) * 8
+    bits = (0b0100 << count_bits | len(data)) << 8 * len(data) | int.from_bytes(data, "big")
+    shift = min(4, capacity - used)
+    shift += -(used + shift) % 8
+    codewords = list((bits << shift).to_bytes((used + shift) // 8, "big"))
+    codewords += [0xEC, 0x11] * ((capacity // 8 - len(codewords)) // 2 + 1)
+    del codewords[capacity // 8:]
+
+    return _symbol(version).build(_add_ecc(codewords, version, ecl), ecl)
+
+
+def _raw_modules(version):
+    """Modules disponibles pour les données (hors motifs fixes)."""
+    result = (16 * version + 128) * version + 64
+    if version >= 2:
+        align = version // 7 + 2
+        result -= (25 * align - 10) * align - 55
+        if version >= 7:
+            result -= 36
+    return result
+
+
+def _data_codewords(version, ecl):
+    return (_raw_modules(version) // 8
+            - _ECC_PER_BLOCK[ecl][version] * _NUM_BLOCKS[ecl][version])
+
+
+# ----------------------------------------------------------------
+# Reed-Solomon
+# ----------------------------------------------------------------
+
+def _gf_mul(a, b):
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+
+def _rs_divisor(degree):
+    result = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            result[j] = _gf_mul(result[j], root)
+            if j + 1 < degree:
+                result[j] ^= result[j + 1]
+        root = _gf_mul(root, 0x02)
+    return result
+
+
+def _rs_table(degree):
+    """Diviseur multiplié par chaque octet, en entiers de degree octets (par degré)."""
+    key = ("rs", degree)
+    if key not in _cache:
+        divisor = _rs_divisor(degree)
+        _cache[key] = [
+            int.from_bytes(bytes(_gf_mul(factor, coef) for coef in divisor), "big")
+            for factor in range(256)
+        ]
+    return _cache[key]
+
+
+def _rs_remainder(data, degree):
+    """Reste de la division polynomiale, le reste courant tenu dans un entier."""
+    table = _rs_table(degree)
+    high = 8 * (degree - 1)
+    keep = (1 << high) - 1
+    result = 0
+    for byte in data:
+        result = (result & keep) << 8 ^ table[byte ^ result >> high]
+    return list(result.to_bytes(degree, "big"))
+
+
+def _add_ecc(data, version, ecl):
+    """Découpe en blocs, ajoute la correction et entrelace les codewords."""
+    num_blocks = _NUM_BLOCKS[ecl][version]
+    ecc_len = _ECC_PER_BLOCK[ecl][version]
+    raw = _raw_modules(version) // 8
+    num_short = num_blocks - raw % num_blocks
+    short_len = raw // num_blocks
+
+    blocks = []
+    k = 0
+    for i in range(num_blocks):
+        size = short_len - ecc_len + (0 if i < num_short else 1)
+        block = data[k:k + size]
+        k += size
+        ecc = _rs_remainder(block, ecc_len)
+        if i < num_short:
+            block.append(0)  # emplacement vide, sauté à l'entrelacement
+        blocks.append(block + ecc)
+
+    result = []
+    for i in range(len(blocks[0])):
+        for j, block in enumerate(blocks):
+            if i != short_len - ecc_len or j >= num_short:
+                result.append(block[i])
+    return result
+
+
+# ----------------------------------------------------------------
+# Placement des modules
+# ----------------------------------------------------------------
+
+_cache = {}
+
+
+def _symbol(version):
+    key = ("symbol", version)
+    if key not in _cache:
+        _cache[key] = _Symbol(version)
+    return _cache[key]
+
+
+class _Symbol:
+    """
+    Gabarit d'une version, calculé une fois. La matrice est un seul entier :
+    le module (x, y) est le caractère y * (size + 1) + x de son écriture
+    binaire, chaque ligne suivie d'un séparateur toujours à 0.
+    """
+
+    def __init__(self, version):
+        self.version = version
+        self.size = version * 4 + 17
+        self.stride = self.size + 1
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self.is_function = [[False] * self.size for _ in range(self.size)]
+        self._draw_function_patterns()
+
+        # Caractère de chaque module pris dans : bits des données complétés
+        # de 0 (modules libres, dans l'ordre de placement), puis "0", "1"
+        size, stride = self.size, self.stride
+        free = self._data_order()
+        self.free = len(free)
+        light, dark = self.free, self.free + 1
+        index = [light] * (size * stride)
+        for y in range(size):
+            for x in range(size):
+                if self.modules[y][x]:
+                    index[y * stride + x] = dark
+        for x, y, _ in _format_positions(size):
+            index[y * stride + x] = light  # réécrit après le masque
+        for k, (x, y) in enumerate(free):
+            index[y * stride + x] = k
+        self.gather = itemgetter(*index)
+        self.masks = [
+            self._pack((x, y) for x, y in free if condition(x, y)) for condition in _MASKS
+        ]
+        self.formats = {}
+        del self.modules, self.is_function
+
+    def build(self, codewords, ecl):
+        """Place les codewords, applique le masque le moins pénalisé."""
+        total = len(codewords) * 8
+        bits = format(int.from_bytes(bytes(codewords), "big"), f"0{total}b")
+        base = int("".join(self.gather(bits + "0" * (self.free - total) + "01")), 2)
+        best, best_penalty = None, None
+        for mask in range(8):
+            matrix = (base ^ self.masks[mask]) | self._format(ecl, mask)
+            penalty = _penalty(matrix, self.size)
+            if best_penalty is None or penalty < best_penalty:
+                best, best_penalty = matrix, penalty
+        size, stride = self.size, self.stride
+        text = format(best, f"0{size * stride}b")
+        return [
+            [c == "1" for c in text[y * stride:y * stride + size]] for y in range(size)
+        ]
+
+    def _pack(self, cells):
+        """Entier de la matrice dont les modules (x, y) donnés sont à 1."""
+        chars = bytearray(b"0" * (self.size * self.stride))
+        for x, y in cells:
+            chars[y * self.stride + x] = ord("1")
+        return int(chars, 2)
+
+    def _format(self, ecl, mask):
+        key = (ecl, mask)
+        if key not in self.formats:
+            bits = _format_bits(ecl, mask)
+            self.formats[key] = self._pack(
+                (x, y) for x, y, i in _format_positions(self.size)
+                if i is None or (bits >> i) & 1
+            )
+        return self.formats[key]
+
+    def _set(self, x, y, dark):
+        self.modules[y][x] = dark
+        self.is_function[y][x] = True
+
+    def _draw_function_patterns(self):
+        size = self.size
+        for i in range(size):
+            self._set(6, i, i % 2 == 0)
+            self._set(i, 6, i % 2 == 0)
+
+        for cx, cy in ((3, 3), (size - 4, 3), (3, size - 4)):
+            for dy in range(-4, 5):
+                for dx in range(-4, 5):
+                    x, y = cx + dx, cy + dy
+                    if 0 <= x < size and 0 <= y < size:
+                        self._set(x, y, max(abs(dx), abs(dy)) not in (2, 4))
+
+        positions = self._alignment_positions()
+        last = len(positions) - 1
+        for i, ay in enumerate(positions):
+            for j, ax in enumerate(positions):
+                if (i, j) in ((0, 0), (0, last), (last, 0)):
+                    continue  # recouvre un motif de position
+                for dy in range(-2, 3):
+                    for dx in range(-2, 3):
+                        self._set(ax + dx, ay + dy, max(abs(dx), abs(dy)) != 1)
+
+        for x, y, _ in _format_positions(size):
+            self._set(x, y, False)  # réservé, écrit avec le masque
+        self._draw_version()
+
+    def _alignment_positions(self):
+        version = self.version
+        if version == 1:
+            return []
+        count = version // 7 + 2
+        step = (version * 8 + count * 3 + 5) // (count * 4 - 4) * 2
+        positions = [self.size - 7 - i * step for i in range(count - 1)] + [6]
+        return positions[::-1]
+
+    def _draw_version(self):
+        if self.version < 7:
+            return
+        rem = self.version
+        for _ in range(12):
+            rem = (rem << 1) ^ ((rem >> 11) * 0x1F25)
+        bits = self.version << 12 | rem
+        for i in range(18):
+            dark = (bits >> i) & 1 == 1
+            a, b = self.size - 11 + i % 3, i // 3
+            self._set(a, b, dark)
+            self._set(b, a, dark)
+
+    def _data_order(self):
+        """Modules libres (x, y) dans l'ordre de placement des bits."""
+        size = self.size
+        order = []
+        right = size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5  # colonne du motif de synchronisation
+            upward = ((right + 1) & 2) == 0
+            for vert in range(size):
+                y = size - 1 - vert if upward else vert
+                for x in (right, right - 1):
+                    if not self.is_function[y][x]:
+                        order.append((x, y))
+            right -= 2
+        return order
+
+
+def _format_bits(ecl, mask):
+    data = EC_LEVELS["LMQH"[ecl]][1] << 3 | mask
+    rem = data
+    for _ in range(10):
+        rem = (rem << 1) ^ ((rem >> 9) * 0x537)
+    return (data << 10 | rem) ^ 0x5412
+
+
+def _format_positions(size):
+    """(x, y, n° du bit) des deux copies du format ; None = module noir."""
+    positions = [(8, i, i) for i in range(6)]
+    positions += [(8, 7, 6), (8, 8, 7), (7, 8, 8)]
+    positions += [(14 - i, 8, i) for i in range(9, 15)]
+    positions += [(size - 1 - i, 8, i) for i in range(8)]
+    positions += [(8, size - 15 + i, i) for i in range(8, 15)]
+    positions.append((8, size - 8, None))
+    return positions
+
+
+def _valid(size):
+    """Tous les modules à 1, séparateurs exclus."""
+    key = ("valid", size)
+    if key not in _cache:
+        row = (1 << size) - 1 << 1
+        _cache[key] = sum(row << (size + 1) * y for y in range(size))
+    return _cache[key]
+
+
+def _penalty(matrix, size):
+    """
+    Pénalité d'un masque (règles N1 à N4 de la norme). Un décalage de 1
+    aligne chaque module sur son voisin de ligne, un décalage de size + 1
+    sur son voisin de colonne ; les séparateurs à 0 coupent les motifs.
+    """
+    stride = size + 1
+    dark = matrix
+    light = ~matrix & _valid(size)
+    penalty = 0
+    for step in (1, stride):
+        # Suites de 5 modules ou plus : 3, plus 1 par module au-delà de 5
+        for bits in (dark, light):
+            run = (bits & bits >> step & bits >> 2 * step & bits >> 3 * step
+                   & bits >> 4 * step)
+            penalty += _popcount(run) + 2 * _popcount(run & ~(run >> step))
+        # Motif 1:1:3:1:1 précédé ou suivi de 4 modules clairs
+        core = (dark & light >> step & dark >> 2 * step & dark >> 3 * step
+                & dark >> 4 * step & light >> 5 * step & dark >> 6 * step)
+        quiet = light & light >> step & light >> 2 * step & light >> 3 * step
+        penalty += 40 * (_popcount(core & quiet >> 7 * step)
+                         + _popcount(core >> 4 * step & quiet))
+
+    # Carrés 2x2 d'une même couleur
+    for bits in (dark, light):
+        penalty += 3 * _popcount(bits & bits >> 1 & bits >> stride & bits >> stride + 1)
+
+    total = size * size
+    k = (abs(_popcount(dark) * 20 - total * 10) + total - 1) // total - 1
+    return penalty + k * 10
@@ -0,0 +1,170 @@
+"""
+Images QR code de localisation : rendu et cache.
+- render_qr / paint_qr : matrice de modules -> QImage ou QPainter
+  (une bande par suite de modules noirs)
+- Cache mémoire LRU des matrices (par lien) et des images (lien, taille)
+- Cache disque des PNG dans le profil QGIS, borné en nombre de fichiers
+- Utilisable depuis les tâches de fond (accès protégés par un verrou)
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from qgis.PyQt.QtGui import QImage, QPainter, QColor
+from qgis.PyQt.QtCore import QRect
+from qgis.core import QgsApplication
+
+from . import qr_encoder
+
+
+def gmaps_url(lat, lon):
+    """Lien Google Maps encodé dans les QR codes."""
+    return f"https://www.google.com/maps?q={lat},{lon}"
+
+
+def paint_qr(painter, matrix, x, y, size, border=4):
+    """
+    Dessine une matrice de modules QR dans le carré (x, y, size) d'un
+    QPainter, avec une marge blanche de border modules (4 selon la norme).
+    """
+    module = size / (len(matrix) + 2 * border)
+    painter.fillRect(QRect(x, y, size, size), QColor("white"))
+    black = QColor("black")
+
+    def edge(i):
+        return int(round((border + i) * module))
+
+    for row_index, row in enumerate(matrix):
+        top, bottom = edge(row_index), edge(row_index + 1)
+        i = 0
+        while i < len(row):
+            if not row[i]:
+                i += 1
+                continue
+            start = i
+            while i < len(row) and row[i]:
+                i += 1
+            # Une seule bande par suite de modules noirs
+            painter.fillRect(
+                QRect(x + edge(start), y + top, edge(i) - edge(start), bottom - top), black
+            )
+
+
+def render_qr(matrix, size, border=4):
+    """Matrice de modules QR -> QImage carrée de size px."""
+    image = QImage(size, size, QImage.Format_RGB32)
+    painter = QPainter(image)
+    paint_qr(painter, matrix, 0, 0, size, border)
+    painter.end()
+    return image
+
+
+class QrImageCache:
+    """Cache à deux niveaux des QR codes de localisation."""
+
+    MAX_MATRICES = 256   # matrices encodées gardées en mémoire
+    MAX_IMAGES = 64      # images rendues gardées en mémoire
+    MAX_FILES = 500      # PNG gardés sur disque
+    PRUNE_EVERY = 50     # écritures entre deux nettoyages du dossier
+
+    def __init__(self, directory=None):
+        self._directory = directory
+        self._matrices = OrderedDict()
+        self._images = OrderedDict()
+        self._lock = threading.Lock()
+        self._writes = 0
+
+    @property
+    def directory(self):
+        if self._directory is None:
+            self._directory = os.path.join(
+                QgsApplication.qgisSettingsDirPath(), "elfadily_topotools", "qr_cache"
+            )
+        return self._directory
+
+    @staticmethod
+    def _remember(cache, key, value, limit):
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > limit:
+            cache.popitem(last=False)
+
+    def matrix(self, text):
+        """Matrice du texte, encodée une seule fois."""
+        with self._lock:
+            matrix = self._matrices.get(text)
+            if matrix is not None:
+                self._matrices.move_to_end(text)
+                return matrix
+        matrix = qr_encoder.encode(text)
+        with self._lock:
+            self._remember(self._matrices, text, matrix, self.MAX_MATRICES)
+        return matrix
+
+    def cached(self, lat, lon, size):
+        """Image déjà en mémoire, ou None (aucun calcul, aucun accès disque)."""
+        key = (gmaps_url(lat, lon), size)
+        with self._lock:
+            image = self._images.get(key)
+            if image is not None:
+                self._images.move_to_end(key)
+            return image
+
+    def image(self, lat, lon, size):
+        """Image du QR code : mémoire, puis disque, sinon rendu et mise en cache."""
+        image = self.cached(lat, lon, size)
+        if image is not None:
+            return image
+
+        text = gmaps_url(lat, lon)
+        path = self._path(text, size)
+        image = QImage(path) if os.path.exists(path) else QImage()
+        if image.isNull():
+            image = render_qr(self.matrix(text), size)
+            self._store(path, image)
+
+        with self._lock:
+            self._remember(self._images, (text, size), image, self.MAX_IMAGES)
+        return image
+
+    def _path(self, text, size):
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()[:20]
+        return os.path.join(self.directory, f"{digest}_{size}.png")
+
+    def _store(self, path, image):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            image.save(path, "PNG")
+        except OSError:
+            return  # le cache disque est facultatif
+        with self._lock:
+            self._writes += 1
+            prune = self._writes % self.PRUNE_EVERY == 0
+        if prune:
+            self._prune()
+
+    def _prune(self):
+        """Supprime les PNG les plus anciens au-delà de MAX_FILES."""
+        try:
+            entries = [e for e in os.scandir(self.directory) if e.name.endswith(".png")]
+        except OSError:
+            return
+        if len(entries) <= self.MAX_FILES:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.MAX_FILES]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self._lock:
+            self._matrices.clear()
+            self._images.clear()
+
+
+# Cache partagé par le dialogue, l'outil de capture et le traitement par lots
+CACHE = QrImageCache()
@@ -0,0 +1,158 @@
+"""
+Cache des cartes rendues (GeoTIFF de travail du rendu par tuiles).
+- Clé : empreinte SHA-1 des paramètres du rendu (emprise, SCR, couches
+  et styles, taille, DPI...), calculée par l'appelant
+- Index mémoire LRU (clé -> fichier, couches utilisées), fichiers sur
+  disque bornés en volume et en âge
+- Invalidation par couche : les rendus qui l'utilisent sont supprimés
+- Python pur, utilisable depuis les tâches de fond (verrou)
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+MAX_BYTES = 2 * 1024 ** 3      # volume maximal sur disque (octets)
+MAX_ENTRIES = 64               # rendus gardés dans l'index mémoire
+MAX_AGE = 7 * 24 * 3600        # âge maximal d'un rendu (s)
+EXT = ".tif"
+
+
+def make_key(parts):
+    """Empreinte d'une suite de valeurs (repr stable : nombres, textes, tuples)."""
+    return hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+
+
+class RenderCache:
+    """Rendus réutilisables : un GeoTIFF par clé dans directory."""
+
+    def __init__(self, directory, max_bytes=MAX_BYTES, max_entries=MAX_ENTRIES, max_age=MAX_AGE):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._index = OrderedDict()   # clé -> couches utilisées
+        self._lock = threading.Lock()
+        self._parts = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + EXT)
+
+    def get(self, key, layer_ids=()):
+        """Chemin du rendu en cache, ou None."""
+        path = self._path(key)
+        with self._lock:
+            known = key in self._index
+            if known:
+                self._index.move_to_end(key)
+        try:
+            age = time.time() - os.path.getmtime(path)
+        except OSError:
+            self._forget(key)
+            return None
+        if not known and age > self.max_age:
+            self._remove(key)
+            return None
+        try:
+            os.utime(path)   # dernière utilisation, pour l'élagage
+        except OSError:
+            pass
+        if not known:
+            self._remember(key, layer_ids)
+        return path
+
+    def reserve(self, key):
+        """Fichier de travail où écrire le rendu de key (voir commit)."""
+        os.makedirs(self.directory, exist_ok=True)
+        with self._lock:
+            self._parts += 1
+            part = self._parts
+        return os.path.join(self.directory, f"{key}.{os.getpid()}_{part}.part{EXT}")
+
+    def commit(self, key, work, layer_ids=()):
+        """Enregistre le rendu écrit dans work ; retourne son chemin final
+        (work lui-même s'il est trop gros pour le cache)."""
+        if os.path.getsize(work) > self.max_bytes // 2:
+            return work
+        path = self._path(key)
+        os.replace(work, path)
+        self._remember(key, layer_ids)
+        self.prune()
+        return path
+
+    def discard(self, work):
+        """Supprime un fichier de travail inutilisé (rendu annulé, trop gros...)."""
+        try:
+            os.remove(work)
+        except OSError:
+            pass
+
+    def _remember(self, key, layer_ids):
+        with self._lock:
+            self._index[key] = frozenset(layer_ids)
+            self._index.move_to_end(key)
+            while len(self._index) > self.max_entries:
+                self._index.popitem(last=False)
+
+    def _forget(self, key):
+        with self._lock:
+            self._index.pop(key, None)
+
+    def _remove(self, key):
+        self._forget(key)
+        path = self._path(key)
+        # .aux.xml : statistiques écrites par GDAL quand le rendu est lu comme couche
+        for name in (path, path + ".aux.xml"):
+            try:
+                os.remove(name)
+            except OSError:
+                pass
+
+    def invalidate(self, layer_id):
+        """Supprime les rendus connus qui utilisent la couche."""
+        with self._lock:
+            keys = [key for key, layers in self._index.items() if layer_id in layers]
+        for key in keys:
+            self._remove(key)
+        return len(keys)
+
+    def prune(self):
+        """Supprime les rendus trop vieux, puis les moins récemment utilisés
+        au-delà de max_bytes."""
+        try:
+            entries = [e for e in os.scandir(self.directory)
+                       if e.name.endswith(EXT) and ".part" not in e.name]
+        except OSError:
+            return
+        now = time.time()
+        stats = []
+        for entry in entries:
+            try:
+                stats.append((entry.stat().st_mtime, entry.stat().st_size, entry.name))
+            except OSError:
+                continue
+        stats.sort()
+        total = sum(size for _, size, _ in stats)
+        for mtime, size, name in stats:
+            if total <= self.max_bytes and now - mtime <= self.max_age:
+                continue
+            self._remove(name[:-len(EXT)])
+            total -= size
+
+    def clear(self):
+        """Vide le cache (index et fichiers)."""
+        with self._lock:
+            self._index.clear()
+        try:
+            entries = list(os.scandir(self.directory))
+        except OSError:
+            return
+        for entry in entries:
+            if entry.name.endswith((EXT, EXT + ".aux.xml")):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass
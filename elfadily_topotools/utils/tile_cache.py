@@ -0,0 +1,266 @@
+"""
+Cache local de tuiles de fond de carte (XYZ), au format MBTiles.
+- Un fichier SQLite par source (modèle d'URL), lisible par QGIS et GDAL
+- Préchargement d'une emprise : seules les tuiles manquantes sont
+  téléchargées, en parallèle
+- Éviction LRU (date de dernière utilisation) au-delà de max_bytes,
+  jamais dans la plage qui vient d'être préchargée
+- Python pur (sqlite3, urllib) : la fonction de téléchargement est
+  injectable (réseau QGIS, serveur de tuiles local de test...)
+"""
+
+import hashlib
+import math
+import os
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+ORIGIN = 20037508.342789244          # demi-étendue de EPSG:3857 (m)
+TILE_PX = 256
+MAX_BYTES = 512 * 1024 * 1024        # taille maximale d'un cache (octets)
+MAX_TILES = 20000                    # tuiles préchargées au plus par export
+FETCH_WORKERS = 8
+BATCH = 256                          # tuiles téléchargées entre deux écritures
+
+
+class Canceled(Exception):
+    """Préchargement interrompu par l'utilisateur."""
+
+
+def zoom_for_resolution(resolution, zmin=0, zmax=19):
+    """Plus petit niveau de zoom dont les tuiles sont au moins aussi fines
+    que resolution (m/px en EPSG:3857)."""
+    if resolution <= 0:
+        return zmax
+    level = math.ceil(math.log2(2 * ORIGIN / TILE_PX / resolution) - 1e-9)
+    return max(zmin, min(zmax, level))
+
+
+def tile_range(xmin, ymin, xmax, ymax, zoom):
+    """Tuiles XYZ (ligne 0 en haut) couvrant une emprise EPSG:3857 :
+    (x0, y0, x1, y1) inclus."""
+    count = 2 ** zoom
+    span = 2 * ORIGIN / count
+
+    def clamp(v):
+        return max(0, min(count - 1, v))
+
+    x0 = clamp(int(math.floor((xmin + ORIGIN) / span)))
+    x1 = clamp(int(math.floor((xmax + ORIGIN) / span)))
+    y0 = clamp(int(math.floor((ORIGIN - ymax) / span)))
+    y1 = clamp(int(math.floor((ORIGIN - ymin) / span)))
+    return x0, y0, x1, y1
+
+
+def quadkey(zoom, x, y):
+    """Clé de tuile Bing ({q})."""
+    digits = []
+    for i in range(zoom, 0, -1):
+        mask = 1 << (i - 1)
+        digits.append(str((1 if x & mask else 0) + (2 if y & mask else 0)))
+    return "".join(digits)
+
+
+def tile_url(template, zoom, x, y):
+    """URL d'une tuile : {x}, {y}, {z}, {-y} (TMS) et {q} (quadkey)."""
+    return (
+        template.replace("{z}", str(zoom))
+        .replace("{x}", str(x))
+        .replace("{-y}", str(2 ** zoom - 1 - y))
+        .replace("{y}", str(y))
+        .replace("{q}", quadkey(zoom, x, y))
+    )
+
+
+def urllib_fetch(url, headers=None, timeout=30):
+    """Téléchargement simple ; retourne les octets ou None (tuile absente)."""
+    request = urllib.request.Request(url, headers=headers or {})
+    try:
+        with urllib.request.urlopen(request, timeout=timeout) as reply:
+            return reply.read()
+    except (urllib.error.URLError, OSError):
+        return None
+
+
+def cache_path(directory, template):
+    """Fichier MBTiles d'une source, nommé d'après son modèle d'URL."""
+    digest = hashlib.sha1(template.encode("utf-8")).hexdigest()[:16]
+    return os.path.join(directory, f"{digest}.mbtiles")
+
+
+class TileCache:
+    """Fichier MBTiles d'une source XYZ, avec préchargement et éviction."""
+
+    def __init__(self, path, template, max_bytes=MAX_BYTES, fetch=None, headers=None):
+        self.path = path
+        self.template = template
+        self.max_bytes = max_bytes
+        self.fetch = fetch or urllib_fetch
+        self.headers = headers or {}
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._init_schema()
+
+    def _init_schema(self):
+        with self._lock, self._db:
+            self._db.execute("PRAGMA auto_vacuum = INCREMENTAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS metadata (name TEXT PRIMARY KEY, value TEXT)"
+            )
+            # Table MBTiles standard + date d'utilisation pour l'éviction
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS tiles ("
+                " zoom_level INTEGER, tile_column INTEGER, tile_row INTEGER,"
+                " tile_data BLOB, last_used INTEGER,"
+                " PRIMARY KEY (zoom_level, tile_column, tile_row))"
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS tiles_last_used ON tiles (last_used)"
+            )
+            fmt = "jpg" if ".jp" in self.template.lower() else "png"
+            for name, value in (
+                ("name", "ELFADILY TopoTools - cache"),
+                ("type", "baselayer"),
+                ("version", "1.0"),
+                ("format", fmt),
+                ("description", self.template),
+                ("bounds", "-180,-85.0511,180,85.0511"),
+                ("minzoom", "0"),
+                ("maxzoom", "22"),
+            ):
+                self._db.execute(
+                    "INSERT OR IGNORE INTO metadata (name, value) VALUES (?, ?)", (name, value)
+                )
+
+    @staticmethod
+    def _row(zoom, y):
+        """Ligne XYZ -> ligne TMS (convention MBTiles)."""
+        return 2 ** zoom - 1 - y
+
+    def get(self, zoom, x, y):
+        """Octets d'une tuile en cache, ou None."""
+        row = self._row(zoom, y)
+        with self._lock, self._db:
+            found = self._db.execute(
+                "SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ?"
+                " AND tile_row = ?", (zoom, x, row)
+            ).fetchone()
+            if found is not None:
+                self._db.execute(
+                    "UPDATE tiles SET last_used = ? WHERE zoom_level = ? AND tile_column = ?"
+                    " AND tile_row = ?", (int(time.time()), zoom, x, row)
+                )
+        return found[0] if found else None
+
+    def missing(self, zoom, x0, y0, x1, y1):
+        """Tuiles (x, y) de la plage absentes du cache."""
+        with self._lock:
+            present = set(self._db.execute(
+                "SELECT tile_column, tile_row FROM tiles WHERE zoom_level = ?"
+                " AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?",
+                (zoom, x0, x1, self._row(zoom, y1), self._row(zoom, y0))
+            ))
+        return [
+            (x, y)
+            for y in range(y0, y1 + 1)
+            for x in range(x0, x1 + 1)
+            if (x, self._row(zoom, y)) not in present
+        ]
+
+    def prefetch(self, zoom, x0, y0, x1, y1, progress=None, is_canceled=None):
+        """
+        Télécharge les tuiles manquantes de la plage et marque toute la
+        plage comme utilisée. Retourne (téléchargées, en échec).
+
+        progress : callable(pourcentage)
+        is_canceled : callable() -> bool ; si True, lève Canceled
+        """
+        now = int(time.time())
+        with self._lock, self._db:
+            self._db.execute(
+                "UPDATE tiles SET last_used = ? WHERE zoom_level = ?"
+                " AND tile_column BETWEEN ? AND ? AND tile_row BETWEEN ? AND ?",
+                (now, zoom, x0, x1, self._row(zoom, y1), self._row(zoom, y0))
+            )
+
+        todo = self.missing(zoom, x0, y0, x1, y1)
+        fetched = failed = 0
+
+        def job(xy):
+            url = tile_url(self.template, zoom, *xy)
+            return xy, self.fetch(url, self.headers)
+
+        with ThreadPoolExecutor(max_workers=FETCH_WORKERS) as pool:
+            for start in range(0, len(todo), BATCH):
+                if is_canceled and is_canceled():
+                    raise Canceled()
+                rows = []
+                for (x, y), data in pool.map(job, todo[start:start + BATCH]):
+                    if data:
+                        rows.append((zoom, x, self._row(zoom, y), sqlite3.Binary(data), now))
+                    else:
+                        failed += 1
+                with self._lock, self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO tiles"
+                        " (zoom_level, tile_column, tile_row, tile_data, last_used)"
+                        " VALUES (?, ?, ?, ?, ?)", rows
+                    )
+                fetched += len(rows)
+                if progress:
+                    progress(100.0 * min(start + BATCH, len(todo)) / len(todo))
+
+        # La plage qui vient d'être préchargée n'est jamais évincée
+        self.evict(keep=(zoom, x0, y0, x1, y1))
+        return fetched, failed
+
+    def size(self):
+        """Volume des tuiles en cache (octets)."""
+        with self._lock:
+            total = self._db.execute("SELECT SUM(LENGTH(tile_data)) FROM tiles").fetchone()[0]
+        return total or 0
+
+    def evict(self, keep=None):
+        """
+        Supprime les tuiles les moins récemment utilisées au-delà de max_bytes
+        (jusqu'à 90 % de la limite, pour ne pas évincer à chaque export).
+        keep : plage (zoom, x0, y0, x1, y1) protégée, même si elle dépasse
+        à elle seule la limite (tuiles de l'export en cours).
+        """
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return 0
+        excess += self.max_bytes // 10
+        query = "SELECT zoom_level, tile_column, tile_row, LENGTH(tile_data) FROM tiles"
+        params = ()
+        if keep is not None:
+            zoom, x0, y0, x1, y1 = keep
+            query += (" WHERE NOT (zoom_level = ? AND tile_column BETWEEN ? AND ?"
+                      " AND tile_row BETWEEN ? AND ?)")
+            params = (zoom, x0, x1, self._row(zoom, y1), self._row(zoom, y0))
+        removed = []
+        with self._lock:
+            for zoom, column, row, length in self._db.execute(
+                query + " ORDER BY last_used", params
+            ):
+                removed.append((zoom, column, row))
+                excess -= length
+                if excess <= 0:
+                    break
+            with self._db:
+                self._db.executemany(
+                    "DELETE FROM tiles WHERE zoom_level = ? AND tile_column = ?"
+                    " AND tile_row = ?", removed
+                )
+            self._db.execute("PRAGMA incremental_vacuum")
+        return len(removed)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
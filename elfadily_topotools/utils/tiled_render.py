@@ -0,0 +1,403 @@
+"""
+Rendu cartographique par tuiles, à mémoire bornée.
+- L'image finale est découpée en tuiles de TILE_SIZE px, rendues l'une
+  après l'autre (un seul job QGIS à la fois)
+- Jobs de rendu préparés dans le thread GUI (JobPreparer) ; seul le rendu
+  du job préparé tourne dans la tâche de fond, comme QgsMapRendererTask
+- Chaque tuile est rendue avec une marge de recouvrement (symboles coupés
+  au bord), puis recadrée
+- Étiquettes placées une seule fois pour toute la carte (QGIS >= 3.24),
+  puis rejouées sur chaque tuile : ni doublons ni trous aux raccords
+- Les tuiles sont écrites au fil de l'eau par GDAL : GeoTIFF direct,
+  PNG / JPEG par copie ligne à ligne d'un GeoTIFF temporaire
+- La mémoire utilisée ne dépend pas de la taille de l'image exportée
+- Un seul rendu pour plusieurs formats : chaque format est encodé depuis
+  le GeoTIFF de travail, en parallèle
+- Les couches hors de l'emprise ou de leur plage d'échelles sont
+  écartées avant le rendu (prune_layers)
+"""
+
+import os
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from osgeo import gdal
+from qgis.PyQt.QtGui import QImage, QPainter, QPicture
+from qgis.PyQt.QtCore import (
+    Qt, QCoreApplication, QObject, QThread, QSize, QRect, pyqtSignal
+)
+from qgis.core import (
+    Qgis, QgsCsException, QgsMapSettings, QgsMapRendererStagedRenderJob,
+    QgsRasterLayer, QgsRectangle
+)
+
+
+TILE_SIZE = 2048     # côté d'une tuile (px)
+OVERLAP = 64         # recouvrement autour de chaque tuile (px)
+MAX_THREADS = 4      # formats encodés simultanément (GDAL, hors GIL)
+
+# Rendu des étiquettes seules (QGIS >= 3.24) ; sinon étiquettes par tuile
+SKIP_SYMBOLS = getattr(getattr(Qgis, "MapSettingsFlag", None), "SkipSymbolRendering", None)
+
+# Format -> (pilote GDAL, extension, options de création)
+FORMATS = {
+    "PNG": ("PNG", "png", ["ZLEVEL=6"]),
+    "JPEG": ("JPEG", "jpg", ["QUALITY=95"]),
+    # GeoTIFF + fichier de géoréférencement .tfw
+    "GeoTIFF": ("GTiff", "tif", ["TILED=YES", "COMPRESS=DEFLATE", "BIGTIFF=IF_SAFER", "TFW=YES"]),
+    # PDF géoréférencé, page à la taille de l'image au DPI du rendu
+    "PDF": ("PDF", "pdf", ["COMPRESS=JPEG", "JPEG_QUALITY=90"]),
+}
+
+
+class Canceled(Exception):
+    """Rendu interrompu par l'utilisateur."""
+
+
+class JobPreparer(QObject):
+    """
+    Prépare les jobs de rendu dans le thread GUI pour une tâche de fond :
+    QGIS n'autorise dans un thread de travail que le rendu d'un job déjà
+    préparé (QgsMapRendererTask prépare le sien dans son constructeur).
+    À créer dans le thread GUI, par exemple dans le constructeur de la tâche.
+    """
+
+    _requested = pyqtSignal(int, object)   # numéro de demande, QgsMapSettings
+
+    def __init__(self):
+        super().__init__()
+        self._done = threading.Event()
+        self._serial = 0
+        self._result = None
+        self._requested.connect(self._prepare, Qt.QueuedConnection)
+
+    def _prepare(self, serial, settings):
+        try:
+            job = QgsMapRendererStagedRenderJob(settings)
+            job.start()
+            result = (job, None)
+        except Exception as e:
+            result = (None, e)
+        if serial == self._serial:   # demande abandonnée (annulation) : ignorée
+            self._result = result
+            self._done.set()
+
+    def prepare(self, settings, is_canceled=None):
+        """
+        Job préparé pour settings. Depuis la tâche : la préparation est
+        demandée au thread GUI, attendue en surveillant l'annulation.
+        """
+        self._serial += 1
+        self._done.clear()
+        if QThread.currentThread() == self.thread():
+            self._prepare(self._serial, settings)
+        else:
+            self._requested.emit(self._serial, settings)
+            while not self._done.wait(0.05):
+                if is_canceled and is_canceled():
+                    self._serial += 1
+                    raise Canceled()
+        job, error = self._result
+        self._result = None
+        if error is not None:
+            raise error
+        return job
+
+
+def _render_job(job, painter):
+    """Rend un job préparé, étape par étape (couches, puis étiquettes)."""
+    while not job.isFinished():
+        job.renderCurrentPart(painter)
+        job.nextPart()
+
+
+def tile_grid(width, height, tile=TILE_SIZE):
+    """Découpe width x height px en tuiles (x, y, largeur, hauteur)."""
+    return [
+        (x, y, min(tile, width - x), min(tile, height - y))
+        for y in range(0, height, tile)
+        for x in range(0, width, tile)
+    ]
+
+
+def image_extent(extent, width):
+    """
+    Emprise exacte de l'image (même échelle sur les deux axes) et
+    hauteur en px, comme QgsMapSettings l'ajusterait.
+    Retourne (emprise, hauteur, unités de carte par pixel).
+    """
+    mupp = extent.width() / width
+    height = max(1, int(round(extent.height() / mupp)))
+    cy = extent.center().y()
+    half = height * mupp / 2
+    rect = QgsRectangle(extent.xMinimum(), cy - half, extent.xMaximum(), cy + half)
+    return rect, height, mupp
+
+
+def fit_extent(extent, width, height):
+    """Agrandit extent (centré) au rapport width / height d'un cadre."""
+    ratio = width / height
+    w, h = extent.width(), extent.height()
+    if w / h < ratio:
+        w = h * ratio
+    else:
+        h = w / ratio
+    c = extent.center()
+    return QgsRectangle(c.x() - w / 2, c.y() - h / 2, c.x() + w / 2, c.y() + h / 2)
+
+
+def prune_layers(settings, extent, width):
+    """
+    Copie de settings sans les couches qui ne dessineraient rien sur
+    extent à width px : emprise disjointe de la carte (marge OVERLAP px
+    comprise, pour les étiquettes et symboles au bord) ou échelle hors
+    de leur plage de visibilité. Les couches d'emprise inconnue sont gardées.
+    """
+    full, height, mupp = image_extent(extent, width)
+    ms = QgsMapSettings(settings)
+    ms.setExtent(full)
+    ms.setOutputSize(QSize(width, height))
+    scale = ms.scale()
+    visible = ms.visibleExtent().buffered(OVERLAP * mupp)
+
+    kept = []
+    for layer in settings.layers():
+        if layer.hasScaleBasedVisibility() and not layer.isInScaleRange(scale):
+            continue
+        layer_extent = layer.extent()
+        if not layer_extent.isNull():
+            try:
+                if not ms.layerExtentToOutputExtent(layer, layer_extent).intersects(visible):
+                    continue
+            except QgsCsException:
+                pass  # emprise non reprojetable : couche gardée
+        kept.append(layer)
+
+    pruned = QgsMapSettings(settings)
+    pruned.setLayers(kept)
+    return pruned
+
+
+def _label_picture(settings, full, width, height, prepare):
+    """
+    Étiquettes de toute la carte, placées en une passe et enregistrées
+    dans un QPicture (commandes de dessin : la mémoire dépend du nombre
+    d'étiquettes, pas de la taille de l'image). None sans étiquettes.
+    """
+    layers = [layer for layer in settings.layers() if not isinstance(layer, QgsRasterLayer)]
+    if not layers:
+        return None
+    ms = QgsMapSettings(settings)
+    ms.setLayers(layers)
+    ms.setExtent(full)
+    ms.setOutputSize(QSize(width, height))
+    ms.setFlag(SKIP_SYMBOLS, True)
+
+    job = prepare(ms)
+    picture = QPicture()
+    painter = QPainter(picture)
+    _render_job(job, painter)
+    painter.end()
+    return picture
+
+
+def _render_tile(settings, full, mupp, x, y, w, h, overlap, prepare, labels=None):
+    """
+    Rend une tuile (+ recouvrement), puis y rejoue les étiquettes de la
+    carte entière (labels) ; retourne ses pixels recadrés (octets B, G, R, X).
+    """
+    left = min(overlap, x)
+    top = min(overlap, y)
+    rw, rh = w + left + overlap, h + top + overlap
+
+    ms = QgsMapSettings(settings)
+    xmin = full.xMinimum() + (x - left) * mupp
+    ymax = full.yMaximum() - (y - top) * mupp
+    ms.setExtent(QgsRectangle(xmin, ymax - rh * mupp, xmin + rw * mupp, ymax))
+    ms.setOutputSize(QSize(rw, rh))
+    job = prepare(ms)
+
+    image = QImage(rw, rh, QImage.Format_ARGB32_Premultiplied)
+    dpm = int(round(settings.outputDpi() / 0.0254))
+    image.setDotsPerMeterX(dpm)
+    image.setDotsPerMeterY(dpm)
+    image.fill(settings.backgroundColor())
+    painter = QPainter(image)
+    _render_job(job, painter)
+    if labels is not None:
+        painter.drawPicture(left - x, top - y, labels)
+    painter.end()
+
+    tile = image.copy(QRect(left, top, w, h)).convertToFormat(QImage.Format_RGB32)
+    return tile.constBits().asstring(tile.sizeInBytes())
+
+
+def render_to_file(settings, extent, width, path, fmt="PNG",
+                   progress=None, is_canceled=None, tile=TILE_SIZE, preparer=None):
+    """
+    Rend la carte décrite par settings (QgsMapSettings : couches, SCR,
+    DPI...) sur extent, à width px de large, directement dans path.
+    Retourne (largeur, hauteur). Lève Canceled ou IOError.
+
+    progress : callable(pourcentage) appelé après chaque tuile
+    is_canceled : callable() -> bool
+    preparer : JobPreparer créé dans le thread GUI ; obligatoire quand le
+    rendu tourne dans une tâche de fond
+    """
+    return render_to_files(settings, extent, width, [(fmt, path)],
+                           progress, is_canceled, tile, preparer=preparer)
+
+
+def render_to_files(settings, extent, width, outputs,
+                    progress=None, is_canceled=None, tile=TILE_SIZE, work=None, preparer=None):
+    """
+    Comme render_to_file, mais la carte n'est rendue qu'une fois puis
+    encodée dans chaque sortie de outputs [(format, chemin), ...]
+    (un thread par format). Rendu 0-90 %, encodage 90-100 %.
+
+    work : GeoTIFF de travail à conserver (cache des rendus) ; par défaut
+    le GeoTIFF demandé, sinon un fichier temporaire supprimé à la fin.
+    """
+    if preparer is None:
+        if QThread.currentThread() != QCoreApplication.instance().thread():
+            raise RuntimeError("Rendu depuis une tâche de fond sans JobPreparer")
+        preparer = JobPreparer()
+    full, height, mupp = image_extent(extent, width)
+
+    if settings.rotation():
+        # Pas de découpage possible avec une rotation : une seule tuile
+        tile = max(width, height)
+
+    keep = work is not None
+    direct = None
+    if not keep:
+        direct = next((path for fmt, path in outputs if FORMATS[fmt][0] == "GTiff"), None)
+    if direct:
+        work = direct
+        options = FORMATS["GeoTIFF"][2]
+    else:
+        if not keep:
+            handle, work = tempfile.mkstemp(suffix=".tif")
+            os.close(handle)
+        options = ["TILED=YES", "BIGTIFF=IF_SAFER"]
+    copies = [(fmt, path) for fmt, path in outputs if path != work]
+
+    gtiff = gdal.GetDriverByName("GTiff")
+    ds = gtiff.Create(work, width, height, 3, gdal.GDT_Byte, options)
+    if ds is None:
+        raise IOError(f"Impossible de créer {work} : {gdal.GetLastErrorMsg()}")
+    render_progress = progress and (lambda p: progress(0.9 * p if copies else p))
+    try:
+        ds.SetGeoTransform((full.xMinimum(), mupp, 0, full.yMaximum(), 0, -mupp))
+        ds.SetProjection(settings.destinationCrs().toWkt())
+        _render_tiles(ds, settings, full, mupp, width, height, tile,
+                      lambda ms: preparer.prepare(ms, is_canceled),
+                      render_progress, is_canceled)
+        ds.FlushCache()
+        ds = None
+        encode(work, copies, settings.outputDpi(),
+               progress and (lambda p: progress(90 + 0.1 * p)), is_canceled)
+    except BaseException:
+        ds = None
+        for fmt, path in outputs:
+            _remove(gdal.GetDriverByName(FORMATS[fmt][0]), path)
+        if keep:
+            _remove(gtiff, work)
+        raise
+    finally:
+        if not direct and not keep:
+            _remove(gtiff, work)
+    return width, height
+
+
+def encode(work, outputs, dpi, progress=None, is_canceled=None):
+    """
+    Encode un GeoTIFF déjà rendu dans chaque sortie de outputs
+    [(format, chemin), ...], en parallèle. Lève Canceled ou IOError
+    (les sorties partielles sont supprimées).
+    """
+    if not outputs:
+        return
+    done = 0
+    try:
+        with ThreadPoolExecutor(max_workers=min(len(outputs), MAX_THREADS)) as pool:
+            futures = []
+            for fmt, path in outputs:
+                driver_name, _, options = FORMATS[fmt]
+                if driver_name == "PDF":
+                    options = options + [f"DPI={dpi:g}"]
+                futures.append(pool.submit(_copy_as, work, path, driver_name, options))
+            for future in futures:
+                if is_canceled and is_canceled():
+                    for pending in futures:
+                        pending.cancel()
+                    raise Canceled()
+                future.result()
+                done += 1
+                if progress:
+                    progress(100.0 * done / len(outputs))
+    except BaseException:
+        for fmt, path in outputs:
+            _remove(gdal.GetDriverByName(FORMATS[fmt][0]), path)
+        raise
+
+
+def _render_tiles(ds, settings, full, mupp, width, height, tile, prepare,
+                  progress, is_canceled):
+    """
+    Tuiles rendues l'une après l'autre dans le thread appelant, chacune
+    par un job préparé dans le thread GUI (prepare) : jamais plusieurs
+    jobs à la fois sur les mêmes couches. Une seule tuile en mémoire.
+    """
+    tiles = tile_grid(width, height, tile)
+    overlap = 0 if settings.rotation() else OVERLAP
+    labels = None
+    if len(tiles) > 1 and SKIP_SYMBOLS is not None:
+        labels = _label_picture(settings, full, width, height, prepare)
+        if labels is not None:
+            settings = QgsMapSettings(settings)
+            settings.setFlag(QgsMapSettings.DrawLabeling, False)
+    # QGIS < 3.24 : étiquettes placées tuile par tuile (doublons possibles
+    # le long des raccords, atténués par le recouvrement)
+
+    for done, (x, y, w, h) in enumerate(tiles, 1):
+        if is_canceled and is_canceled():
+            raise Canceled()
+        data = _render_tile(settings, full, mupp, x, y, w, h, overlap, prepare, labels)
+        # Octets B, G, R, X par pixel -> bandes 3, 2, 1
+        err = ds.WriteRaster(
+            x, y, w, h, data, w, h, gdal.GDT_Byte, [3, 2, 1],
+            buf_pixel_space=4, buf_line_space=4 * w, buf_band_space=1
+        )
+        if err != gdal.CE_None:
+            raise IOError(f"Écriture impossible : {gdal.GetLastErrorMsg()}")
+        if progress:
+            progress(100.0 * done / len(tiles))
+
+
+def _copy_as(src_path, dst_path, driver_name, options):
+    """Copie ligne à ligne du GeoTIFF de travail vers un autre format.
+    Sûr depuis plusieurs threads (un jeu de données GDAL par appel)."""
+    src = gdal.Open(src_path)
+    # Images simples : pas de fichier .aux.xml de géoréférencement
+    # (option propre au thread, sans effet sur les encodages voisins)
+    previous = gdal.GetThreadLocalConfigOption("GDAL_PAM_ENABLED", None)
+    gdal.SetThreadLocalConfigOption("GDAL_PAM_ENABLED", "NO")
+    try:
+        dst = gdal.GetDriverByName(driver_name).CreateCopy(dst_path, src, 0, options)
+        if dst is None:
+            raise IOError(f"Impossible d'écrire {dst_path} : {gdal.GetLastErrorMsg()}")
+        dst = None
+    finally:
+        gdal.SetThreadLocalConfigOption("GDAL_PAM_ENABLED", previous)
+        src = None
+
+
+def _remove(driver, path):
+    if os.path.exists(path):
+        if driver is None or driver.Delete(path) != gdal.CE_None:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
@@ -0,0 +1,147 @@
+"""
+Service de transformation de coordonnées partagé par les modules.
+- Un QgsCoordinateTransform par couple (SCR source, SCR cible), conservé
+  dans un cache LRU : plus de reconstruction à chaque clic ou aperçu
+- API par lots : des colonnes entières de coordonnées sont reprojetées en
+  un appel (boucle C++ de QgsLineString.transform), pas point par point
+- Cache vidé quand le contexte de transformation du projet change
+- Copie du contexte tenue à jour dans le thread GUI : les tâches de fond
+  n'accèdent jamais à QgsProject
+"""
+
+import threading
+from array import array
+from collections import OrderedDict
+
+from qgis.core import (
+    QgsCoordinateReferenceSystem, QgsCoordinateTransform,
+    QgsCoordinateTransformContext, QgsProject, QgsLineString, QgsPointXY
+)
+
+from . import crs_registry
+
+
+MAX_TRANSFORMS = 32      # couples de SCR gardés en cache
+BATCH_SIZE = 100000      # coordonnées transformées par appel
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+_context = None          # copie du contexte du projet (voir watch_project)
+
+
+def _as_crs(crs):
+    if isinstance(crs, QgsCoordinateReferenceSystem):
+        return crs
+    return crs_registry.get_crs(crs)
+
+
+def _key(crs):
+    if isinstance(crs, str):
+        return crs
+    return crs.authid() or crs.toWkt()
+
+
+def get_transform(src, dst):
+    """
+    Transformation src -> dst (QgsCoordinateReferenceSystem ou authid).
+    Retourne une copie légère (données partagées) de l'objet en cache,
+    utilisable depuis n'importe quel thread.
+    """
+    key = (_key(src), _key(dst))
+    with _lock:
+        ct = _cache.get(key)
+        if ct is not None:
+            _cache.move_to_end(key)
+            return QgsCoordinateTransform(ct)
+
+    with _lock:
+        context = _context
+    if context is None:
+        # Projet pas encore suivi (thread GUI uniquement, à l'initialisation)
+        context = QgsProject.instance().transformContext()
+    ct = QgsCoordinateTransform(_as_crs(src), _as_crs(dst), context)
+    with _lock:
+        _cache[key] = ct
+        _cache.move_to_end(key)
+        while len(_cache) > MAX_TRANSFORMS:
+            _cache.popitem(last=False)
+    return QgsCoordinateTransform(ct)
+
+
+def clear():
+    """Vide le cache (contexte de transformation modifié, déchargement)."""
+    with _lock:
+        _cache.clear()
+
+
+def _update_context(project):
+    """Recopie le contexte du projet (thread GUI) et vide le cache."""
+    global _context
+    context = QgsCoordinateTransformContext(project.transformContext())
+    with _lock:
+        _context = context
+        _cache.clear()
+
+
+def _on_context_changed():
+    _update_context(QgsProject.instance())
+
+
+def watch_project(project):
+    """Suit le contexte de transformation du projet : copie à jour, cache vidé."""
+    _update_context(project)
+    project.transformContextChanged.connect(_on_context_changed)
+
+
+def unwatch_project(project):
+    global _context
+    try:
+        project.transformContextChanged.disconnect(_on_context_changed)
+    except TypeError:
+        pass
+    with _lock:
+        _context = None
+    clear()
+
+
+def transform_point(point, src, dst):
+    """Reprojette un QgsPointXY."""
+    ct = get_transform(src, dst)
+    if ct.isShortCircuited():
+        return QgsPointXY(point)
+    return ct.transform(point)
+
+
+def transform_extent(rect, src, dst):
+    """Reprojette une emprise (QgsRectangle englobant le résultat)."""
+    ct = get_transform(src, dst)
+    if ct.isShortCircuited():
+        return rect
+    return ct.transformBoundingBox(rect)
+
+
+def transform_arrays(xs, ys, src, dst, progress=None, is_canceled=None):
+    """
+    Reprojette des colonnes de coordonnées en bloc.
+    Retourne deux array('d') (les colonnes d'entrée ne sont pas modifiées).
+
+    progress : callable(pourcentage) appelé après chaque lot
+    is_canceled : callable() -> bool ; si True, retourne None
+    """
+    ct = get_transform(src, dst)
+    if ct.isShortCircuited():
+        return array("d", xs), array("d", ys)
+
+    out_x, out_y = array("d"), array("d")
+    total = len(xs)
+    for start in range(0, total, BATCH_SIZE):
+        if is_canceled and is_canceled():
+            return None
+        stop = start + BATCH_SIZE
+        line = QgsLineString(list(xs[start:stop]), list(ys[start:stop]))
+        line.transform(ct)
+        out_x.extend(line.xVector())
+        out_y.extend(line.yVector())
+        if progress:
+            progress(100.0 * min(stop, total) / total)
+    return out_x, out_y